@@ -0,0 +1,415 @@
+# backtest.py
+import time
+import argparse
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from covariance import DenseCovariance, LowRankCovariance
+from optimizer import QP_SOLVER, _SOLVER_ERRORS, cp, optimize_capm_portfolio
+from preprocessing import calculate_log_returns
+from price_store import PRICE_DIR, STORE_DIR, get_price_store
+from rolling_capm import BETA, EXPECTED_RETURN, MARKET_VARIANCE, RESID_VAR, rolling_capm
+from tracing import span
+
+MARKET = "VNINDEX"
+ANNUALIZE = 252
+WINDOW = 252                # số phiên ước lượng β / Σ tại mỗi lần tái cân bằng
+REBALANCE = "W"             # tần suất pandas (W, M, Q...) hoặc số phiên
+MIN_PERIODS = 60
+COV_MODELS = ("single_index", "sample")
+# QP tham số hóa giải lại mỗi lần tái cân bằng: OSQP cập nhật dữ liệu tại chỗ và khởi động
+# từ nghiệm + nhân tử kỳ trước; CLARABEL (interior point) luôn giải lại từ đầu
+WARM_SOLVER = "OSQP" if cp is not None and "OSQP" in cp.installed_solvers() else QP_SOLVER
+
+
+# ===================== DATA =====================
+
+def load_panel(symbols, start=None, end=None, store=None, market=MARKET):
+    """
+    Đọc panel giá 1 lần từ price store (mã + VNINDEX), thay cho việc gọi lại
+    data_loader ở mỗi ngày tái cân bằng
+    """
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+    prices = store.frame([s for s in dict.fromkeys(symbols) if s != market] + [market], start, end)
+    if prices is None or market not in prices:
+        raise KeyError(f"Không có giá của {market}")
+    return prices
+
+
+def rebalance_rows(index, rebalance=REBALANCE, first=0):
+    """
+    Vị trí dòng tái cân bằng (giao dịch theo giá đóng cửa của dòng đó):
+        - số nguyên k : mỗi k phiên kể từ dòng first
+        - chuỗi tần suất (W, M, ...) : phiên cuối cùng của mỗi kỳ
+    Bỏ phiên cuối của dữ liệu (không còn lợi suất phía sau)
+    """
+    n = len(index)
+    if isinstance(rebalance, (int, np.integer)):
+        rows = np.arange(first, n, int(rebalance))
+    else:
+        periods = pd.DatetimeIndex(index).to_period(rebalance)
+        rows = np.r_[np.flatnonzero(periods[1:] != periods[:-1]), n - 1]
+        rows = rows[rows >= first]
+    return rows[rows < n - 1]
+
+
+# ===================== ROLLING Σ =====================
+
+class RollingCovariance:
+    """
+    Σ mẫu của `window` phiên gần nhất, cập nhật tăng dần giữa 2 lần tái cân bằng:
+    cộng các dòng mới vào, trừ các dòng rời cửa sổ (O(Δt · N²) thay vì O(window · N²))
+
+    Dời gốc về trung bình toàn mẫu để tổng không bị mất chính xác; NaN tính như 0
+    trong tổng nên Σ chỉ đúng cho các mã đủ dữ liệu cả cửa sổ (xem complete).
+    Cửa sổ bắt đầu từ dòng đầu tiên có dữ liệu (dòng 0 của log return luôn là NaN)
+    """
+
+    def __init__(self, returns, window=WINDOW):
+        X = np.asarray(returns, dtype=np.float64)
+        self.valid = ~np.isnan(X)
+        with np.errstate(invalid="ignore"):
+            shift = np.nan_to_num(np.nanmean(X, axis=0)) if len(X) else 0.0
+        self.X = np.where(self.valid, X - shift, 0.0)
+        self.window = window
+        has_data = self.valid.any(axis=1)
+        self.first = int(has_data.argmax()) if has_data.any() else len(X)
+
+        n = X.shape[1]
+        self.S = np.zeros(n)
+        self.Q = np.zeros((n, n))
+        self.count = np.zeros(n, dtype=np.int64)
+        self.start = 0
+        self.end = 0
+
+    def _add(self, r0, r1, sign):
+        if r1 <= r0:
+            return
+        block = self.X[r0:r1]
+        self.S += sign * block.sum(axis=0)
+        self.Q += sign * (block.T @ block)
+        self.count += sign * self.valid[r0:r1].sum(axis=0)
+
+    def advance(self, t):
+        """
+        Dời cửa sổ về các dòng (t - window, t], không trước dòng first
+        """
+        end = t + 1
+        start = min(max(self.first, end - self.window), end)
+        if start >= self.end:
+            # Không chồng lên cửa sổ cũ → tính lại từ đầu
+            self.S[:] = 0.0
+            self.Q[:] = 0.0
+            self.count[:] = 0
+            self._add(start, end, 1)
+        else:
+            self._add(self.end, end, 1)
+            self._add(self.start, start, -1)
+        self.start, self.end = start, end
+        return self
+
+    @property
+    def rows(self):
+        return self.end - self.start
+
+    def complete(self):
+        """
+        Mã không thiếu phiên nào trong cửa sổ (cần ít nhất 2 phiên để có Σ)
+        """
+        return (self.count == self.rows) & (self.rows > 1)
+
+    def cov(self, columns, annualize=ANNUALIZE):
+        n = self.rows
+        S = self.S[columns]
+        Q = self.Q[np.ix_(columns, columns)]
+        return (Q - np.outer(S, S) / n) / (n - 1) * annualize
+
+    def factors(self, annualize=ANNUALIZE):
+        """
+        F (N x window) với Σ = F Fᵀ (đúng với các mã complete): các dòng của cửa sổ
+        trừ trung bình, nhân √(annualize / (n - 1)); cửa sổ chưa đủ dòng thì phần còn lại = 0
+        """
+        n = self.rows
+        F = np.zeros((self.X.shape[1], self.window))
+        F[:, :n] = (self.X[self.start:self.end] - self.S / n).T * np.sqrt(annualize / (n - 1))
+        return F
+
+
+# ===================== SOLVER =====================
+
+class _FactorQP:
+    """
+    Max Sharpe long-only với Σ = F Fᵀ + diag(d²), dựng QP 1 lần (như _frontier_qp):
+        min ‖Fᵀy‖² + ‖d ∘ y‖²  s.t. (μ - rf)ᵀy = 1, y >= 0, y = 0 với mã bị loại
+        w = y / 1ᵀy
+        - single_index: F = β σ_M (N x 1), d = σ_ε
+        - sample      : F = RollingCovariance.factors() (N x window), d = 0
+    F, d, μ - rf, tập mã bị loại là cp.Parameter → mỗi lần tái cân bằng chỉ đổi giá trị
+    (không canonicalize lại); WARM_SOLVER khởi động từ nghiệm kỳ trước
+    """
+
+    def __init__(self, n, k, specific=True):
+        self.loadings = cp.Parameter((n, k))
+        self.specific = cp.Parameter(n, nonneg=True) if specific else None
+        self.excess = cp.Parameter(n)
+        self.excluded = cp.Parameter(n, nonneg=True)
+        self.y = cp.Variable(n)
+        risk = cp.sum_squares(self.loadings.T @ self.y)
+        if specific:
+            risk = risk + cp.sum_squares(cp.multiply(self.specific, self.y))
+        self.prob = cp.Problem(
+            cp.Minimize(risk),
+            [self.excess @ self.y == 1, self.y >= 0, cp.multiply(self.excluded, self.y) == 0]
+        )
+
+    def solve(self, excess, loadings, specific, eligible):
+        excess = np.where(eligible, excess, 0.0)
+        if not (excess > 0).any():
+            raise RuntimeError("Không có mã nào có lợi suất vượt rf")
+
+        self.loadings.value = np.where(eligible[:, None], loadings.reshape(len(excess), -1), 0.0)
+        if self.specific is not None:
+            self.specific.value = np.where(eligible, specific, 0.0)
+        self.excess.value = excess
+        self.excluded.value = (~eligible).astype(np.float64)
+
+        self.prob.solve(solver=WARM_SOLVER, warm_start=True)
+        if self.prob.status not in ("optimal", "optimal_inaccurate") or self.y.value is None:
+            raise RuntimeError(f"QP không hội tụ: {self.prob.status}")
+
+        w = np.where(eligible, np.clip(self.y.value, 0, None), 0.0)
+        if w.sum() <= 0:
+            raise RuntimeError("QP trả về danh mục rỗng")
+        stats = self.prob.solver_stats
+        return w / w.sum(), stats.num_iters if stats else None
+
+
+def _generic_solve(mu, cov, rf, eligible, x0, method):
+    """
+    optimize_capm_portfolio trên các mã được phép (khi không có cvxpy); x0 = tỷ trọng kỳ
+    trước chỉ có tác dụng khi optimize_capm_portfolio chọn SLSQP
+    """
+    cols = np.flatnonzero(eligible)
+    start = None
+    if x0 is not None and x0[cols].sum() > 0:
+        start = x0[cols] / x0[cols].sum()
+    w_cols, info = optimize_capm_portfolio(
+        pd.Series(mu[cols]), cov, rf, method=method, return_info=True, x0=start
+    )
+    w = np.zeros(len(mu))
+    w[cols] = w_cols.to_numpy()
+    return w, info["iterations"]
+
+
+# ===================== P&L =====================
+
+def _portfolio_pnl(log_returns, rows, weights, cost_bps):
+    """
+    Vector hóa trên toàn bộ giai đoạn (không lặp theo ngày):
+        - giữa 2 lần tái cân bằng tỷ trọng trôi theo giá (mua-và-giữ):
+          V_t = Σ w_i exp(C_t,i - C_r,i), C = log return cộng dồn
+        - turnover = Σ|w_mới - w_trôi| tại mỗi lần tái cân bằng (lần đầu: từ tiền mặt)
+        - phí = turnover · cost_bps, trừ vào phiên đầu tiên sau tái cân bằng
+    Trả về (lợi suất ngày từ dòng rows[0] + 1, turnover)
+    """
+    C = np.cumsum(np.nan_to_num(log_returns), axis=0)
+    T = len(C)
+
+    t = np.arange(rows[0] + 1, T)
+    seg = np.searchsorted(rows, t, side="left") - 1
+    base = rows[seg]
+
+    W = weights[seg]
+    V = (W * np.exp(C[t] - C[base])).sum(axis=1)
+    # Không nắm giữ gì (không có mã hợp lệ) → tiền mặt
+    V[W.sum(axis=1) == 0] = 1.0
+    prev = np.r_[1.0, V[:-1]]
+    prev[t - 1 == base] = 1.0
+    gross = V / prev
+
+    drift = weights[:-1] * np.exp(C[rows[1:]] - C[rows[:-1]])
+    total = drift.sum(axis=1, keepdims=True)
+    drift = np.divide(drift, total, out=np.zeros_like(drift), where=total > 0)
+    turnover = np.abs(weights - np.vstack([np.zeros((1, weights.shape[1])), drift])).sum(axis=1)
+
+    cost = np.zeros(len(t))
+    cost[rows - rows[0]] = turnover * cost_bps / 1e4
+    return gross * (1 - cost) - 1, turnover
+
+
+class BacktestResult(NamedTuple):
+    weights: pd.DataFrame       # tỷ trọng mục tiêu, dòng = ngày tái cân bằng
+    returns: pd.Series          # lợi suất ngày sau phí
+    equity: pd.Series           # giá trị danh mục (bắt đầu = 1)
+    drawdown: pd.Series         # equity / đỉnh trước đó - 1
+    turnover: pd.Series         # Σ|Δw| mỗi lần tái cân bằng
+    info: dict
+
+    def summary(self):
+        n = len(self.returns)
+        years = n / ANNUALIZE
+        annual_return = self.equity.iloc[-1] ** (1 / years) - 1 if n else float("nan")
+        annual_vol = self.returns.std() * np.sqrt(ANNUALIZE)
+        rf = self.info["rf"]
+        return {
+            "annual_return": annual_return,
+            "annual_vol": annual_vol,
+            "sharpe": (annual_return - rf) / annual_vol if annual_vol > 0 else 0.0,
+            "max_drawdown": float(self.drawdown.min()),
+            "turnover_per_year": self.turnover.sum() / years if years else float("nan"),
+            "rebalances": len(self.weights),
+            "skipped": self.info["skipped"],
+            "solve_time": self.info["solve_time"],
+        }
+
+
+# ===================== ENGINE =====================
+
+def walk_forward(
+    prices: pd.DataFrame,
+    rf: float,
+    market: str = MARKET,
+    window: int = WINDOW,
+    rebalance=REBALANCE,
+    cov_model: str = "single_index",
+    min_periods: int = MIN_PERIODS,
+    cost_bps: float = 0.0,
+    method: str = "auto"
+) -> BacktestResult:
+    """
+    Walk-forward backtest của danh mục Max Sharpe (CAPM, long-only):
+    tại mỗi ngày tái cân bằng chỉ dùng dữ liệu đến hết ngày đó
+        - β, E(Ri) = rf + β (E(Rm) - rf), phương sai phần dư: rolling_capm trên
+          `window` phiên (tổng chạy, O(N·T) cho cả giai đoạn)
+        - Σ theo cov_model:
+            "single_index": β βᵀ σ²(M) + diag(σ²(ε))
+            "sample"      : Σ mẫu của cửa sổ (chỉ mã đủ dữ liệu cả cửa sổ), dạng F Fᵀ
+                            với F là cửa sổ lợi suất đã trừ trung bình
+        - cả hai: _FactorQP dựng 1 lần, WARM_SOLVER (OSQP) khởi động từ nghiệm kỳ trước;
+          không có cvxpy → optimize_capm_portfolio (SLSQP bắt đầu từ tỷ trọng kỳ trước)
+        - không giải được → giữ tỷ trọng cũ
+    prices: panel giá (cột gồm market), vd load_panel(...)
+    """
+    if cov_model not in COV_MODELS:
+        raise ValueError(f"cov_model không hợp lệ: {cov_model}")
+
+    symbols = [c for c in prices.columns if c != market]
+    returns = calculate_log_returns(prices, dropna=False)
+    R = returns[symbols].to_numpy()
+    P = prices[symbols].to_numpy()
+    T, N = R.shape
+
+    info = {"rf": rf, "cov_model": cov_model, "skipped": 0, "iterations": [], "solve_time": 0.0}
+
+    with span("backtest", symbols=N, rows=T, cov_model=cov_model):
+        with span("backtest.moments"):
+            stats, market_stats = rolling_capm(
+                returns[symbols], returns[market], rf, window=window, min_periods=min_periods
+            )
+
+        rows = rebalance_rows(prices.index, rebalance, first=min_periods)
+        if not len(rows):
+            raise ValueError("Không đủ dữ liệu cho lần tái cân bằng nào")
+
+        weights = np.zeros((len(rows), N))
+        rolling = RollingCovariance(R, window) if cov_model == "sample" else None
+        qp = None
+        if cp is not None:
+            qp = _FactorQP(N, 1) if cov_model == "single_index" else _FactorQP(N, window, specific=False)
+
+        with span("backtest.optimize", rebalances=len(rows)):
+            prev = None
+            for k, t in enumerate(rows):
+                beta = stats[t, :, BETA]
+                mu = stats[t, :, EXPECTED_RETURN]
+                resid = stats[t, :, RESID_VAR]
+                eligible = ~np.isnan(P[t]) & np.isfinite(beta) & np.isfinite(mu) & np.isfinite(resid)
+                if rolling is not None:
+                    eligible &= rolling.advance(t).complete()
+
+                t0 = time.perf_counter()
+                try:
+                    if not eligible.any():
+                        raise RuntimeError("Không có mã nào đủ dữ liệu")
+                    if cov_model == "single_index":
+                        loadings = beta * np.sqrt(market_stats[t, MARKET_VARIANCE] * ANNUALIZE)
+                        specific = np.sqrt(np.clip(resid, 0, None) * ANNUALIZE)
+                        if qp is not None:
+                            w, iterations = qp.solve(mu - rf, loadings, specific, eligible)
+                        else:
+                            cols = np.flatnonzero(eligible)
+                            cov = LowRankCovariance(loadings[cols], specific[cols] ** 2)
+                            w, iterations = _generic_solve(mu, cov, rf, eligible, prev, method)
+                    elif qp is not None:
+                        w, iterations = qp.solve(mu - rf, rolling.factors(), None, eligible)
+                    else:
+                        cov = DenseCovariance(rolling.cov(np.flatnonzero(eligible)))
+                        w, iterations = _generic_solve(mu, cov, rf, eligible, prev, method)
+                except _SOLVER_ERRORS:
+                    # Giữ tỷ trọng kỳ trước (lần đầu: tiền mặt)
+                    w = np.zeros(N) if prev is None else prev
+                    iterations = None
+                    info["skipped"] += 1
+                info["solve_time"] += time.perf_counter() - t0
+                info["iterations"].append(iterations)
+
+                weights[k] = w
+                prev = w
+
+        with span("backtest.pnl"):
+            daily, turnover = _portfolio_pnl(R, rows, weights, cost_bps)
+
+    dates = prices.index
+    daily = pd.Series(daily, index=dates[rows[0] + 1:], name="return")
+    equity = (1 + daily).cumprod().rename("equity")
+    drawdown = (equity / np.maximum.accumulate(np.r_[1.0, equity.to_numpy()])[1:] - 1).rename("drawdown")
+
+    return BacktestResult(
+        weights=pd.DataFrame(weights, index=dates[rows], columns=symbols),
+        returns=daily,
+        equity=equity,
+        drawdown=drawdown,
+        turnover=pd.Series(turnover, index=dates[rows], name="turnover"),
+        info=info
+    )
+
+
+def run_backtest(symbols, rf, start=None, end=None, store=None, **kwargs) -> BacktestResult:
+    """
+    load_panel (1 lần đọc price store) + walk_forward
+    """
+    with span("backtest.load", symbols=len(symbols)):
+        prices = load_panel(symbols, start, end, store)
+    return walk_forward(prices, rf, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward backtest danh mục Max Sharpe (CAPM)")
+    parser.add_argument("symbols", help="danh sách mã, cách nhau bởi dấu phẩy")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--rf", type=float, default=0.04)
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--rebalance", default=REBALANCE, help="W, M, Q... hoặc số phiên")
+    parser.add_argument("--cov", default="single_index", choices=COV_MODELS)
+    parser.add_argument("--cost-bps", type=float, default=0.0)
+    args = parser.parse_args()
+
+    rebalance = int(args.rebalance) if args.rebalance.isdigit() else args.rebalance
+    t0 = time.perf_counter()
+    result = run_backtest(
+        [s.strip().upper() for s in args.symbols.split(",") if s.strip()],
+        args.rf,
+        start=args.start,
+        end=args.end,
+        window=args.window,
+        rebalance=rebalance,
+        cov_model=args.cov,
+        cost_bps=args.cost_bps
+    )
+    for key, value in result.summary().items():
+        print(f"{key:>18}: {value:.4f}" if isinstance(value, float) else f"{key:>18}: {value}")
+    print(f"{'tổng thời gian':>18}: {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,139 @@
+"""
+Benchmark / load-test trả lời hàng loạt (testengine.answer_many) với LLM giả lập local.
+
+    python benchmarks/bench_answer_many.py --latency 1.0 --concurrency 16
+    python benchmarks/bench_answer_many.py --http      # qua server HTTP giả (cần gói openai)
+
+Bộ câu hỏi: khuyến nghị cho mọi ngành + so sánh từng cặp trong watchlist (+ câu lặp lại).
+Mỗi lời gọi LLM giả ngủ `latency` giây, nên chạy tuần tự mất ~(số prompt) * latency.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import llm_cache  # noqa: E402
+import retriever  # noqa: E402
+import testgenerator  # noqa: E402
+import testengine  # noqa: E402
+
+WATCHLIST = ["FPT", "CMG", "VCB", "TCB", "HPG", "VNM"]
+
+
+def fake_reply(prompt):
+    return f"Trả lời giả cho prompt dài {len(prompt)} ký tự"
+
+
+class FakeAsyncClient:
+    """
+    Stand-in cho AsyncOpenAI: .chat.completions.create(...) ngủ `latency` giây
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        text = fake_reply(messages[-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def start_fake_server(latency):
+    """
+    Server OpenAI-compatible tối giản: POST /chat/completions
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            payload = json.dumps({
+                "id": "fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": fake_reply(body["messages"][-1]["content"])},
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_queries(repeat_pairs):
+    queries = [f"Cổ phiếu ngành {ind.lower()} nào đáng đầu tư?" for ind in retriever.ALL_INDUSTRIES]
+    pairs = [f"So sánh {a} với {b}" for a, b in itertools.combinations(WATCHLIST, 2)]
+    return queries + pairs * repeat_pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=None, help="lời gọi / giây")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--repeat-pairs", type=int, default=2)
+    parser.add_argument("--http", action="store_true")
+    args = parser.parse_args()
+
+    fake = None
+    if args.http:
+        server = start_fake_server(args.latency)
+        testgenerator.LLM_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+        os.environ.setdefault("GROQ_API_KEY", "fake")
+    else:
+        fake = FakeAsyncClient(args.latency)
+        testgenerator.set_async_client(fake)
+
+    llm_cache._cache = llm_cache.LLMCache()
+    queries = build_queries(args.repeat_pairs)
+
+    t0 = time.perf_counter()
+    results = sorted(
+        testengine.answer_many(queries, concurrency=args.concurrency, rate=args.rate, timeout=args.timeout)
+    )
+    wall = time.perf_counter() - t0
+
+    n_prompts = len({testengine.plan(q).prompt for q in queries} - {None})
+    errors = [r for r in results if r.error is not None]
+    latencies = sorted(r.elapsed for r in results)
+
+    print(f"{len(queries)} câu hỏi, {n_prompts} prompt khác nhau, {len(errors)} lỗi")
+    print(f"thời gian batch        : {wall:8.2f} s "
+          f"(tuần tự ước tính {n_prompts * args.latency:.1f} s)")
+    print(f"câu đầu / trung vị xong: {latencies[0]:8.2f} s / {latencies[len(latencies) // 2]:.2f} s")
+    if fake is not None:
+        print(f"lời gọi LLM            : {fake.calls} (đồng thời tối đa {fake.max_in_flight})")
+    print("cache:", llm_cache.get_cache().stats())
@@ -0,0 +1,102 @@
+"""
+Benchmark walk-forward backtest (backtest.run_backtest) so với vòng lặp ad-hoc cũ:
+mỗi ngày tái cân bằng đọc lại giá của cửa sổ, tính lại log return / beta / Σ từ đầu
+và tối ưu từ 1/n.
+
+    python benchmarks/bench_backtest.py --symbols 500 --years 5 --rebalance W --models single_index,sample --legacy 3
+
+Vòng lặp cũ chỉ chạy --legacy lần tái cân bằng đầu rồi nhân lên (ước tính).
+Panel giả lập (1 nhân tố thị trường + nhiễu riêng) ghi ra price store tạm bằng write_price_store.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_store import write_price_store, load_price_store  # noqa: E402
+from preprocessing import (  # noqa: E402
+    calculate_log_returns,
+    estimate_betas,
+    estimate_market_parameters,
+    capm_expected_returns
+)
+from covariance import sample_covariance_operator  # noqa: E402
+from optimizer import optimize_capm_portfolio  # noqa: E402
+from backtest import COV_MODELS, WINDOW, MIN_PERIODS, load_panel, rebalance_rows, run_backtest  # noqa: E402
+
+RF = 0.04
+
+
+def synthetic_store(store_dir, n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2019-01-01", periods=n_days).values.astype("datetime64[ns]").view(np.int64)
+    market = rng.normal(0.0004, 0.011, n_days)
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    alpha = rng.normal(0, 0.0003, n_symbols)
+    noise = rng.normal(0, 0.015, (n_days, n_symbols))
+    close = 20 * np.exp(np.cumsum(np.column_stack([alpha + market[:, None] * beta + noise, market]), axis=0))
+    symbols = [f"S{i:04d}" for i in range(n_symbols)] + ["VNINDEX"]
+    write_price_store(dates, symbols, close, store_dir)
+    return load_price_store(store_dir), symbols[:-1]
+
+
+def legacy_loop(store, symbols, rebalance, limit):
+    """
+    Cách làm cũ: mỗi ngày tái cân bằng gọi lại toàn bộ pipeline của app trên cửa sổ
+    """
+    dates = load_panel(symbols, store=store).index
+    rows = rebalance_rows(dates, rebalance, first=MIN_PERIODS)[:limit]
+    for t in rows:
+        start, end = dates[max(0, t - WINDOW)], dates[t]
+        prices = store.frame(symbols, start, end)
+        market = store.frame(["VNINDEX"], start, end)
+        stock = calculate_log_returns(prices)
+        rm = calculate_log_returns(market)["VNINDEX"]
+        data = stock.join(rm, how="inner")
+        betas = estimate_betas(data[symbols], data["VNINDEX"])
+        expected_rm, _ = estimate_market_parameters(data["VNINDEX"])
+        mu = capm_expected_returns(betas, expected_rm, RF)
+        optimize_capm_portfolio(mu, sample_covariance_operator(data[symbols]), RF)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--rebalance", default="W")
+    parser.add_argument("--models", default="single_index,sample")
+    parser.add_argument("--legacy", type=int, default=3, help="số lần tái cân bằng chạy bằng vòng lặp cũ (0 = bỏ qua)")
+    args = parser.parse_args()
+
+    n_days = args.years * 252
+    rebalance = int(args.rebalance) if args.rebalance.isdigit() else args.rebalance
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store, symbols = synthetic_store(tmp, args.symbols, n_days)
+        total = len(rebalance_rows(load_panel(symbols, store=store).index, rebalance, first=MIN_PERIODS))
+        print(f"{args.symbols} mã x {n_days} phiên, tái cân bằng {args.rebalance}: {total} lần\n")
+
+        print(f"{'cách':>22} {'giây':>8} {'giải s':>8} {'vòng TB':>8} {'Sharpe':>7} {'MDD':>7} {'turnover/năm':>13} {'bỏ qua':>7}")
+        for model in args.models.split(","):
+            if model not in COV_MODELS:
+                raise SystemExit(f"cov_model không hợp lệ: {model}")
+            t0 = time.perf_counter()
+            result = run_backtest(symbols, RF, store=store, rebalance=rebalance, cov_model=model, cost_bps=10)
+            seconds = time.perf_counter() - t0
+            s = result.summary()
+            iters = [i for i in result.info["iterations"] if i is not None]
+            print(f"{model:>22} {seconds:>8.2f} {s['solve_time']:>8.2f} {np.mean(iters):>8.1f} "
+                  f"{s['sharpe']:>7.2f} {s['max_drawdown']:>7.2%} {s['turnover_per_year']:>13.2f} {s['skipped']:>7}")
+
+        if args.legacy:
+            t0 = time.perf_counter()
+            done = legacy_loop(store, symbols, rebalance, args.legacy)
+            per = (time.perf_counter() - t0) / done
+            print(f"{'vòng lặp cũ (ước tính)':>22} {per * total:>8.1f}   ({per:.2f} s / lần x {total})")
@@ -0,0 +1,68 @@
+"""
+Benchmark ước lượng beta: vòng lặp LinearRegression (cũ) vs closed-form vector hóa.
+
+    python benchmarks/bench_betas.py --days 1000
+
+Độ khớp với LinearRegression (kể cả cột có NaN) được kiểm tra trong tests/test_preprocessing.py
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import estimate_betas  # noqa: E402
+
+
+def legacy_betas(stock_returns, market_returns):
+    """
+    Bản cũ: 1 LinearRegression cho mỗi mã
+    """
+    betas = {}
+    X = market_returns.values.reshape(-1, 1)
+    for symbol in stock_returns.columns:
+        model = LinearRegression()
+        model.fit(X, stock_returns[symbol].values)
+        betas[symbol] = model.coef_[0]
+    return pd.Series(betas)
+
+
+def synthetic_returns(n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2015-01-01", periods=n_days)
+    market = pd.Series(rng.normal(0.0004, 0.012, n_days), index=index, name="VNINDEX")
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    noise = rng.normal(0, 0.015, (n_days, n_symbols))
+    returns = market.values[:, None] * beta + noise
+    cols = [f"S{i:04d}" for i in range(n_symbols)]
+    return pd.DataFrame(returns, index=index, columns=cols), market
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--sizes", default="10,100,500,2000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'N':>6} {'loop (s)':>10} {'vector (s)':>11} {'speedup':>9} {'max |Δβ|':>11}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        R, Rm = synthetic_returns(n, args.days)
+        t_old, b_old = timeit(lambda: legacy_betas(R, Rm), 1)
+        t_new, b_new = timeit(lambda: estimate_betas(R, Rm), args.repeat)
+        diff = np.max(np.abs(b_old.values - b_new.values))
+        print(f"{n:>6} {t_old:>10.4f} {t_new:>11.4f} {t_old / t_new:>8.1f}x {diff:>11.2e}")
@@ -0,0 +1,299 @@
+"""
+Benchmark pipeline CAPM của app theo kích thước rổ: moments_cache.compute_moments
+(tải giá → log return → beta → Σ, đúng hàm nút "Tối ưu danh mục" gọi khi cache trượt)
+rồi capm_expected_returns → optimize_capm_portfolio
+
+    python benchmarks/bench_capm_pipeline.py                          # lưới đầy đủ + dữ liệu thật
+    python benchmarks/bench_capm_pipeline.py --symbols 10,100 --days 250,1000
+    python benchmarks/bench_capm_pipeline.py --save-baseline          # ghi kết quả làm baseline
+    python benchmarks/bench_capm_pipeline.py --baseline benchmarks/baseline_capm_pipeline.json
+
+Panel giá giả lập (1 nhân tố thị trường + nhiễu riêng) được ghi ra price store tạm
+bằng write_price_store, nên bước load đi qua đúng đường đọc memmap của app.
+Thời gian từng bước bên trong compute_moments lấy từ các span capm.* của nó (tracing,
+giữ trong bộ nhớ), "moments" là cả lần gọi; tốt nhất trong --repeat lần. Bộ nhớ cấp phát
+đỉnh (tracemalloc) đo riêng 1 lần cho moments và optimize để không làm sai số đo thời gian.
+Kết quả ghi ra JSON (--out, mặc định trong benchmarks/, đã gitignore); so với baseline
+commit sẵn: bước nào chậm hơn quá --tolerance (và quá ngưỡng nhiễu --min-ms) là regression
+→ exit code 1; thiếu file baseline → exit code 2.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import itertools
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import data_loader  # noqa: E402
+from price_store import PRICE_DIR, STORE_DIR, write_price_store  # noqa: E402
+import tracing  # noqa: E402
+from preprocessing import capm_expected_returns  # noqa: E402
+from moments_cache import compute_moments  # noqa: E402
+from optimizer import optimize_capm_portfolio  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline_capm_pipeline.json")
+DEFAULT_OUT = os.path.join(ROOT, "benchmarks", "capm_pipeline_results.json")
+# 4 bước đầu là span capm.* bên trong compute_moments, "moments" là cả lần gọi
+STAGES = ["load", "log_returns", "betas", "cov", "moments", "optimize"]
+RF = 0.04
+START = "2000-01-01"
+
+
+# ===================== DATA =====================
+
+def synthetic_panel(n_symbols, n_days, seed=0):
+    """
+    Giá đóng cửa T x N (+ VNINDEX): log return = β·thị trường + nhiễu riêng
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-01", periods=n_days + 1)
+    market = rng.normal(0.0003, 0.011, n_days + 1)
+    # Cố định trung bình mẫu → E(Rm) > rf ở mọi (N, T), optimizer luôn đi nhánh QP
+    # (không thì có case mọi μ < rf, rơi về SLSQP và đo 1 đường khác hẳn)
+    market += 0.0003 - market.mean()
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    noise = rng.normal(0, 0.015, (n_days + 1, n_symbols))
+    log_ret = np.column_stack([market[:, None] * beta + noise, market])
+    log_ret[0] = 0.0
+    close = 20 * np.exp(np.cumsum(log_ret, axis=0))
+    symbols = [f"S{i:04d}" for i in range(n_symbols)] + ["VNINDEX"]
+    return dates.values.astype("datetime64[ns]").view(np.int64), symbols, close
+
+
+class StoreContext:
+    """
+    Trỏ data_loader sang 1 price store khác trong khối with
+    """
+
+    def __init__(self, price_dir, store_dir):
+        self.dirs = (price_dir, store_dir)
+
+    def __enter__(self):
+        self.saved = (data_loader.PRICE_DIR, data_loader.STORE_DIR)
+        data_loader.PRICE_DIR, data_loader.STORE_DIR = self.dirs
+        return self
+
+    def __exit__(self, *exc):
+        data_loader.PRICE_DIR, data_loader.STORE_DIR = self.saved
+        return False
+
+
+class SpanCollector:
+    """
+    Bật tracing trong khối with, span giữ trong bộ nhớ thay vì ghi file JSONL
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record, flush=False):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+    def __enter__(self):
+        self.saved = (tracing._exporter, tracing.is_enabled())
+        tracing._exporter = self
+        tracing.enable()
+        return self
+
+    def __exit__(self, *exc):
+        tracing._exporter, enabled = self.saved
+        if not enabled:
+            tracing.disable()
+        return False
+
+    def seconds(self, prefix):
+        return {r["name"][len(prefix):]: r["ms"] / 1e3 for r in self.records if r["name"].startswith(prefix)}
+
+
+# ===================== PIPELINE =====================
+
+def optimize(moments):
+    """
+    Phần của nút "Tối ưu danh mục" sau bước mômen (phụ thuộc rf)
+    """
+    mu = capm_expected_returns(betas=moments.betas, expected_rm=moments.expected_rm, rf=RF)
+    return optimize_capm_portfolio(expected_returns=mu, cov=moments.cov, rf=RF)
+
+
+def run_case(symbols, repeat):
+    """
+    Trả về {bước: (giây tốt nhất, MB cấp phát đỉnh hoặc None)}, số phiên
+    """
+    seconds = dict.fromkeys(STAGES, float("inf"))
+
+    for _ in range(repeat):
+        with SpanCollector() as spans:
+            t0 = time.perf_counter()
+            moments = compute_moments(symbols, START)
+            t1 = time.perf_counter()
+            optimize(moments)
+            t2 = time.perf_counter()
+        run = spans.seconds("capm.")
+        run.update(moments=t1 - t0, optimize=t2 - t1)
+        for stage in STAGES:
+            seconds[stage] = min(seconds[stage], run[stage])
+
+    peak = dict.fromkeys(STAGES)
+    tracemalloc.start()
+    try:
+        moments = compute_moments(symbols, START)
+        peak["moments"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        optimize(moments)
+        peak["optimize"] = (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+    return {name: (seconds[name], peak[name]) for name in STAGES}, len(moments.stock_returns)
+
+
+def run_synthetic(n_symbols, n_days, repeat):
+    dates, symbols, close = synthetic_panel(n_symbols, n_days)
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, "_store")
+        write_price_store(dates, symbols, close, store_dir)
+        # price_dir rỗng → get_price_store dùng thẳng store vừa ghi, không ingest CSV
+        with StoreContext(tmp, store_dir):
+            data_loader.get_price_store(tmp, store_dir)
+            return run_case(symbols[:-1], repeat)
+
+
+def run_real(repeat):
+    with StoreContext(PRICE_DIR, STORE_DIR):
+        store = data_loader.get_price_store(PRICE_DIR, STORE_DIR)
+        symbols = [s for s in store.symbols if s != "VNINDEX"]
+        if "VNINDEX" not in store or len(symbols) < 2:
+            return None, symbols, 0
+        timings, n_obs = run_case(symbols, repeat)
+        return timings, symbols, n_obs
+
+
+# ===================== BASELINE =====================
+
+def case_key(row):
+    return f"{row['case']}/{row['stage']}"
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """
+    Danh sách bước chậm hơn baseline: (khóa, giây baseline, giây hiện tại)
+    """
+    base = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None:
+            continue
+        slower = r["seconds"] - b["seconds"]
+        if r["seconds"] > b["seconds"] * (1 + tolerance) and slower * 1e3 > min_ms:
+            regressions.append((case_key(r), b["seconds"], r["seconds"]))
+    return regressions
+
+
+def environment():
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", default="10,100,500,2000")
+    parser.add_argument("--days", default="250,1000,5000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-real", action="store_true", help="bỏ qua dữ liệu thật trong price_offline")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="ghi kết quả lần này vào --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="cho phép chậm hơn baseline (0.25 = 25%%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="bỏ qua chênh lệch nhỏ hơn (ms)")
+    args = parser.parse_args()
+
+    cases = []
+    for n_symbols, n_days in itertools.product(
+        [int(x) for x in args.symbols.split(",")],
+        [int(x) for x in args.days.split(",")]
+    ):
+        cases.append((f"synthetic_{n_symbols}x{n_days}", n_symbols, n_days))
+
+    results = []
+
+    def record(case, n_symbols, n_days, timings):
+        total = timings["moments"][0] + timings["optimize"][0]
+        print(f"{case:<24} {n_symbols:>6} {n_days:>6} "
+              + " ".join(f"{timings[s][0] * 1e3:>{max(10, len(s))}.1f}" for s in STAGES)
+              + f" {total * 1e3:>10.1f}  peak {max(m for _, m in timings.values() if m is not None):>8.1f} MB")
+        for stage in STAGES:
+            seconds, peak_mb = timings[stage]
+            results.append({
+                "case": case, "n_symbols": n_symbols, "n_days": n_days,
+                "stage": stage, "seconds": seconds, "peak_mb": peak_mb,
+            })
+
+    print(f"{'case':<24} {'N':>6} {'T':>6} " + " ".join(f"{s:>{max(10, len(s))}}" for s in STAGES)
+          + f" {'total':>10}   (ms)")
+
+    for case, n_symbols, n_days in cases:
+        timings, n_obs = run_synthetic(n_symbols, n_days, args.repeat)
+        record(case, n_symbols, n_obs, timings)
+
+    if not args.no_real:
+        timings, symbols, n_obs = run_real(args.repeat)
+        if timings is None:
+            print("price_offline: không đủ dữ liệu (cần VNINDEX + ít nhất 2 mã)")
+        else:
+            record("price_offline", len(symbols), n_obs, timings)
+
+    payload = {"environment": environment(), "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\nĐã ghi {len(results)} kết quả → {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        print(f"Đã lưu baseline → {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\n❌ KHÔNG TÌM THẤY BASELINE: {args.baseline}\n"
+              f"   Không kiểm tra được regression. Chạy lại với --save-baseline để tạo.", file=sys.stderr)
+        sys.exit(2)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_ms)
+    known = {case_key(r) for r in baseline["results"]}
+    missing = sorted({r["case"] for r in results if case_key(r) not in known})
+    if missing:
+        print(f"⚠️ Baseline không có {len(missing)} case (không so sánh): {', '.join(missing)}")
+
+    print(f"So với baseline {baseline['environment'].get('timestamp')}: ", end="")
+    if not regressions:
+        print("không có bước nào chậm hơn")
+        sys.exit(0)
+
+    print(f"{len(regressions)} bước chậm hơn quá {args.tolerance:.0%}:")
+    for key, old, new in regressions:
+        print(f"  ❌ {key}: {old * 1e3:.1f} ms → {new * 1e3:.1f} ms ({new / old:.2f}x)")
+    sys.exit(1)
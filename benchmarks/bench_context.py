@@ -0,0 +1,79 @@
+"""
+Benchmark dựng context cho prompt: inline() bằng iterrows (cũ) vs định dạng theo cột,
+và kích thước prompt (token ước lượng) theo intent.
+
+    python benchmarks/bench_context.py --rows 200 --repeat 20
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retriever  # noqa: E402
+import testengine  # noqa: E402
+from testgenerator import fcap, inline, estimate_tokens, context_stats  # noqa: E402
+
+FIELDS = ["Score", "ROA", "DE", "PB", "BV", "EPS", "Market_Cap"]
+
+QUERIES = [
+    "Cổ phiếu ngân hàng nào đáng để đầu tư?",
+    "So sánh FPT với CMG",
+    "Top 10 cổ phiếu vốn hóa cao nhất ngành kim loại",
+    "Top 5 ngành ngân hàng theo ROA",
+    "Phân tích báo cáo tài chính FPT",
+]
+
+
+def fnum(x, nd=3):
+    return f"{x:.{nd}f}"
+
+
+def legacy_inline(df, fields):
+    rows = []
+    for _, r in df.iterrows():
+        parts = [r["ticker"]]
+        for f in fields:
+            if f in r:
+                if f in ["Market_Cap", "BV"]:
+                    parts.append(f"{f} {fcap(r[f])}")
+                else:
+                    parts.append(f"{f} {fnum(r[f])}")
+        rows.append(" (" + ", ".join(parts) + ")")
+    return " và ".join(rows)
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = retriever.df.head(args.rows)
+    t_old, a = timeit(lambda: legacy_inline(df, FIELDS), args.repeat)
+    t_new, b = timeit(lambda: inline(df, FIELDS), args.repeat)
+    print(f"inline {len(df)} dòng x {len(FIELDS)} cột: iterrows {t_old * 1e3:.2f} ms, "
+          f"theo cột {t_new * 1e3:.2f} ms ({t_old / t_new:.1f}x), giống hệt: {a == b}")
+
+    print(f"\n{'intent':<22} {'token':>6}  câu hỏi")
+    for q in QUERIES:
+        p = testengine.plan(q)
+        print(f"{p.intent:<22} {p.tokens:>6}  {q}")
+
+    fin = retriever.get_latest_financials("FPT")
+    if fin:
+        print(f"\nBCTC FPT dạng str(dict) cũ: {estimate_tokens(str(fin))} token "
+              f"(pandas cắt bớt cột khi in, phần lớn số liệu không vào prompt)")
+
+    print("\ncontext_stats:", context_stats.summary())
@@ -0,0 +1,83 @@
+"""
+Benchmark các estimator hiệp phương sai (covariance.COVARIANCE_ESTIMATORS):
+thời gian ước lượng, số điều kiện, hệ số shrinkage, và số vòng / thời gian của
+optimize_capm_portfolio (SLSQP long-only) với Σ tương ứng.
+
+    python benchmarks/bench_covariance.py --days 250 --sizes 20,50,100,200,240
+
+Return giả lập theo 1 nhân tố thị trường + nhiễu riêng; N tiến gần T thì Σ mẫu
+gần suy biến. Cột oos_vol: độ lệch chuẩn năm của danh mục trên 1 đoạn dữ liệu mới
+cùng phân phối (thấp hơn = Σ ước lượng tốt hơn cho mục đích phân bổ).
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from covariance import COVARIANCE_ESTIMATORS, estimate_covariance  # noqa: E402
+from optimizer import optimize_capm_portfolio  # noqa: E402
+
+RF = 0.04
+
+
+def synthetic_returns(n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    specific = rng.uniform(0.01, 0.03, n_symbols)
+
+    def draw(days):
+        market = rng.normal(0.0004, 0.012, days)
+        noise = rng.normal(0, 1, (days, n_symbols)) * specific
+        index = pd.bdate_range("2015-01-01", periods=days)
+        cols = [f"S{i:04d}" for i in range(n_symbols)]
+        return pd.DataFrame(market[:, None] * beta + noise, index=index, columns=cols), pd.Series(market, index=index)
+
+    train, market = draw(n_days)
+    test, _ = draw(n_days)
+    return train, market, test, beta
+
+
+def run(n_symbols, n_days, method):
+    train, market, test, beta = synthetic_returns(n_symbols, n_days)
+    # μ theo CAPM như trong app (không phụ thuộc estimator Σ)
+    mu = pd.Series(RF + beta * (market.mean() * 365 - RF), index=train.columns)
+
+    cov, info = estimate_covariance(train, method, market, return_info=True)
+
+    t0 = time.perf_counter()
+    try:
+        w, opt = optimize_capm_portfolio(mu, cov, RF, method="slsqp", return_info=True)
+        iters = opt["iterations"]
+        oos_vol = float(np.std(test.to_numpy() @ w.to_numpy(), ddof=1) * np.sqrt(252))
+        note = ""
+    except RuntimeError as e:
+        iters, oos_vol, note = None, None, f"lỗi: {str(e)[:40]}"
+    solve = time.perf_counter() - t0
+
+    return info, iters, solve, oos_vol, note
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--sizes", default="20,50,100,200,240")
+    parser.add_argument("--methods", default=",".join(COVARIANCE_ESTIMATORS))
+    args = parser.parse_args()
+
+    print(f"T = {args.days} phiên\n")
+    print(f"{'N':>5} {'estimator':>21} {'ước lượng ms':>13} {'cond':>12} {'δ':>6} "
+          f"{'vòng':>5} {'giải s':>8} {'oos_vol':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        for method in args.methods.split(","):
+            info, iters, solve, oos_vol, note = run(n, args.days, method)
+            shrink = f"{info['shrinkage']:6.3f}" if info["shrinkage"] is not None else f"{'-':>6}"
+            iters_s = f"{iters:5d}" if iters is not None else f"{'-':>5}"
+            vol_s = f"{oos_vol:8.4f}" if oos_vol is not None else f"{'-':>8}"
+            print(f"{n:>5} {method:>21} {info['estimate_time'] * 1e3:>13.2f} {info['condition']:>12.3g} "
+                  f"{shrink} {iters_s} {solve:>8.3f} {vol_s}  {note}")
+        print()
@@ -0,0 +1,108 @@
+"""
+Benchmark tải giá online song song (data_loader1) với nguồn giả lập local.
+
+    python benchmarks/bench_fetch.py --symbols 100 --latency 0.5
+
+Mỗi lần gọi .history() của stand-in ngủ `latency` giây (giả lập 1 round-trip),
+nên tải N mã tuần tự mất ~N * latency, còn bản song song ~ceil(N / workers) round-trip
+(mặc định workers = data_loader1.MAX_WORKERS, 100 mã → 1 round-trip).
+Phần ghi CSV / dựng frame chạy trên CPU và không chồng lên nhau khi máy ít lõi,
+nên số round-trip của lần tải cold trừ đi thời gian cùng lần tải với latency 0 ("local").
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader1  # noqa: E402
+
+
+class FakeQuote:
+    """
+    Stand-in cho vnstock.Quote: trả về giá ngẫu nhiên theo ngày làm việc
+    """
+
+    calls = 0
+
+    def __init__(self, symbol, latency):
+        self.symbol = symbol
+        self.latency = latency
+
+    def history(self, start, end, interval="d"):
+        FakeQuote.calls += 1
+        time.sleep(self.latency)
+
+        days = pd.bdate_range(start, end)
+        rng = np.random.default_rng(abs(hash(self.symbol)) % (2 ** 32))
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        return pd.DataFrame({"time": days, "close": close.round(2)})
+
+
+def run(n_symbols, latency, workers):
+    symbols = [f"S{i:03d}" for i in range(n_symbols)]
+    data_loader1.set_quote_factory(lambda sym: FakeQuote(sym, latency))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Chi phí local (không chờ mạng) của 1 lần tải cold song song
+        data_loader1.set_quote_factory(lambda sym: FakeQuote(sym, 0.0))
+        t0 = time.perf_counter()
+        data_loader1.download_multiple_prices(
+            symbols, start="2023-01-01", end="2024-12-31",
+            cache_dir=cache_dir, max_workers=workers
+        )
+        local = time.perf_counter() - t0
+        data_loader1.set_quote_factory(lambda sym: FakeQuote(sym, latency))
+
+        rows = []
+        for label, w in [("tuần tự", 1), ("song song", workers)]:
+            for d in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, d))
+            FakeQuote.calls = 0
+            t0 = time.perf_counter()
+            prices = data_loader1.download_multiple_prices(
+                symbols, start="2023-01-01", end="2024-12-31",
+                cache_dir=cache_dir, max_workers=w
+            )
+            rows.append((label + " (cold)", time.perf_counter() - t0, FakeQuote.calls, prices.shape))
+
+        # Gọi lại cùng rổ: phải trả về từ cache trên đĩa, không gọi mạng
+        FakeQuote.calls = 0
+        t0 = time.perf_counter()
+        prices = data_loader1.download_multiple_prices(
+            symbols, start="2023-01-01", end="2024-12-31",
+            cache_dir=cache_dir, max_workers=workers
+        )
+        rows.append(("song song (warm)", time.perf_counter() - t0, FakeQuote.calls, prices.shape))
+
+        # Mở rộng end: chỉ tải phần thiếu sau bar cuối
+        FakeQuote.calls = 0
+        t0 = time.perf_counter()
+        prices = data_loader1.download_multiple_prices(
+            symbols, start="2023-01-01", end="2025-03-31",
+            cache_dir=cache_dir, max_workers=workers
+        )
+        rows.append(("song song (incremental)", time.perf_counter() - t0, FakeQuote.calls, prices.shape))
+
+    data_loader1.set_quote_factory(None)
+
+    print(f"{n_symbols} mã, latency {latency * 1000:.0f} ms / round-trip, {workers} workers, local {local:.3f} s")
+    for label, sec, calls, shape in rows:
+        # round-trip chỉ tính cho lần tải cold (local đo trên đúng lần tải đó)
+        trips = f"{max(sec - local, 0.0) / latency:5.1f} round-trip" if "cold" in label else " " * 16
+        print(f"  {label:<26} {sec:8.3f} s  {trips}   {calls:4d} lần gọi   shape={shape}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=data_loader1.MAX_WORKERS)
+    args = parser.parse_args()
+
+    run(args.symbols, args.latency, args.workers)
@@ -0,0 +1,84 @@
+"""
+Benchmark cold start của chatbot: thời gian `import testengine` (python -X importtime)
+và thời gian lần truy vấn dữ liệu đầu tiên (đọc CSV xếp hạng + dựng chỉ mục).
+
+    python benchmarks/bench_import.py --repeat 5 --top 10
+
+Mỗi lần đo chạy 1 process Python mới để không dính cache của sys.modules.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_QUERY = """
+import time
+t0 = time.perf_counter()
+import testengine
+t1 = time.perf_counter()
+testengine.extract_industry("top ngân hàng")
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Dòng `import time: self | cumulative | module` → {module: (self_us, cumulative_us)}
+    """
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        out[name.strip()] = (int(self_us), int(cum_us))
+    return out
+
+
+def run_importtime(module):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return parse_importtime(proc.stderr)
+
+
+def run_first_query():
+    proc = subprocess.run(
+        [sys.executable, "-c", FIRST_QUERY],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    t_import, t_query = map(float, proc.stdout.split())
+    return t_import, t_query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="testengine")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [run_importtime(args.module) for _ in range(args.repeat)]
+    totals = [r[args.module][1] / 1e3 for r in runs]
+    print(f"import {args.module}: median {statistics.median(totals):.1f} ms "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}, {args.repeat} lần)")
+
+    # Module tốn nhiều nhất (self time, lần chạy cuối)
+    print(f"\n{'self (ms)':>10} {'cum (ms)':>10}  module")
+    worst = sorted(runs[-1].items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]
+    for name, (self_us, cum_us) in worst:
+        print(f"{self_us / 1e3:>10.1f} {cum_us / 1e3:>10.1f}  {name}")
+
+    if args.module == "testengine":
+        firsts = [run_first_query() for _ in range(args.repeat)]
+        print(f"\nimport + truy vấn đầu (nạp CSV + chỉ mục): "
+              f"{statistics.median(t for t, _ in firsts) * 1e3:.1f} ms + "
+              f"{statistics.median(q for _, q in firsts) * 1e3:.1f} ms")
@@ -0,0 +1,86 @@
+"""
+Benchmark cache câu trả lời LLM với stub local thay cho endpoint Groq.
+
+    python benchmarks/bench_llm_cache.py --latency 1.5 --repeat 20
+
+Stub ngủ `latency` giây mỗi lần gọi (giả lập 1 chat completion), nên câu hỏi
+lặp lại chỉ tốn chi phí dựng context + tra cache.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_cache  # noqa: E402
+import testgenerator  # noqa: E402
+import testengine  # noqa: E402
+
+
+class StubClient:
+    """
+    Stand-in cho OpenAI client: .chat.completions.create(...) trả về prompt rút gọn
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = f"[{model}] {messages[-1]['content'][:80]}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+QUERIES = [
+    "top 5 ngân hàng theo ROA",
+    "top 3 ngân hàng theo vốn hóa",
+    "nên đầu tư cổ phiếu ngành ngân hàng nào",
+    "so sánh FPT với CMG",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--disk", action="store_true", help="bật tầng SQLite")
+    args = parser.parse_args()
+
+    stub = StubClient(args.latency)
+    testgenerator.set_client(stub)
+
+    db = os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite") if args.disk else None
+    llm_cache._cache = llm_cache.LLMCache(db_path=db)
+
+    t0 = time.perf_counter()
+    for q in QUERIES:
+        testengine.answer(q)
+    t_cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for q in QUERIES:
+            testengine.answer(q)
+    t_warm = (time.perf_counter() - t0) / args.repeat
+
+    print(f"lần đầu (gọi LLM)      : {t_cold * 1e3:8.1f} ms / {len(QUERIES)} câu")
+    print(f"lặp lại (cache)        : {t_warm * 1e3:8.1f} ms / {len(QUERIES)} câu")
+    print(f"số lần gọi endpoint    : {stub.calls}")
+    print("cache:", llm_cache.get_cache().stats())
+
+    if db:
+        # Cache mới (như process mới): LRU rỗng, đọc từ SQLite
+        llm_cache._cache = llm_cache.LLMCache(db_path=db)
+        t0 = time.perf_counter()
+        for q in QUERIES:
+            testengine.answer(q)
+        t_disk = time.perf_counter() - t0
+        print(f"đọc lại từ SQLite      : {t_disk * 1e3:8.1f} ms / {len(QUERIES)} câu")
+        print("cache:", llm_cache.get_cache().stats())
@@ -0,0 +1,93 @@
+"""
+Benchmark monte_carlo.simulate_portfolio: số kịch bản / giây theo số worker và
+cách mô phỏng, bộ nhớ đỉnh của process chính (tracemalloc), và sai số VaR / CVaR
+của histogram sketch so với tính chính xác trên toàn bộ kịch bản (1 batch lớn).
+
+    python benchmarks/bench_monte_carlo.py --symbols 50 --paths 1000000 --workers 1,2,4
+
+Cùng seed → cùng kết quả với mọi số worker (seed theo batch), cột "= w1" kiểm tra điều đó.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from covariance import sample_covariance_operator  # noqa: E402
+from monte_carlo import LEVELS, PERIODS_PER_YEAR, _sampling_factors, _simulate_batch, simulate_portfolio  # noqa: E402
+
+
+def synthetic_inputs(n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    market = rng.normal(0.0004, 0.012, n_days)
+    returns = pd.DataFrame(market[:, None] * beta + rng.normal(0, 0.015, (n_days, n_symbols)))
+    weights = rng.dirichlet(np.ones(n_symbols))
+    mu = 0.04 + beta * 0.06
+    return weights, mu, sample_covariance_operator(returns), returns
+
+
+def exact(weights, mu, cov, n_paths, horizon, seed=0):
+    """
+    VaR / CVaR giữ toàn bộ kịch bản trong bộ nhớ (tham chiếu)
+    """
+    G, d_sqrt = _sampling_factors(cov)
+    scale = 1.0 / np.sqrt(PERIODS_PER_YEAR)
+    arrays = {"weights": weights, "mu": mu / PERIODS_PER_YEAR, "factors": G * scale, "specific_sqrt": d_sqrt * scale}
+    # Cùng cây seed với simulate_portfolio(seed=seed, batch_paths=n_paths) → cùng mẫu
+    batch_seed = np.random.SeedSequence(seed).spawn(2)[1].spawn(1)[0]
+    values = np.sort(_simulate_batch("parametric", arrays, n_paths, horizon, np.random.default_rng(batch_seed)))
+    out = {}
+    for lvl in LEVELS:
+        k = int(round((1 - lvl) * n_paths))
+        out[lvl] = (-np.quantile(values, 1 - lvl), -values[:k].mean())
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--days", type=int, default=750)
+    parser.add_argument("--paths", type=int, default=1_000_000)
+    parser.add_argument("--horizon", type=int, default=21)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--methods", default="parametric,bootstrap")
+    args = parser.parse_args()
+
+    weights, mu, cov, history = synthetic_inputs(args.symbols, args.days)
+    print(f"{args.symbols} mã, {args.paths:,} kịch bản, {args.horizon} phiên, {os.cpu_count()} CPU\n")
+
+    print(f"{'cách':>10} {'worker':>6} {'giây':>7} {'kịch bản/s':>12} {'đỉnh MB':>8} "
+          f"{'VaR99':>8} {'CVaR99':>8} {'= w1':>5}")
+    for method in args.methods.split(","):
+        first = None
+        for workers in [int(x) for x in args.workers.split(",")]:
+            kwargs = dict(expected_returns=mu, cov=cov, history=history, method=method,
+                          n_paths=args.paths, horizon=args.horizon, workers=workers)
+            t0 = time.perf_counter()
+            tracemalloc.start()
+            try:
+                result = simulate_portfolio(weights, **kwargs)
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            finally:
+                tracemalloc.stop()
+            seconds = time.perf_counter() - t0
+            if first is None:
+                first = result
+            same = result.var == first.var and result.cvar == first.cvar
+            print(f"{method:>10} {workers:>6} {seconds:>7.2f} {args.paths / seconds:>12,.0f} {peak:>8.1f} "
+                  f"{result.var[0.99]:>8.4f} {result.cvar[0.99]:>8.4f} {str(same):>5}")
+
+    # Sai số của sketch: cùng số kịch bản, giữ hết trong bộ nhớ
+    n = min(args.paths, 2_000_000)
+    ref = exact(weights, mu, cov, n, args.horizon)
+    sketch = simulate_portfolio(weights, mu, cov, n_paths=n, horizon=args.horizon, workers=1, batch_paths=n)
+    print(f"\nsketch vs chính xác ({n:,} kịch bản, cùng mẫu):")
+    for lvl in LEVELS:
+        print(f"  VaR {lvl:.0%}: {sketch.var[lvl]:.6f} vs {ref[lvl][0]:.6f}   "
+              f"CVaR {lvl:.0%}: {sketch.cvar[lvl]:.6f} vs {ref[lvl][1]:.6f}")
@@ -0,0 +1,75 @@
+"""
+Benchmark các chiến lược giải Max Sharpe của optimize_capm_portfolio.
+
+    python benchmarks/bench_optimizer.py --sizes 10,100,500,1000
+
+- analytic : Σ⁻¹(μ - rf), cho phép bán khống
+- qp       : QP lồi long-only (cvxpy)
+- slsqp    : SLSQP gradient giải tích (long-only và bán khống)
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimizer import optimize_capm_portfolio  # noqa: E402
+
+
+def synthetic_problem(n, rf=0.04, seed=0):
+    """
+    μ, Σ theo mô hình factor (3 nhân tố + rủi ro riêng), annualized
+    """
+    rng = np.random.default_rng(seed)
+    beta = rng.uniform(0.3, 1.8, n)
+    B = np.column_stack([beta, rng.normal(0.3, 0.3, (n, 2))])
+    F = np.diag([0.04, 0.01, 0.01])
+    D = rng.uniform(0.02, 0.15, n)
+    Sigma = B @ F @ B.T + np.diag(D)
+    mu = rf + B @ np.array([0.06, 0.01, 0.01]) + rng.normal(0, 0.005, n)
+
+    idx = [f"S{i:04d}" for i in range(n)]
+    return pd.Series(mu, index=idx), pd.DataFrame(Sigma, index=idx, columns=idx)
+
+
+def run_case(mu, cov, rf, allow_short, method):
+    t0 = time.perf_counter()
+    try:
+        w, info = optimize_capm_portfolio(
+            mu, cov, rf, allow_short=allow_short, method=method, return_info=True
+        )
+    except RuntimeError as e:
+        return time.perf_counter() - t0, None, None, f"lỗi: {e}"
+    return time.perf_counter() - t0, info["iterations"], info["sharpe"], info["solver"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,500,1000")
+    parser.add_argument("--rf", type=float, default=0.04)
+    parser.add_argument("--max-slsqp", type=int, default=1000,
+                        help="bỏ qua SLSQP khi n lớn hơn giá trị này")
+    args = parser.parse_args()
+
+    cases = [
+        ("short", True, "analytic"),
+        ("short", True, "slsqp"),
+        ("long", False, "qp"),
+        ("long", False, "slsqp"),
+    ]
+
+    print(f"{'n':>6} {'mode':>6} {'method':>9} {'time (s)':>10} {'iters':>7} {'sharpe':>9}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        mu, cov = synthetic_problem(n, args.rf)
+        for mode, allow_short, method in cases:
+            if method == "slsqp" and n > args.max_slsqp:
+                continue
+            sec, iters, sharpe, note = run_case(mu, cov, args.rf, allow_short, method)
+            sharpe_s = f"{sharpe:9.4f}" if sharpe is not None else f"{'-':>9}"
+            iters_s = f"{iters:7d}" if iters is not None else f"{'-':>7}"
+            extra = "" if note == method else f"  ({note})"
+            print(f"{n:>6} {mode:>6} {method:>9} {sec:>10.4f} {iters_s} {sharpe_s}{extra}")
@@ -0,0 +1,159 @@
+"""
+Benchmark tách intent / ngành / chỉ số / top-N / ticker:
+bản cũ (hàng chục lần `k in q`) vs query_parser (1 regex gộp, khớp trọn từ).
+
+    python benchmarks/bench_query_parser.py --queries 20000
+    python benchmarks/bench_query_parser.py --corpus chat_log.txt   # 1 câu hỏi / dòng
+
+Không có --corpus thì sinh bộ câu hỏi từ các mẫu câu thường gặp trong chat.
+In thêm các câu mà 2 bản cho kết quả khác nhau (chủ yếu do "de", "xe", "bia"...
+khớp bên trong từ khác ở bản cũ).
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retriever  # noqa: E402
+from query_parser import INDUSTRY_KEYWORDS, FACTOR_MAP, parse_query  # noqa: E402
+
+
+# ===================== LEGACY =====================
+
+def legacy_detect_intent(query):
+    q = query.lower()
+
+    finance_keywords = [
+        "cổ phiếu", "ngành", "ngân hàng", "bất động", "thép", "chứng khoán",
+        "roa", "de", "d/e", "p/b", "pb", "doanh thu", "lợi nhuận",
+        "báo cáo", "vốn hóa", "so sánh", "top", "xếp hạng",
+        "chiến lược", "rủi ro", "chu kỳ"
+    ]
+
+    if not any(k in q for k in finance_keywords):
+        return "out_of_domain"
+    if any(x in q for x in ["so sánh", "vs", "với"]):
+        return "comparison"
+    if any(x in q for x in ["top", "xếp hạng", "cao nhất", "thấp nhất"]):
+        return "ranking"
+    if any(x in q for x in ["roa", "d/e", "de", "p/b", "pb", "đòn bẩy"]):
+        return "ratio_analysis"
+    if "báo cáo tài chính" in q or "bctc" in q:
+        return "financial_statement"
+    if any(x in q for x in ["báo cáo", "doanh thu", "chiến lược", "rủi ro"]):
+        return "report_qa"
+    if any(x in q for x in ["chu kỳ", "toàn ngành", "triển vọng"]):
+        return "sector_analysis"
+    return "recommendation"
+
+
+def legacy_parse(query, industries):
+    ql = query.lower()
+
+    industry = next((ind for ind in industries if ind in ql), None)
+    if industry is None:
+        industry = next((v for k, v in INDUSTRY_KEYWORDS.items() if k in ql), None)
+
+    factor = next((v for k, v in FACTOR_MAP.items() if k in ql), None)
+
+    m = re.search(r"top\s*(\d+)", ql)
+    top_n = int(m.group(1)) if m else None
+
+    tickers = re.findall(r"\b[A-Z]{2,5}\b", query.upper())
+    return legacy_detect_intent(query), industry, factor, top_n, tickers
+
+
+# ===================== CORPUS =====================
+
+TEMPLATES = [
+    "Cổ phiếu {ind} nào đáng để đầu tư?",
+    "Nên mua cổ phiếu ngành {ind} nào",
+    "Top {n} cổ phiếu {factor} cao nhất ngành {ind}",
+    "top{n} ngành {ind} theo {factor}",
+    "Xếp hạng ngành {ind} theo {factor}",
+    "So sánh {a} với {b}",
+    "{a} vs {b} thì nên chọn mã nào",
+    "Phân tích báo cáo tài chính {a}",
+    "Cho mình xem bctc của {a} năm gần nhất",
+    "Đánh giá rủi ro và chiến lược của {a}",
+    "Triển vọng toàn ngành {ind} trong chu kỳ tới",
+    "Chỉ số {factor} của {a} có tốt không",
+    "Đòn bẩy tài chính của {a} để ý những gì",
+    "Hôm nay thời tiết thế nào",
+    "Đề xuất giúp tôi vài mã để đầu tư dài hạn",
+    "Vốn hóa thị trường của {a} và {b}",
+]
+
+FACTORS = ["ROA", "D/E", "P/B", "EPS", "vốn hóa", "market cap", "BV", "score", "giá trị sổ sách"]
+
+
+def synthetic_corpus(n, industries, tickers, seed=0):
+    rng = random.Random(seed)
+    names = industries + list(INDUSTRY_KEYWORDS)
+    out = []
+    for _ in range(n):
+        t = rng.choice(TEMPLATES)
+        out.append(t.format(
+            ind=rng.choice(names),
+            n=rng.choice([3, 5, 10, 20]),
+            factor=rng.choice(FACTORS),
+            a=rng.choice(tickers),
+            b=rng.choice(tickers),
+        ))
+    return out
+
+
+def timeit(fn, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for q in corpus:
+            fn(q)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--show", type=int, default=10, help="số câu khác nhau in ra")
+    args = parser.parse_args()
+
+    industries = retriever.ALL_INDUSTRIES_LOWER
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus(args.queries, industries, retriever.df["ticker"].tolist())
+
+    t_old = timeit(lambda q: legacy_parse(q, industries), corpus, args.repeat)
+    t_new = timeit(lambda q: parse_query(q, industries), corpus, args.repeat)
+
+    print(f"{len(corpus)} câu hỏi")
+    print(f"bản cũ     : {len(corpus) / t_old:>10,.0f} câu/s ({t_old / len(corpus) * 1e6:.1f} µs/câu)")
+    print(f"query_parser: {len(corpus) / t_new:>10,.0f} câu/s ({t_new / len(corpus) * 1e6:.1f} µs/câu)")
+    print(f"speedup    : {t_old / t_new:.1f}x")
+
+    fields = ("intent", "industry", "factor", "top_n", "tickers")
+    diffs = Counter()
+    examples = []
+    for q in corpus:
+        old = legacy_parse(q, industries)
+        new = tuple(parse_query(q, industries))
+        changed = [f for f, a, b in zip(fields, old, new) if a != b]
+        for f in changed:
+            diffs[f] += 1
+        if changed and len(examples) < args.show:
+            examples.append((q, {f: (old[fields.index(f)], new[fields.index(f)]) for f in changed}))
+
+    print("\nsố câu khác nhau theo trường:", dict(diffs) or "không có")
+    for q, d in examples:
+        print(f"  {q!r}: {d}")
@@ -0,0 +1,96 @@
+"""
+Benchmark log return + mômen CAPM trên lịch sử dài:
+frame đầy đủ + calculate_log_returns + estimate_capm_regression (cũ)
+vs return_stream (đọc memmap từng chunk, mômen cộng dồn).
+
+    python benchmarks/bench_returns_stream.py --symbols 500 --days 20000 --chunk 4096
+
+Đo thời gian và bộ nhớ cấp phát đỉnh (tracemalloc); panel giả lập có mã niêm yết muộn,
+nên bản dropna(how="any") cũ mất phần lớn lịch sử của các mã còn lại.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_store import write_price_store, load_price_store  # noqa: E402
+from preprocessing import calculate_log_returns, estimate_capm_regression  # noqa: E402
+from return_stream import stream_capm_moments  # noqa: E402
+
+
+def synthetic_store(store_dir, n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("1950-01-01", periods=n_days).values.astype("datetime64[ns]").view(np.int64)
+    market = rng.normal(0.0003, 0.011, n_days)
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    noise = rng.normal(0, 0.015, (n_days, n_symbols))
+    close = 20 * np.exp(np.cumsum(np.column_stack([market[:, None] * beta + noise, market]), axis=0))
+    # Niêm yết rải rác trong nửa đầu lịch sử
+    listing = rng.integers(0, n_days // 2, n_symbols)
+    for j, a in enumerate(listing):
+        close[:a, j] = np.nan
+    symbols = [f"S{i:04d}" for i in range(n_symbols)] + ["VNINDEX"]
+    write_price_store(dates, symbols, close, store_dir)
+    return load_price_store(store_dir), symbols
+
+
+def legacy(store, symbols, dropna):
+    prices = store.frame(symbols)
+    returns = calculate_log_returns(prices, dropna=dropna)
+    return estimate_capm_regression(returns[symbols[:-1]], returns["VNINDEX"])
+
+
+def measure(fn):
+    t0 = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - t0
+
+    tracemalloc.start()
+    try:
+        out = fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--days", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=4096)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store, symbols = synthetic_store(tmp, args.symbols, args.days)
+        panel_mb = store.close.nbytes / 2 ** 20
+        print(f"panel {args.days} ngày x {args.symbols + 1} mã (float32 trên đĩa: {panel_mb:.0f} MB)\n")
+
+        runs = [
+            ("frame + dropna(any)", lambda: legacy(store, symbols, True)),
+            ("frame, NaN theo cột", lambda: legacy(store, symbols, False)),
+            (f"stream f64 (chunk {args.chunk})",
+             lambda: stream_capm_moments(symbols[:-1], store=store, chunk_rows=args.chunk).capm_regression()),
+            (f"stream f32 (chunk {args.chunk})",
+             lambda: stream_capm_moments(symbols[:-1], store=store, chunk_rows=args.chunk,
+                                         dtype=np.float32).capm_regression()),
+        ]
+
+        results = {}
+        print(f"{'cách tính':<26} {'giây':>8} {'đỉnh MB':>9} {'n_obs TB':>9}")
+        for label, fn in runs:
+            seconds, peak, table = measure(fn)
+            results[label] = table
+            print(f"{label:<26} {seconds:>8.2f} {peak:>9.1f} {table['n_obs'].mean():>9.0f}")
+
+        ref = results["frame, NaN theo cột"]["beta"]
+        for label in list(results)[2:]:
+            diff = np.nanmax(np.abs(results[label]["beta"].values - ref.values))
+            print(f"max |Δβ| {label} vs frame: {diff:.2e}")
@@ -0,0 +1,187 @@
+# compiled_forest.py
+import os
+import json
+import numpy as np
+
+ROOTS_FILE = "roots.npy"
+META_FILE = "meta.json"
+
+# Mỗi trường của node lưu thành 1 file .npy liền mạch (25 byte / node)
+NODE_FIELDS = {
+    "feature": np.uint8,
+    "left": np.int32,
+    "right": np.int32,
+    "threshold": np.float64,
+    "value": np.float64,
+}
+
+
+# ===================== FOLD SCALER =====================
+
+def _float_key(x):
+    """
+    Ánh xạ float64 → uint64 giữ nguyên thứ tự (để chia đôi trên từng bit)
+    """
+    u = np.asarray(x, dtype=np.float64).view(np.uint64)
+    sign = np.uint64(1 << 63)
+    return np.where(u & sign, ~u, u | sign)
+
+
+def _key_float(k):
+    sign = np.uint64(1 << 63)
+    u = np.where(k & sign, k ^ sign, ~k)
+    return u.view(np.float64)
+
+
+def _fold_thresholds(threshold, mean, scale):
+    """
+    Gộp StandardScaler vào ngưỡng: tìm ngưỡng t' trên dữ liệu gốc sao cho
+        x <= t'  ⇔  float32((x - mean) / scale) <= threshold
+    đúng như cách sklearn so sánh (scaler float64 → tree ép float32).
+    Hàm vế phải đơn điệu theo x nên chia đôi 64 lần trên khóa uint64 là chính xác.
+    """
+    def ok(x):
+        with np.errstate(over="ignore", invalid="ignore"):
+            z = ((x - mean) / scale).astype(np.float32).astype(np.float64)
+        return z <= threshold
+
+    big = np.finfo(np.float64).max
+    lo = _float_key(np.full_like(threshold, -big))
+    hi = _float_key(np.full_like(threshold, big))
+
+    all_true = ok(np.full_like(threshold, big))
+    none_true = ~ok(np.full_like(threshold, -big))
+
+    # Bất biến: ok(lo) đúng, ok(hi) sai
+    for _ in range(64):
+        mid = lo + (hi - lo) // np.uint64(2)
+        good = ok(_key_float(mid))
+        lo = np.where(good, mid, lo)
+        hi = np.where(good, hi, mid)
+
+    out = _key_float(lo)
+    out = np.where(all_true, np.inf, out)
+    return np.where(none_true, -np.inf, out)
+
+
+# ===================== COMPILE =====================
+
+class CompiledForest:
+    """
+    Random forest dạng mảng node phẳng (feature / threshold / con trái-phải / lá)
+    Dự đoán vector hóa: mọi dòng x mọi cây đi xuống cùng lúc, `depth` bước
+    """
+
+    def __init__(self, feature, left, right, threshold, value, roots, depth, n_features):
+        # np.asarray: bỏ lớp np.memmap (giữ nguyên buffer map từ file)
+        self.feature = np.asarray(feature)
+        self.left = np.asarray(left)
+        self.right = np.asarray(right)
+        self.threshold = np.asarray(threshold)
+        self.value = np.asarray(value)
+        self.roots = np.asarray(roots)
+        self.depth = depth
+        self.n_features = n_features
+
+    @property
+    def n_nodes(self):
+        return len(self.value)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        # Chỉ số phẳng vào X: dòng * n_features + feature
+        flat = X.ravel()
+        base = (np.arange(len(X)) * X.shape[1])[:, None]
+        idx = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+
+        for _ in range(self.depth):
+            go_left = flat[base + self.feature[idx]] <= self.threshold[idx]
+            idx = np.where(go_left, self.left[idx], self.right[idx])
+
+        # Cộng tuần tự theo thứ tự cây (giống y_hat += tree.predict trong sklearn)
+        return np.cumsum(self.value[idx], axis=1)[:, -1] / len(self.roots)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in NODE_FIELDS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(path, ROOTS_FILE), self.roots)
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"depth": self.depth, "n_features": self.n_features}, f)
+
+
+def compile_forest(model):
+    """
+    Biên dịch Pipeline(StandardScaler + RandomForestRegressor)
+    (hoặc RandomForestRegressor trần) thành CompiledForest
+    """
+    scaler = None
+    forest = model
+    if hasattr(model, "steps"):
+        scaler = model.steps[0][1] if len(model.steps) > 1 else None
+        forest = model.steps[-1][1]
+
+    n_features = forest.n_features_in_
+    if n_features > np.iinfo(np.uint8).max:
+        raise ValueError("Quá nhiều feature cho node 1 byte")
+
+    if scaler is not None:
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+    else:
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+
+    parts = {name: [] for name in NODE_FIELDS}
+    roots = []
+    depth = 0
+    offset = 0
+    for est in forest.estimators_:
+        tree = est.tree_
+        n = tree.node_count
+        leaf = tree.children_left == -1
+        own = np.arange(n) + offset
+
+        feat = np.where(leaf, 0, tree.feature)
+        thr = _fold_thresholds(tree.threshold, mean[feat], scale[feat])
+
+        parts["feature"].append(feat)
+        # Lá trỏ về chính nó → đi thêm bước không đổi kết quả
+        parts["left"].append(np.where(leaf, own, tree.children_left + offset))
+        parts["right"].append(np.where(leaf, own, tree.children_right + offset))
+        parts["threshold"].append(np.where(leaf, np.inf, thr))
+        parts["value"].append(tree.value[:, 0, 0])
+
+        roots.append(offset)
+        depth = max(depth, tree.max_depth)
+        offset += n
+
+    arrays = {
+        name: np.concatenate(parts[name]).astype(dtype)
+        for name, dtype in NODE_FIELDS.items()
+    }
+    return CompiledForest(
+        **arrays,
+        roots=np.asarray(roots, dtype=np.int32),
+        depth=depth,
+        n_features=n_features
+    )
+
+
+def load_compiled_forest(path, mmap=True):
+    """
+    Nạp forest đã biên dịch (memory-map các mảng node)
+    """
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+
+    mode = "r" if mmap else None
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        for name in NODE_FIELDS
+    }
+    roots = np.load(os.path.join(path, ROOTS_FILE))
+    return CompiledForest(**arrays, roots=roots, depth=meta["depth"], n_features=meta["n_features"])
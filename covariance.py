@@ -0,0 +1,349 @@
+# covariance.py
+import time
+import numpy as np
+import pandas as pd
+
+# Dưới ngưỡng này giải hệ dense nhanh và ổn định hơn Woodbury
+DENSE_SOLVE_MAX = 2000
+# QP: hạng k >= N / 4 thì khối Gᵀy (k x N dense) làm KKT fill-in nặng hơn Σ dense N x N
+# (CLARABEL, N = 2000: k = 500 → 7.4 s so với 5.0 s, k = 1000 → ~30 s)
+QP_DENSE_RANK_RATIO = 0.25
+
+
+# ===================== OPERATORS =====================
+
+def _condition(vals):
+    """
+    λmax / λmin (Σ suy biến → inf)
+    """
+    lo, hi = vals.min(), vals.max()
+    return float(hi / lo) if lo > 0 else float("inf")
+
+
+class DenseCovariance:
+    """
+    Σ dạng ma trận N x N đầy đủ (giữ tương thích với DataFrame cũ)
+    """
+
+    def __init__(self, matrix, index=None):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.index = index
+        self.shape = self.matrix.shape
+
+    def matvec(self, w):
+        return self.matrix @ w
+
+    def quad_form(self, w):
+        return float(w @ self.matrix @ w)
+
+    def solve(self, b):
+        return np.linalg.solve(self.matrix, b)
+
+    def diag(self):
+        return np.diag(self.matrix).copy()
+
+    def to_dense(self):
+        return self.matrix
+
+    def condition_number(self):
+        return _condition(np.linalg.eigvalsh(self.matrix))
+
+    def take(self, positions):
+        """
+        Σ của tập con mã (theo vị trí), không tính lại
+        """
+        p = np.asarray(positions)
+        return DenseCovariance(self.matrix[np.ix_(p, p)], None if self.index is None else self.index[p])
+
+    def cvx_quad_form(self, y):
+        import cvxpy as cp
+        return cp.quad_form(y, cp.psd_wrap(self.matrix))
+
+
+class LowRankCovariance:
+    """
+    Σ = G Gᵀ + diag(d)
+        - G : (N, k) factor loadings đã nhân căn của Σ_factor
+        - d : (N,)  phương sai riêng (specific risk)
+
+    Mọi phép toán O(N·k), không tạo ma trận N x N
+    (trừ cvx_quad_form khi hạng k gần N và N <= DENSE_SOLVE_MAX: QP dense nhanh hơn)
+    """
+
+    def __init__(self, factors, specific=None, index=None):
+        G = np.asarray(factors, dtype=np.float64)
+        if G.ndim == 1:
+            G = G.reshape(-1, 1)
+        n = G.shape[0]
+
+        self.factors = G
+        self.specific = np.zeros(n) if specific is None else np.asarray(specific, dtype=np.float64)
+        self.index = index
+        self.shape = (n, n)
+        self._core = None
+
+    @classmethod
+    def from_factor_model(cls, loadings, factor_cov, specific=None, index=None):
+        """
+        Σ = B F Bᵀ + diag(d)  →  G = B · F^(1/2)
+        """
+        B = np.asarray(loadings, dtype=np.float64)
+        if B.ndim == 1:
+            B = B.reshape(-1, 1)
+        F = np.atleast_2d(np.asarray(factor_cov, dtype=np.float64))
+
+        # F chỉ cần nửa xác định dương (vd: 1 nhân tố thị trường)
+        vals, vecs = np.linalg.eigh(F)
+        root = vecs * np.sqrt(np.clip(vals, 0, None))
+        return cls(B @ root, specific, index)
+
+    def matvec(self, w):
+        return self.factors @ (self.factors.T @ w) + self.specific * w
+
+    def quad_form(self, w):
+        u = self.factors.T @ w
+        return float(u @ u + np.sum(self.specific * w * w))
+
+    def solve(self, b):
+        """
+        Σ⁻¹b theo Woodbury: D⁻¹b - D⁻¹G (I + GᵀD⁻¹G)⁻¹ GᵀD⁻¹b
+        """
+        if np.any(self.specific <= 0):
+            # Không có rủi ro riêng → Σ suy biến nếu k < N
+            if self.shape[0] > DENSE_SOLVE_MAX:
+                raise np.linalg.LinAlgError("Σ low-rank suy biến (specific risk = 0)")
+            return np.linalg.solve(self.to_dense(), b)
+
+        if self._core is None:
+            DG = self.factors / self.specific[:, None]
+            core = np.eye(self.factors.shape[1]) + self.factors.T @ DG
+            self._core = (DG, np.linalg.cholesky(core))
+
+        DG, L = self._core
+        Db = b / self.specific
+        z = np.linalg.solve(L.T, np.linalg.solve(L, self.factors.T @ Db))
+        return Db - DG @ z
+
+    def diag(self):
+        return np.einsum("ik,ik->i", self.factors, self.factors) + self.specific
+
+    def to_dense(self):
+        return self.factors @ self.factors.T + np.diag(self.specific)
+
+    def condition_number(self):
+        """
+        d hằng số (sample / Ledoit-Wolf): trị riêng = σ(G)² + d, chỉ cần SVD của G (N x k);
+        còn lại tính dense nếu N không quá lớn
+        """
+        n, k = self.factors.shape
+        d = self.specific
+        if n == 0:
+            return float("nan")
+        if np.all(d == d[0]):
+            s2 = np.linalg.svd(self.factors, compute_uv=False) ** 2
+            lo = s2.min() + d[0] if k >= n else d[0]
+            return _condition(np.array([lo, s2.max() + d[0]]))
+        if n <= DENSE_SOLVE_MAX:
+            return _condition(np.linalg.eigvalsh(self.to_dense()))
+        return float("nan")
+
+    def take(self, positions):
+        """
+        Σ của tập con mã: chỉ lấy các dòng tương ứng của G và d
+        """
+        p = np.asarray(positions)
+        return LowRankCovariance(self.factors[p], self.specific[p], None if self.index is None else self.index[p])
+
+    def cvx_quad_form(self, y):
+        import cvxpy as cp
+        n, k = self.factors.shape
+        if k >= QP_DENSE_RANK_RATIO * n and n <= DENSE_SOLVE_MAX:
+            return cp.quad_form(y, cp.psd_wrap(self.to_dense()))
+        expr = cp.sum_squares(self.factors.T @ y)
+        if np.any(self.specific > 0):
+            expr = expr + cp.sum_squares(cp.multiply(np.sqrt(self.specific), y))
+        return expr
+
+
+def as_covariance_operator(cov):
+    """
+    Chuẩn hóa đầu vào: DataFrame / ndarray → DenseCovariance, operator giữ nguyên
+    """
+    if isinstance(cov, (DenseCovariance, LowRankCovariance)):
+        return cov
+    if isinstance(cov, pd.DataFrame):
+        return DenseCovariance(cov.values, cov.index)
+    return DenseCovariance(cov)
+
+
+# ===================== BUILDERS =====================
+
+def single_index_operator(betas, market_variance, specific_variance=None, index=None):
+    """
+    Σ = β βᵀ σ²(M) + diag(σ²(ε)) dạng low-rank hạng 1 (G = β σ_M)
+    Dùng chung cho mọi chỗ dựng Σ single-index (estimator bên dưới,
+    preprocessing.capm_covariance_*, rolling_capm.covariance_at)
+    """
+    beta = np.asarray(betas, dtype=np.float64)
+    return LowRankCovariance(beta * np.sqrt(market_variance), specific_variance, index)
+
+
+def sample_covariance_operator(returns: pd.DataFrame, annualize: float = 252):
+    """
+    Hiệp phương sai mẫu (giống returns.cov() * annualize):
+        Σ = XᵀX · annualize / (T - 1),  X = returns đã trừ trung bình
+    - T >= N (rổ thông thường): DenseCovariance N x N, solve / QP trên ma trận nhỏ
+    - N > T : LowRankCovariance hạng k = T, không tạo ma trận N x N
+    """
+    X = returns.to_numpy(dtype=np.float64)
+    X = X - X.mean(axis=0)
+    scale = np.sqrt(annualize / (len(X) - 1))
+    X *= scale
+    if len(X) >= X.shape[1]:
+        return DenseCovariance(X.T @ X, returns.columns)
+    return LowRankCovariance(X.T, index=returns.columns)
+
+
+# ===================== ESTIMATORS =====================
+# Mỗi estimator: (returns T x N, market_returns | None, annualize) → (operator, info)
+# Hai estimator shrinkage dùng mômen chia T như trong bài báo Ledoit-Wolf
+
+def _centered(returns):
+    X = returns.to_numpy(dtype=np.float64)
+    return X - X.mean(axis=0)
+
+
+def _sample(returns, market_returns=None, annualize=252):
+    return sample_covariance_operator(returns, annualize), {}
+
+
+def single_index_covariance(returns, market_returns=None, annualize=252):
+    """
+    Mô hình 1 nhân tố (CAPM / Sharpe single-index):
+        Σ = β βᵀ σ²(M) + diag(σ²(ε))
+    market_returns None → nhân tố là trung bình cộng return các mã
+    """
+    X = _centered(returns)
+    T = len(X)
+    if market_returns is None:
+        m = X.mean(axis=1)
+    else:
+        m = market_returns.reindex(returns.index).to_numpy(dtype=np.float64)
+        m = m - m.mean()
+
+    smm = m @ m
+    sxy = m @ X
+    beta = sxy / smm
+    resid_var = (np.einsum("tn,tn->n", X, X) - beta * sxy) / (T - 2)
+
+    cov = single_index_operator(beta, smm / (T - 1) * annualize, resid_var * annualize, returns.columns)
+    return cov, {}
+
+
+def ledoit_wolf_covariance(returns, market_returns=None, annualize=252):
+    """
+    Ledoit-Wolf (2004): Σ = (1 - δ) S + δ · tb(trị riêng) · I, δ tối ưu theo công thức đóng
+    (giống sklearn.covariance.ledoit_wolf). Giữ dạng low-rank + đường chéo,
+    nên giải Σ⁻¹b vẫn theo Woodbury, không tạo ma trận N x N
+    """
+    X = _centered(returns)
+    T, N = X.shape
+
+    # ‖S‖²_F qua ma trận Gram nhỏ hơn (N x N hoặc T x T)
+    gram = X.T @ X if N <= T else X @ X.T
+    s_fro2 = np.sum(gram * gram) / T ** 2
+    row_sq = np.einsum("tn,tn->t", X, X)
+    mu = row_sq.sum() / (T * N)
+
+    d2 = s_fro2 / N - mu ** 2
+    b2 = (np.sum(row_sq ** 2) - T * s_fro2) / (N * T ** 2)
+    delta = min(b2, d2) / d2 if d2 > 0 else 1.0
+
+    cov = LowRankCovariance(
+        X.T * np.sqrt((1 - delta) * annualize / T),
+        np.full(N, delta * mu * annualize),
+        index=returns.columns
+    )
+    return cov, {"shrinkage": float(delta)}
+
+
+def constant_correlation_covariance(returns, market_returns=None, annualize=252):
+    """
+    Ledoit-Wolf (2003) "Honey, I shrunk the sample covariance matrix":
+    co về ma trận tương quan hằng số F (F_ii = s_ii, F_ij = r̄ √(s_ii s_jj))
+        Σ = δ F + (1 - δ) S,   δ = clip((π - ρ) / γ / T, 0, 1)
+    """
+    X = _centered(returns)
+    T, N = X.shape
+
+    S = X.T @ X / T
+    var = np.diag(S).copy()
+    sd = np.sqrt(var)
+
+    r_bar = ((S / np.outer(sd, sd)).sum() - N) / (N * (N - 1)) if N > 1 else 0.0
+    F = r_bar * np.outer(sd, sd)
+    np.fill_diagonal(F, var)
+
+    X2 = X * X
+    pi_mat = X2.T @ X2 / T - S * S
+    # θ[i, j] = E[(x_i² - s_ii)(x_i x_j - s_ij)]
+    theta = (X2 * X).T @ X / T - var[:, None] * S
+    term = (sd[None, :] / sd[:, None]) * theta
+    np.fill_diagonal(term, 0.0)
+
+    pi = pi_mat.sum()
+    rho = np.trace(pi_mat) + r_bar * term.sum()
+    gamma = np.sum((F - S) ** 2)
+    delta = float(np.clip((pi - rho) / gamma / T, 0.0, 1.0)) if gamma > 0 else 0.0
+
+    cov = DenseCovariance((delta * F + (1 - delta) * S) * annualize, returns.columns)
+    return cov, {"shrinkage": delta}
+
+
+COVARIANCE_ESTIMATORS = {
+    "sample": _sample,
+    "single_index": single_index_covariance,
+    "ledoit_wolf": ledoit_wolf_covariance,
+    "constant_correlation": constant_correlation_covariance,
+}
+
+
+def register_covariance_estimator(name, estimator):
+    """
+    Thêm estimator mới: estimator(returns, market_returns, annualize) → (operator, info)
+    """
+    COVARIANCE_ESTIMATORS[name] = estimator
+    return estimator
+
+
+def estimate_covariance(
+    returns: pd.DataFrame,
+    method: str = "sample",
+    market_returns: pd.Series = None,
+    annualize: float = 252,
+    return_info: bool = False
+):
+    """
+    Σ · annualize theo estimator đã đăng ký (xem COVARIANCE_ESTIMATORS)
+
+    return_info=True → trả về (cov, info) với info gồm
+    estimator, shrinkage (nếu có), condition (λmax / λmin), estimate_time (giây)
+    """
+    estimator = COVARIANCE_ESTIMATORS.get(method)
+    if estimator is None:
+        raise ValueError(f"method không hợp lệ: {method}")
+
+    t0 = time.perf_counter()
+    cov, extra = estimator(returns, market_returns, annualize)
+    estimate_time = time.perf_counter() - t0
+
+    if not return_info:
+        return cov
+
+    info = {
+        "estimator": method,
+        "shrinkage": extra.get("shrinkage"),
+        "condition": cov.condition_number(),
+        "estimate_time": estimate_time,
+    }
+    return cov, info
@@ -1,54 +1,36 @@
-import pandas as pd
 import os
 
+from price_store import PRICE_DIR, STORE_DIR, get_price_store
+
 BASE_DIR = os.path.dirname(__file__)
-PRICE_DIR = os.path.join(BASE_DIR, "price_offline")
 
 
 def download_price(symbol, start="2020-01-01", end=None):
-    file_path = os.path.join(PRICE_DIR, f"{symbol}_close_2022_now.csv")
+    store = get_price_store(PRICE_DIR, STORE_DIR)
 
-    if not os.path.exists(file_path):
+    if symbol not in store:
         print(f"Không tìm thấy file giá của {symbol}")
         return None
 
-    df = pd.read_csv(file_path)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.set_index("date").sort_index()
-
     # LỌC THEO THỜI GIAN (GIỮ GIỐNG HÀM ONLINE)
-    if start:
-        df = df[df.index >= pd.to_datetime(start)]
-    if end:
-        df = df[df.index <= pd.to_datetime(end)]
-
-    df = df.rename(columns={"close_price": symbol})
-
-    if df.empty:
-        return None
-
-    return df[[symbol]]
+    return store.frame([symbol], start=start, end=end)
 
 
 def download_multiple_prices(symbols, start="2020-01-01", end=None):
     """
     Load dữ liệu giá cho nhiều cổ phiếu (outer join)
     Giữ nguyên interface như bản dùng vnstock
+
+    Cắt trực tiếp từ panel giá memory-mapped (price_store),
+    không parse lại CSV cho từng mã
     """
-    price_dfs = []
+    store = get_price_store(PRICE_DIR, STORE_DIR)
 
     for sym in symbols:
-        df = download_price(sym, start=start, end=end)
-        if df is not None:
-            price_dfs.append(df)
-
-    if len(price_dfs) == 0:
-        return None
-
-    prices = pd.concat(price_dfs, axis=1, join="outer")
-    prices = prices.sort_index()
+        if sym not in store:
+            print(f"Không tìm thấy file giá của {sym}")
 
-    return prices
+    return store.frame(symbols, start=start, end=end)
 
 
 def download_market_index(start="2020-01-01", end=None):
@@ -1,55 +1,331 @@
-from vnstock import Quote
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 
+from price_store import PRICE_DIR, CLOSE_SUFFIX
+
+# ===================== CONFIG =====================
+SOURCE = "VCI"
+MAX_WORKERS = 128       # trần số luồng tải song song; mỗi lô dùng min(số mã, MAX_WORKERS) luồng
+MAX_RETRIES = 3         # số lần thử lại cho mỗi mã
+BACKOFF_SECONDS = 0.5   # thời gian chờ lần thử lại đầu tiên (nhân đôi mỗi lần)
+
+META_FILE = "_fetch_meta.json"   # khoảng thời gian đã tải của từng mã
+
+# Phiên hôm nay chỉ tính là đã tải đủ sau giờ đóng cửa (HOSE đóng 15:00 giờ VN);
+# trước đó bar hôm nay là giá tạm, lần tải sau phải lấy lại
+MARKET_TZ = "Asia/Ho_Chi_Minh"
+MARKET_CLOSE_HOUR = 15
+
+
+# ===================== CLIENT POOL =====================
+
+def _vnstock_quote(symbol):
+    from vnstock import Quote
+    return Quote(symbol=symbol, source=SOURCE)
 
-def download_price(symbol, start="2020-01-01", end=None):
+
+_quote_factory = _vnstock_quote
+_quotes = {}
+_quotes_lock = threading.Lock()
+
+
+def set_quote_factory(factory):
     """
-    Tải dữ liệu giá đóng cửa của 1 cổ phiếu
-    Trả về DataFrame:
-        - index: thời gian
-        - 1 cột: giá đóng cửa (tên cột = mã cổ phiếu)
+    Thay nguồn dữ liệu (vd: stand-in local khi test/benchmark).
+    factory(symbol) -> object có .history(start=..., end=..., interval="d")
+    """
+    global _quote_factory
+    with _quotes_lock:
+        _quote_factory = factory or _vnstock_quote
+        _quotes.clear()
+
+
+def _get_quote(symbol):
+    """
+    Dùng lại client Quote đã tạo cho mỗi mã thay vì tạo mới mỗi lần tải
     """
+    with _quotes_lock:
+        quote = _quotes.get(symbol)
+        if quote is None:
+            quote = _quote_factory(symbol)
+            _quotes[symbol] = quote
+        return quote
+
 
+# ===================== DISK CACHE =====================
+
+_meta_lock = threading.Lock()
+_symbol_locks = {}
+
+
+def _cache_path(symbol, cache_dir):
+    return os.path.join(cache_dir, f"{symbol}{CLOSE_SUFFIX}")
+
+
+def _load_meta(cache_dir):
+    path = os.path.join(cache_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
     try:
-        quote = Quote(symbol=symbol, source="VCI")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_meta(meta, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, META_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _commit_meta(updates, cache_dir):
+    """
+    Gộp khoảng vừa tải vào file meta: dưới lock, đọc lại bản mới nhất trên đĩa rồi
+    lấy hợp với khoảng đã có → các lần tải chạy song song không ghi đè cập nhật của nhau
+    (file giá chỉ được nối thêm nên hợp 2 khoảng vẫn đúng)
+    """
+    if not updates:
+        return
+    with _meta_lock:
+        meta = _load_meta(cache_dir)
+        for symbol, (a, b) in updates.items():
+            old = meta.get(symbol)
+            if old is not None:
+                a, b = min(a, old[0]), max(b, old[1])
+            meta[symbol] = [a, b]
+        _save_meta(meta, cache_dir)
+
+
+def _symbol_lock(symbol, cache_dir):
+    """
+    Lock theo (thư mục cache, mã): đọc cache → tải → ghi file của cùng 1 mã không chồng nhau
+    """
+    key = (os.path.abspath(cache_dir), symbol)
+    with _meta_lock:
+        lock = _symbol_locks.get(key)
+        if lock is None:
+            lock = _symbol_locks[key] = threading.Lock()
+    return lock
+
+
+def _read_cached(symbol, cache_dir):
+    """
+    Đọc giá đã lưu (cùng layout price_offline/{SYMBOL}_close_2022_now.csv)
+    """
+    path = _cache_path(symbol, cache_dir)
+    if not os.path.exists(path):
+        return None
+
+    df = pd.read_csv(path)
+    s = pd.Series(df["close_price"].values, index=pd.to_datetime(df["date"]))
+    return s.sort_index()
+
+
+def _write_cached(symbol, s, cache_dir):
+    """
+    Write-through: ghi đè file tạm rồi os.replace (không để file dở dang)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(symbol, cache_dir)
+    tmp = path + ".tmp"
+
+    out = pd.DataFrame({
+        "date": s.index.strftime("%Y-%m-%d"),
+        "close_price": s.values
+    })
+    out.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, path)
+
+
+# ===================== FETCH =====================
+
+def _fetch(symbol, start, end):
+    """
+    Gọi nguồn online cho 1 khoảng thời gian, có retry + exponential backoff
+    """
+    quote = _get_quote(symbol)
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            df = quote.history(
+                start=start.strftime("%Y-%m-%d"),
+                end=end.strftime("%Y-%m-%d"),
+                interval="d"
+            )
 
-        df = quote.history(
-            start=start,
-            end=end,
-            interval="d"
-        )
+            if df is None or df.empty:
+                return pd.Series(dtype=float)
 
-        # Kiểm tra dữ liệu
-        if df is None or df.empty:
-            return None
+            s = pd.Series(df["close"].values, index=pd.to_datetime(df["time"]))
+            return s.sort_index()
 
-        # Chỉ giữ cột cần thiết
-        df = df[["time", "close"]].copy()
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            wait = BACKOFF_SECONDS * (2 ** attempt)
+            print(f"Lỗi tải {symbol} (lần {attempt + 1}): {e} → thử lại sau {wait:.1f}s")
+            time.sleep(wait)
 
-        # Chuẩn hóa thời gian
-        df["time"] = pd.to_datetime(df["time"])
-        df = df.set_index("time").sort_index()
 
-        # Đổi tên cột thành mã cổ phiếu
-        df = df.rename(columns={"close": symbol})
+def _missing_ranges(covered, start, end):
+    """
+    Các khoảng [a, b] chưa có trong cache (chỉ tải phần thiếu)
+    """
+    if covered is None:
+        return [(start, end)]
 
-        return df
+    c0, c1 = pd.Timestamp(covered[0]), pd.Timestamp(covered[1])
+    ranges = []
+    if start < c0:
+        ranges.append((start, c0 - pd.Timedelta(days=1)))
+    if end > c1:
+        ranges.append((c1 + pd.Timedelta(days=1), end))
+    return ranges
 
+
+def _sync_symbol(symbol, start, end, meta, updates, cache_dir):
+    """
+    Đồng bộ cache của 1 mã cho khoảng [start, end], trả về Series giá
+    meta: bản meta đọc lúc bắt đầu; khoảng mới tải được ghi vào updates
+    """
+    with _symbol_lock(symbol, cache_dir):
+        return _sync_symbol_locked(symbol, start, end, meta, updates, cache_dir)
+
+
+def _sync_symbol_locked(symbol, start, end, meta, updates, cache_dir):
+    covered = meta.get(symbol)
+
+    cached = _read_cached(symbol, cache_dir)
+    if cached is None or cached.empty:
+        covered = None
+    elif covered is None:
+        # File có sẵn nhưng chưa có meta: coi như đã có từ bar đầu tới bar cuối
+        covered = [cached.index[0], cached.index[-1]]
+
+    ranges = _missing_ranges(covered, start, end)
+    if not ranges:
+        return cached
+
+    parts = [] if cached is None else [cached]
+    try:
+        for a, b in ranges:
+            parts.append(_fetch(symbol, a, b))
     except Exception as e:
         print(f"Lỗi tải dữ liệu {symbol}: {e}")
+        return cached
+
+    s = pd.concat(parts)
+    s = s[~s.index.duplicated(keep="last")].sort_index().dropna()
+
+    if not s.empty:
+        _write_cached(symbol, s, cache_dir)
+
+    # Bar của phiên chưa đóng cửa là giá tạm → không tính vào khoảng đã tải
+    settled = min(end, _last_settled_day())
+    if settled >= start:
+        new_cov = [start, settled] if covered is None else [
+            min(start, pd.Timestamp(covered[0])),
+            max(settled, pd.Timestamp(covered[1]))
+        ]
+        with _meta_lock:
+            updates[symbol] = [d.strftime("%Y-%m-%d") for d in new_cov]
+
+    return s
+
+
+def _to_frame(s, symbol, start, end):
+    if s is None or s.empty:
         return None
 
+    s = s[(s.index >= start) & (s.index <= end)]
+    if s.empty:
+        return None
+
+    df = s.to_frame(symbol)
+    df.index.name = "time"
+    return df
+
 
-def download_multiple_prices(symbols, start="2020-01-01", end=None):
+def _market_now():
     """
-    Tải dữ liệu giá cho nhiều cổ phiếu
+    Giờ hiện tại theo múi giờ sàn (không kèm tz)
+    """
+    return pd.Timestamp.now(tz=MARKET_TZ).tz_localize(None)
+
+
+def _last_settled_day():
+    """
+    Ngày gần nhất có bar đã chốt: hôm nay nếu đã qua giờ đóng cửa (hoặc cuối tuần),
+    ngược lại là hôm qua
+    """
+    now = _market_now()
+    today = now.normalize()
+    if now.hour >= MARKET_CLOSE_HOUR or today.dayofweek >= 5:
+        return today
+    return today - pd.Timedelta(days=1)
+
+
+def _range(start, end):
+    start = pd.Timestamp(start) if start else pd.Timestamp("2000-01-01")
+    # Khoảng tải chỉ tới hôm nay (tránh đánh dấu tương lai là đã có)
+    today = _market_now().normalize()
+    end = min(pd.Timestamp(end), today) if end else today
+    return start.normalize(), end.normalize()
+
+
+def download_price(symbol, start="2020-01-01", end=None, cache_dir=PRICE_DIR):
+    """
+    Tải dữ liệu giá đóng cửa của 1 cổ phiếu
+    Trả về DataFrame:
+        - index: thời gian
+        - 1 cột: giá đóng cửa (tên cột = mã cổ phiếu)
+    Chỉ gọi mạng cho phần dữ liệu chưa có trong cache trên đĩa
+    """
+    start, end = _range(start, end)
+
+    updates = {}
+    s = _sync_symbol(symbol, start, end, _load_meta(cache_dir), updates, cache_dir)
+    _commit_meta(updates, cache_dir)
+
+    return _to_frame(s, symbol, start, end)
+
+
+def download_multiple_prices(symbols, start="2020-01-01", end=None,
+                             cache_dir=PRICE_DIR, max_workers=MAX_WORKERS):
+    """
+    Tải dữ liệu giá cho nhiều cổ phiếu (song song, có cache)
     Trả về DataFrame giá (KHÔNG dropna)
+
+    Mỗi mã cần tải 1 luồng (luồng chủ yếu chờ mạng): lô ≤ max_workers mã chỉ tốn
+    ~1 round-trip; nguồn trả lỗi do quá tải thì mã đó được thử lại với backoff
     """
+    start, end = _range(start, end)
+    unique = list(dict.fromkeys(symbols))
+    meta = _load_meta(cache_dir)
+    updates = {}
 
-    price_dfs = []
+    workers = max(1, min(max_workers, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        series = dict(zip(unique, pool.map(
+            lambda sym: _sync_symbol(sym, start, end, meta, updates, cache_dir),
+            unique
+        )))
+
+    # Ghi meta 1 lần sau khi pool xong (gộp với bản trên đĩa)
+    _commit_meta(updates, cache_dir)
 
+    price_dfs = []
     for sym in symbols:
-        df = download_price(sym, start=start, end=end)
+        df = _to_frame(series[sym], sym, start, end)
         if df is not None:
             price_dfs.append(df)
 
@@ -64,9 +340,10 @@ def download_multiple_prices(symbols, start="2020-01-01", end=None):
     prices = prices.sort_index()
 
     return prices
+
+
 def download_market_index(start="2020-01-01", end=None):
     """
     Tải dữ liệu VNINDEX (market)
     """
     return download_price("VNINDEX", start=start, end=end)
-
@@ -0,0 +1,146 @@
+# llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+LRU_SIZE = 256
+# Tầng SQLite tùy chọn: đặt LLM_CACHE_DB=đường_dẫn.sqlite để bật
+CACHE_DB = os.environ.get("LLM_CACHE_DB")
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 3600))   # giây
+
+
+def normalize_prompt(text):
+    """
+    Chuẩn hóa phần không đổi nghĩa của prompt trước khi băm:
+    Unicode NFC (tiếng Việt dựng sẵn / tổ hợp), xuống dòng CRLF → LF,
+    khoảng trắng cuối dòng và đầu / cuối prompt
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def make_key(model, system, prompt, temperature, max_tokens=None, version=None):
+    """
+    Khóa nội dung: sha256 của mọi thứ quyết định câu trả lời
+    (version = phiên bản dữ liệu, vd: mtime của CSV xếp hạng)
+    """
+    payload = json.dumps(
+        [model, normalize_prompt(system), normalize_prompt(prompt), temperature, max_tokens, version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def data_version(path):
+    """
+    Phiên bản file dữ liệu: (mtime_ns, size), file chưa có → None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+class LLMCache:
+    """
+    Cache câu trả lời LLM 2 tầng:
+        - LRU trong bộ nhớ (maxsize mục)
+        - SQLite trên đĩa (nếu có db_path), hết hạn sau ttl giây
+    """
+
+    def __init__(self, maxsize=LRU_SIZE, db_path=None, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if time.time() - created <= self.ttl:
+                        self._remember(key, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, time.time())
+                )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._lru),
+        }
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Cache dùng chung trong process (cấu hình theo LLM_CACHE_DB / LLM_CACHE_TTL)
+    """
+    global _cache
+    if _cache is None:
+        _cache = LLMCache(db_path=CACHE_DB)
+    return _cache
@@ -0,0 +1,219 @@
+# moments_cache.py
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from data_loader import download_multiple_prices, download_market_index
+from preprocessing import calculate_log_returns, estimate_betas, estimate_market_parameters
+from covariance import sample_covariance_operator
+from price_store import PRICE_DIR, STORE_DIR, get_price_store
+from tracing import span
+
+# Ngân sách bộ nhớ của cache (MB), đặt MOMENTS_CACHE_MB để đổi
+CACHE_MB = float(os.environ.get("MOMENTS_CACHE_MB", 256))
+ANNUALIZE = 252
+
+
+class Moments(NamedTuple):
+    """
+    Mọi thứ của bước tiền xử lý CAPM không phụ thuộc rf
+    """
+    symbols: list
+    stock_returns: pd.DataFrame
+    market_returns: pd.Series
+    betas: pd.Series
+    expected_rm: float
+    market_variance: float
+    cov: object                 # covariance operator, Σ đã nhân ANNUALIZE
+    complete: bool              # giá mọi mã đủ trong cả khoảng → tập con cắt ra là chính xác
+
+    @property
+    def nbytes(self):
+        cov = self.cov
+        cov_bytes = cov.factors.nbytes + cov.specific.nbytes if hasattr(cov, "factors") else cov.matrix.nbytes
+        return (
+            self.stock_returns.to_numpy().nbytes
+            + self.market_returns.to_numpy().nbytes
+            + self.betas.to_numpy().nbytes
+            + cov_bytes
+        )
+
+    def take(self, symbols):
+        """
+        Mômen của tập con mã (theo thứ tự symbols), cắt từ bản đã tính
+        """
+        symbols = list(symbols)
+        if symbols == self.symbols:
+            return self
+        pos = [self.symbols.index(s) for s in symbols]
+        return self._replace(
+            symbols=symbols,
+            stock_returns=self.stock_returns[symbols],
+            betas=self.betas[symbols],
+            cov=self.cov.take(pos)
+        )
+
+
+# ===================== COMPUTE =====================
+
+def compute_moments(symbols, start, end=None):
+    """
+    Bước tiền xử lý của nút "Tối ưu danh mục" (giữ nguyên cách tính kiểu Excel):
+    tải giá → log return → đồng bộ với VNINDEX → beta, E(Rm), σ²(M), Σ · 252
+    """
+    symbols = list(symbols)
+
+    with span("capm.load", symbols=len(symbols)):
+        prices = download_multiple_prices(symbols, start=start, end=end)
+        market_price = download_market_index(start=start, end=end)
+
+    if prices is None or market_price is None:
+        return None
+
+    with span("capm.log_returns"):
+        stock_log_returns = calculate_log_returns(prices)
+        market_log_returns = calculate_log_returns(market_price)["VNINDEX"]
+
+        # Đồng bộ thời gian (GIỐNG EXCEL)
+        data = stock_log_returns.join(market_log_returns, how="inner")
+        # ÉP lại đúng khoảng thời gian user chọn
+        data = data[data.index >= pd.to_datetime(start)]
+        stock_log_returns = data[symbols]
+        market_log_returns = data["VNINDEX"]
+
+    with span("capm.betas"):
+        betas = estimate_betas(stock_log_returns, market_log_returns)
+        expected_rm, market_variance = estimate_market_parameters(market_log_returns)
+
+    # Σ = stock_log_returns.cov() * 252 (dense khi T >= N, low-rank khi N > T)
+    with span("capm.cov"):
+        cov = sample_covariance_operator(stock_log_returns, annualize=ANNUALIZE)
+
+    return Moments(
+        symbols=symbols,
+        stock_returns=stock_log_returns,
+        market_returns=market_log_returns,
+        betas=betas,
+        expected_rm=expected_rm,
+        market_variance=market_variance,
+        cov=cov,
+        complete=not np.isnan(prices.to_numpy()).any()
+    )
+
+
+def price_data_version(store=None):
+    """
+    Phiên bản panel giá: đổi khi store được ingest lại
+    """
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+    return (store.source_mtime, len(store.dates), len(store.symbols))
+
+
+# ===================== CACHE =====================
+
+class MomentsCache:
+    """
+    Cache LRU theo (tập mã, start, end, phiên bản dữ liệu), giới hạn theo số byte:
+        - cùng tập mã (khác thứ tự) → dùng lại
+        - rổ là tập con của 1 rổ đã tính (giá đủ, không NaN) → cắt returns / beta / Σ,
+          không tính lại
+    """
+
+    def __init__(self, max_bytes=CACHE_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        self.hits = 0
+        self.subset_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(symbols, start, end, version):
+        return (frozenset(symbols), str(start), None if end is None else str(end), version)
+
+    def get(self, symbols, start, end=None, version=None):
+        """
+        (Moments, "hit" / "subset") hoặc (None, "miss")
+        """
+        key = self._key(symbols, start, end, version)
+        with self._lock:
+            moments = self._entries.get(key)
+            if moments is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return moments.take(symbols), "hit"
+
+            wanted = key[0]
+            for other, moments in reversed(self._entries.items()):
+                if other[1:] == key[1:] and moments.complete and wanted < other[0]:
+                    self._entries.move_to_end(other)
+                    self.subset_hits += 1
+                    return moments.take(symbols), "subset"
+
+            self.misses += 1
+            return None, "miss"
+
+    def put(self, symbols, start, end, version, moments):
+        size = moments.nbytes
+        if size > self.max_bytes:
+            return
+        key = self._key(symbols, start, end, version)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self._entries[key] = moments
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_compute(self, symbols, start, end=None):
+        version = price_data_version()
+        with span("capm.moments") as s:
+            moments, source = self.get(symbols, start, end, version)
+            s.set(cache=source)
+            if moments is None:
+                moments = compute_moments(symbols, start, end)
+                if moments is not None:
+                    self.put(symbols, start, end, version, moments)
+        return moments
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        total = self.hits + self.subset_hits + self.misses
+        return {
+            "hits": self.hits,
+            "subset_hits": self.subset_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.subset_hits) / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "mb": self.bytes / 2 ** 20,
+        }
+
+
+_cache = None
+
+
+def get_moments_cache():
+    """
+    Cache dùng chung trong process (Streamlit chạy lại script nhưng giữ module)
+    """
+    global _cache
+    if _cache is None:
+        _cache = MomentsCache()
+    return _cache
@@ -0,0 +1,315 @@
+# monte_carlo.py
+import os
+from functools import partial
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from covariance import DenseCovariance, as_covariance_operator
+
+BATCH_PATHS = 50_000        # số kịch bản mỗi batch (bộ nhớ ~ BATCH_PATHS x N x 8 byte)
+SKETCH_BINS = 16_384
+PILOT_PATHS = 20_000        # batch thử để chọn khoảng của histogram
+PERIODS_PER_YEAR = 252
+LEVELS = (0.95, 0.99)
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+# ===================== SKETCH =====================
+
+class HistogramSketch:
+    """
+    Histogram cố định khoảng [lo, hi) cộng dồn được (merge = cộng mảng):
+    lưu số lượng + tổng giá trị từng bin, nên quantile sai tối đa 1 bin,
+    CVaR gần như chính xác; giá trị ngoài khoảng vẫn được đếm + cộng tổng
+    """
+
+    def __init__(self, lo, hi, bins=SKETCH_BINS):
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.bins = bins
+        self.width = (self.hi - self.lo) / bins
+        # bin 0 = dưới lo, bin bins + 1 = từ hi trở lên
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.sums = np.zeros(bins + 2)
+        self.sumsq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def update(self, values):
+        idx = np.floor((values - self.lo) / self.width).astype(np.int64) + 1
+        np.clip(idx, 0, self.bins + 1, out=idx)
+        self.counts += np.bincount(idx, minlength=self.bins + 2)
+        self.sums += np.bincount(idx, weights=values, minlength=self.bins + 2)
+        self.sumsq += float(values @ values)
+        if len(values):
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.sums += other.sums
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return float(self.sums.sum() / self.n)
+
+    def std(self):
+        n = self.n
+        return float(np.sqrt(max(self.sumsq - self.sums.sum() ** 2 / n, 0.0) / (n - 1)))
+
+    def _edges(self, i):
+        """
+        Khoảng giá trị của bin i (bin ngoài khoảng dùng min / max thật)
+        """
+        if i == 0:
+            return self.min, self.lo
+        if i == self.bins + 1:
+            return self.hi, self.max
+        return self.lo + (i - 1) * self.width, self.lo + i * self.width
+
+    def quantile(self, q):
+        """
+        Nội suy tuyến tính trong bin chứa quantile q
+        """
+        cum = np.cumsum(self.counts)
+        target = q * cum[-1]
+        i = int(np.searchsorted(cum, target, side="left"))
+        i = min(i, len(cum) - 1)
+        before = cum[i - 1] if i else 0
+        a, b = self._edges(i)
+        frac = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        return float(a + (b - a) * frac)
+
+    def tail_mean(self, q):
+        """
+        Trung bình của q phần nhỏ nhất (bin chứa ngưỡng lấy theo tỷ lệ, với giá trị TB của bin)
+        """
+        cum = np.cumsum(self.counts)
+        k = q * cum[-1]
+        i = int(np.searchsorted(cum, k, side="left"))
+        i = min(i, len(cum) - 1)
+        before = cum[i - 1] if i else 0
+        total = self.sums[:i].sum()
+        if self.counts[i]:
+            total += (k - before) * self.sums[i] / self.counts[i]
+        return float(total / k) if k else float("nan")
+
+    def state(self):
+        return self.counts, self.sums, self.sumsq, self.min, self.max
+
+    @classmethod
+    def from_state(cls, lo, hi, bins, state):
+        sketch = cls(lo, hi, bins)
+        sketch.counts, sketch.sums, sketch.sumsq, sketch.min, sketch.max = state
+        return sketch
+
+
+# ===================== SIMULATION =====================
+
+def _simulate_batch(kind, arrays, n_paths, horizon, rng):
+    """
+    Lợi suất đơn (V_T / V_0 - 1) của danh mục mua-và-giữ sau `horizon` phiên:
+        - parametric: log return cộng dồn của các mã ~ N(H·μ, H·Σ) (cộng H bước i.i.d. chuẩn),
+          lấy mẫu qua Σ = G Gᵀ + diag(d) → H·μ + √H (G z₁ + √d ∘ z₂)
+        - bootstrap : mỗi kịch bản bốc lại H phiên lịch sử (có hoàn lại, giữ tương quan chéo)
+    """
+    w = arrays["weights"]
+    if kind == "parametric":
+        G = arrays["factors"]
+        d_sqrt = arrays["specific_sqrt"]
+        R = rng.standard_normal((n_paths, G.shape[1])) @ G.T
+        if d_sqrt.any():
+            R += rng.standard_normal((n_paths, len(w))) * d_sqrt
+        R *= np.sqrt(horizon)
+        R += horizon * arrays["mu"]
+    else:
+        X = arrays["history"]
+        R = np.zeros((n_paths, X.shape[1]))
+        for _ in range(horizon):
+            R += X[rng.integers(0, len(X), n_paths)]
+
+    np.exp(R, out=R)
+    return R @ w - 1.0
+
+
+_SHARED = {}
+
+
+def _attach(specs):
+    """
+    Initializer của worker: gắn các mảng input trong shared memory (không copy)
+    """
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHARED[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _run_batch(kind, n_paths, seed, horizon, lo, hi, bins, arrays=None):
+    """
+    Chạy 1 batch, trả về trạng thái sketch (không trả về từng kịch bản)
+    """
+    if arrays is None:
+        arrays = {name: arr for name, (_, arr) in _SHARED.items()}
+    rng = np.random.default_rng(seed)
+    return HistogramSketch(lo, hi, bins).update(_simulate_batch(kind, arrays, n_paths, horizon, rng)).state()
+
+
+def _to_shared(arrays):
+    blocks, specs = [], {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        specs[name] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, specs
+
+
+def _sampling_factors(cov):
+    """
+    Σ (theo năm) → (G, √d) với Σ = G Gᵀ + diag(d)
+    Dense (hoặc low-rank có hạng ≥ N, vd Σ mẫu khi T > N): Cholesky của N x N
+    (Σ nửa xác định dương → căn qua trị riêng); low-rank hạng k < N: giữ G (N x k)
+    """
+    cov = as_covariance_operator(cov)
+    if not isinstance(cov, DenseCovariance) and cov.factors.shape[1] < cov.factors.shape[0]:
+        return cov.factors, np.sqrt(cov.specific)
+
+    matrix = cov.to_dense()
+    try:
+        G = np.linalg.cholesky(matrix)
+    except np.linalg.LinAlgError:
+        vals, vecs = np.linalg.eigh(matrix)
+        G = vecs * np.sqrt(np.clip(vals, 0, None))
+    return G, np.zeros(len(G))
+
+
+class MonteCarloResult(NamedTuple):
+    method: str
+    n_paths: int
+    horizon: int                # số phiên
+    mean: float                 # lợi suất đơn trung bình sau horizon
+    std: float
+    quantiles: dict             # {q: lợi suất}
+    var: dict                   # {mức tin cậy: VaR} (số dương = lỗ)
+    cvar: dict                  # {mức tin cậy: CVaR / expected shortfall}
+    sketch: HistogramSketch
+
+    def table(self):
+        rows = {f"q{q:g}": v for q, v in self.quantiles.items()}
+        rows.update({f"VaR {lvl:.0%}": v for lvl, v in self.var.items()})
+        rows.update({f"CVaR {lvl:.0%}": v for lvl, v in self.cvar.items()})
+        return pd.Series(rows, name=f"{self.horizon} phiên")
+
+
+def simulate_portfolio(
+    weights,
+    expected_returns=None,
+    cov=None,
+    history: pd.DataFrame = None,
+    method: str = "parametric",
+    n_paths: int = 1_000_000,
+    horizon: int = 21,
+    seed: int = 0,
+    workers: int = None,
+    batch_paths: int = BATCH_PATHS,
+    bins: int = SKETCH_BINS,
+    periods_per_year: float = PERIODS_PER_YEAR
+) -> MonteCarloResult:
+    """
+    Mô phỏng Monte Carlo danh mục sau tối ưu:
+        - method="parametric": từ μ, Σ theo năm (chia periods_per_year ra theo phiên)
+        - method="bootstrap" : bốc lại log return lịch sử (history, cột theo weights)
+
+    Kịch bản chạy theo batch vector hóa trên process pool (workers=None → số CPU);
+    input nằm trong shared memory, mỗi batch có seed riêng từ SeedSequence(seed).spawn
+    → cùng seed cho cùng kết quả bất kể số worker. Kết quả từng batch được gộp ngay
+    vào histogram sketch, bộ nhớ không phụ thuộc n_paths.
+    """
+    if n_paths < 1:
+        raise ValueError(f"n_paths phải >= 1: {n_paths}")
+    if horizon < 1:
+        raise ValueError(f"horizon phải >= 1: {horizon}")
+
+    w = np.asarray(weights, dtype=np.float64)
+    if method == "parametric":
+        if expected_returns is None or cov is None:
+            raise ValueError("parametric cần expected_returns và cov")
+        G, d_sqrt = _sampling_factors(cov)
+        scale = 1.0 / np.sqrt(periods_per_year)
+        arrays = {
+            "weights": w,
+            "mu": np.asarray(expected_returns, dtype=np.float64) / periods_per_year,
+            "factors": G * scale,
+            "specific_sqrt": d_sqrt * scale,
+        }
+    elif method == "bootstrap":
+        if history is None:
+            raise ValueError("bootstrap cần history (log return lịch sử)")
+        X = history.to_numpy(dtype=np.float64) if isinstance(history, pd.DataFrame) else np.asarray(history, dtype=np.float64)
+        X = X[~np.isnan(X).any(axis=1)]
+        if not len(X):
+            raise ValueError("history không có phiên nào đủ dữ liệu")
+        arrays = {"weights": w, "history": X}
+    else:
+        raise ValueError(f"method không hợp lệ: {method}")
+
+    root = np.random.SeedSequence(seed)
+    pilot_seed, batch_root = root.spawn(2)
+
+    # Khoảng histogram từ 1 batch thử, nới rộng 2 phía (ngoài khoảng vẫn đếm đúng)
+    pilot = _simulate_batch(method, arrays, min(PILOT_PATHS, n_paths), horizon, np.random.default_rng(pilot_seed))
+    span = max(pilot.max() - pilot.min(), 1e-9)
+    lo, hi = pilot.min() - span, pilot.max() + span
+
+    sizes = [batch_paths] * (n_paths // batch_paths)
+    if n_paths % batch_paths:
+        sizes.append(n_paths % batch_paths)
+    seeds = batch_root.spawn(len(sizes))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(sizes)))
+
+    # Gộp theo đúng thứ tự batch (map trả kết quả theo thứ tự) → tổng float giống hệt
+    # nhau với mọi số worker
+    sketch = HistogramSketch(lo, hi, bins)
+    run = partial(_run_batch, method, horizon=horizon, lo=lo, hi=hi, bins=bins)
+    blocks = []
+    try:
+        if workers == 1:
+            for state in map(partial(run, arrays=arrays), sizes, seeds):
+                sketch.merge(HistogramSketch.from_state(lo, hi, bins, state))
+        else:
+            blocks, specs = _to_shared(arrays)
+            with ProcessPoolExecutor(workers, initializer=_attach, initargs=(specs,)) as pool:
+                for state in pool.map(run, sizes, seeds):
+                    sketch.merge(HistogramSketch.from_state(lo, hi, bins, state))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return MonteCarloResult(
+        method=method,
+        n_paths=sketch.n,
+        horizon=horizon,
+        mean=sketch.mean(),
+        std=sketch.std(),
+        quantiles={q: sketch.quantile(q) for q in QUANTILES},
+        var={lvl: -sketch.quantile(1 - lvl) for lvl in LEVELS},
+        cvar={lvl: -sketch.tail_mean(1 - lvl) for lvl in LEVELS},
+        sketch=sketch
+    )
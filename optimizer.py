@@ -1,46 +1,115 @@
 # optimizer2.py
+import time
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 
+from covariance import as_covariance_operator
 
-def optimize_capm_portfolio(
-    expected_returns: pd.Series,
-    cov: pd.DataFrame,
-    rf: float,
-    allow_short: bool = False
-) -> pd.Series:
+try:
+    import cvxpy as cp
+except ImportError:  # cvxpy là tùy chọn, thiếu thì dùng SLSQP
+    cp = None
+
+# Lỗi của 1 solver → thử solver kế tiếp
+_SOLVER_ERRORS = (np.linalg.LinAlgError, RuntimeError, ValueError, ArithmeticError)
+if cp is not None:
+    _SOLVER_ERRORS += (cp.error.SolverError,)
+
+# D = AC - B² nhỏ hơn ngưỡng này (tương đối so với AC) coi như μ không phân tán
+_FRONTIER_DEGENERATE_TOL = 1e-10
+
+# Interior-point (Clarabel) hội tụ sau ~10 vòng, nhanh hơn OSQP ở n lớn
+QP_SOLVER = "CLARABEL" if cp is not None and "CLARABEL" in cp.installed_solvers() else None
+
+# Rổ nhỏ: SLSQP nhanh hơn chi phí dựng bài toán cvxpy (~10 ms)
+QP_MIN_ASSETS = 50
+
+
+# ===================== SOLVERS =====================
+
+def _sharpe(w, mu, Sigma, rf):
+    vol = np.sqrt(max(Sigma.quad_form(w), 0.0))
+    return (w @ mu - rf) / vol if vol > 1e-10 else 0.0
+
+
+def _solve_analytic(mu, Sigma, rf):
     """
-    Excel Solver 1–1:
-    Max Sharpe = (w^T μ - rf) / sqrt(w^T Σ w)
+    Danh mục tiếp tuyến (cho phép bán khống):
+    w = Σ⁻¹(μ - rf) / 1ᵀΣ⁻¹(μ - rf)
     """
+    y = Sigma.solve(mu - rf)
+    s = y.sum()
 
-    mu = expected_returns.values
-    Sigma = cov.values
+    # Mẫu số <= 0 nghĩa là nghiệm là danh mục Sharpe nhỏ nhất → không dùng được
+    if not np.isfinite(s) or s <= 0:
+        raise np.linalg.LinAlgError("Không tồn tại danh mục tiếp tuyến (1ᵀΣ⁻¹(μ - rf) <= 0)")
+
+    return y / s, 0
+
+
+def _solve_qp(mu, Sigma, rf):
+    """
+    Max Sharpe long-only ⇔ QP lồi (Cornuejols & Tütüncü):
+        min yᵀΣy  s.t. (μ - rf)ᵀy = 1, y >= 0
+        w = y / 1ᵀy
+    """
+    if cp is None:
+        raise RuntimeError("Chưa cài cvxpy")
+
+    excess = mu - rf
+    if not (excess > 0).any():
+        raise RuntimeError("Không có tài sản nào có lợi suất vượt rf")
+
+    y = cp.Variable(len(mu))
+    prob = cp.Problem(
+        cp.Minimize(Sigma.cvx_quad_form(y)),
+        [excess @ y == 1, y >= 0]
+    )
+    prob.solve(solver=QP_SOLVER)
+
+    if prob.status not in ("optimal", "optimal_inaccurate") or y.value is None:
+        raise RuntimeError(f"QP không hội tụ: {prob.status}")
+
+    w = np.clip(y.value, 0, None)
+    iterations = prob.solver_stats.num_iters if prob.solver_stats else None
+    return w / w.sum(), iterations
+
+
+def _solve_slsqp(mu, Sigma, rf, allow_short, x0=None):
+    """
+    Excel Solver 1–1: SLSQP trên -Sharpe, có gradient giải tích
+    """
     n = len(mu)
 
     def negative_sharpe(w):
         port_return = np.dot(w, mu)
-        port_var = w.T @ Sigma @ w
+        Sw = Sigma.matvec(w)
+        port_var = w @ Sw
         port_vol = np.sqrt(port_var)
 
         if port_vol <= 1e-10:
-            return 1e6
+            return 1e6, np.zeros(n)
 
-        sharpe = (port_return - rf) / port_vol
-        return -sharpe
+        excess = port_return - rf
+        sharpe = excess / port_vol
+        # ∂S/∂w = μ/σ - (wᵀμ - rf) Σw / σ³
+        grad = mu / port_vol - excess * Sw / port_vol ** 3
+        return -sharpe, -grad
 
     constraints = [
-        {"type": "eq", "fun": lambda w: np.sum(w) - 1}
+        {"type": "eq", "fun": lambda w: np.sum(w) - 1, "jac": lambda w: np.ones(n)}
     ]
 
     bounds = None if allow_short else [(0.0, 1.0)] * n
 
-    x0 = np.ones(n) / n  # giống Excel
+    if x0 is None:
+        x0 = np.ones(n) / n  # giống Excel
 
     res = minimize(
         negative_sharpe,
         x0,
+        jac=True,
         method="SLSQP",
         bounds=bounds,
         constraints=constraints,
@@ -50,8 +119,250 @@ def optimize_capm_portfolio(
     if not res.success:
         raise RuntimeError(res.message)
 
-    w = res.x
-    w = np.clip(w, 0, None)
+    return res.x, res.nit
+
+
+# ===================== PUBLIC API =====================
+
+def optimize_capm_portfolio(
+    expected_returns: pd.Series,
+    cov,
+    rf: float,
+    allow_short: bool = False,
+    method: str = "auto",
+    return_info: bool = False,
+    x0=None
+):
+    """
+    Excel Solver 1–1:
+    Max Sharpe = (w^T μ - rf) / sqrt(w^T Σ w)
+
+    cov: DataFrame N x N (dense) hoặc covariance operator
+    (covariance.LowRankCovariance) – khi đó không tạo ma trận N x N
+
+    method:
+        - "auto"     : bán khống → analytic, long-only → qp (rổ nhỏ → slsqp),
+                       solver lỗi thì lùi về solver còn lại
+        - "analytic" : Σ⁻¹(μ - rf) (chỉ khi allow_short=True)
+        - "qp"       : QP lồi qua cvxpy (chỉ khi allow_short=False)
+        - "slsqp"    : SLSQP với gradient giải tích
+
+    x0: tỷ trọng khởi tạo cho SLSQP (warm start, vd tỷ trọng kỳ trước khi tái cân bằng);
+    None → 1/n như Excel
+
+    return_info=True → trả về (weights, info) với info gồm
+    solver, iterations, solve_time (giây), sharpe
+    """
+
+    mu = expected_returns.values
+    Sigma = as_covariance_operator(cov)
+
+    if method == "auto":
+        if allow_short:
+            candidates = ["analytic", "slsqp"]
+        elif len(mu) < QP_MIN_ASSETS:
+            candidates = ["slsqp", "qp"]
+        else:
+            candidates = ["qp", "slsqp"]
+    elif method in ("analytic", "qp", "slsqp"):
+        candidates = [method]
+    else:
+        raise ValueError(f"method không hợp lệ: {method}")
+
+    if allow_short and "qp" in candidates:
+        raise ValueError("method='qp' chỉ dùng cho long-only")
+    if not allow_short and "analytic" in candidates:
+        raise ValueError("method='analytic' chỉ dùng khi allow_short=True")
+
+    t0 = time.perf_counter()
+    for i, solver in enumerate(candidates):
+        try:
+            if solver == "analytic":
+                w, iterations = _solve_analytic(mu, Sigma, rf)
+            elif solver == "qp":
+                w, iterations = _solve_qp(mu, Sigma, rf)
+            else:
+                w, iterations = _solve_slsqp(mu, Sigma, rf, allow_short, x0)
+            break
+        except _SOLVER_ERRORS as e:
+            if i == len(candidates) - 1:
+                raise RuntimeError(str(e)) from e
+    solve_time = time.perf_counter() - t0
+
+    if not allow_short:
+        w = np.clip(w, 0, None)
     w = w / w.sum()
 
-    return pd.Series(w, index=expected_returns.index)
+    weights = pd.Series(w, index=expected_returns.index)
+
+    if return_info:
+        info = {
+            "solver": solver,
+            "iterations": iterations,
+            "solve_time": solve_time,
+            "sharpe": float(_sharpe(w, mu, Sigma, rf))
+        }
+        return weights, info
+
+    return weights
+
+
+# ===================== EFFICIENT FRONTIER =====================
+
+def frontier_dtype(n):
+    """
+    1 điểm biên: lợi suất, độ lệch chuẩn, tỷ trọng (n mã)
+    """
+    return np.dtype([("ret", "f8"), ("vol", "f8"), ("weights", "f8", (n,))])
+
+
+def _frontier_closed_form(mu, Sigma, targets):
+    """
+    Cho phép bán khống: w(t) là tổ hợp của Σ⁻¹1 và Σ⁻¹μ (chỉ giải Σ 2 lần)
+    """
+    n = len(mu)
+    inv_one = Sigma.solve(np.ones(n))
+    inv_mu = Sigma.solve(mu)
+
+    A = inv_one.sum()
+    B = mu @ inv_one
+    C = mu @ inv_mu
+    D = A * C - B * B
+
+    t = np.asarray(targets)[:, None]
+
+    # D = A·(phương sai có trọng số Σ⁻¹ của μ) → ~0 khi mọi μ bằng nhau:
+    # đường biên suy biến thành 1 điểm, trả danh mục phương sai nhỏ nhất cho mọi target
+    if D <= _FRONTIER_DEGENERATE_TOL * abs(A * C):
+        return np.tile(inv_one / A, (len(t), 1))
+
+    return ((C - t * B) * inv_one + (t * A - B) * inv_mu) / D
+
+
+def _frontier_qp(mu, Sigma, targets):
+    """
+    Long-only: dựng QP 1 lần với target là cp.Parameter, các điểm sau chỉ đổi
+    giá trị target → không canonicalize lại. CLARABEL (interior point) không warm start
+    được; OSQP warm start + giữ phân rã KKT vẫn chậm hơn (~2 lần ở 300 mã, 30 điểm)
+    và không hội tụ ở các target gần max(μ)
+    """
+    n = len(mu)
+    w = cp.Variable(n)
+    target = cp.Parameter()
+    prob = cp.Problem(
+        cp.Minimize(Sigma.cvx_quad_form(w)),
+        [cp.sum(w) == 1, w >= 0, mu @ w == target]
+    )
+
+    out = np.empty((len(targets), n))
+    for i, t in enumerate(targets):
+        target.value = t
+        prob.solve(solver=QP_SOLVER)
+        if prob.status not in ("optimal", "optimal_inaccurate") or w.value is None:
+            raise RuntimeError(f"QP không hội tụ tại E(R) = {t:.4f}: {prob.status}")
+        out[i] = w.value
+    return out
+
+
+def _frontier_slsqp(mu, Sigma, targets):
+    """
+    Long-only không có cvxpy: SLSQP, mỗi điểm khởi tạo từ nghiệm điểm trước
+    """
+    n = len(mu)
+
+    def variance(w):
+        Sw = Sigma.matvec(w)
+        return w @ Sw, 2 * Sw
+
+    out = np.empty((len(targets), n))
+    x0 = np.ones(n) / n
+    for i, t in enumerate(targets):
+        res = minimize(
+            variance,
+            x0,
+            jac=True,
+            method="SLSQP",
+            bounds=[(0.0, 1.0)] * n,
+            constraints=[
+                {"type": "eq", "fun": lambda w: np.sum(w) - 1, "jac": lambda w: np.ones(n)},
+                {"type": "eq", "fun": lambda w, t=t: mu @ w - t, "jac": lambda w: mu}
+            ],
+            options={"ftol": 1e-12, "maxiter": 1000}
+        )
+        if not res.success:
+            raise RuntimeError(res.message)
+        out[i] = res.x
+        x0 = res.x
+    return out
+
+
+def _min_variance_return(mu, Sigma, allow_short):
+    """
+    Lợi suất của danh mục phương sai nhỏ nhất (điểm đầu của đường biên)
+    """
+    n = len(mu)
+    if allow_short:
+        w = Sigma.solve(np.ones(n))
+        return mu @ (w / w.sum())
+
+    if cp is not None:
+        w = cp.Variable(n)
+        cp.Problem(cp.Minimize(Sigma.cvx_quad_form(w)), [cp.sum(w) == 1, w >= 0]).solve(solver=QP_SOLVER)
+        if w.value is not None:
+            return mu @ np.clip(w.value, 0, None) / np.clip(w.value, 0, None).sum()
+
+    res = minimize(
+        lambda w: (w @ Sigma.matvec(w), 2 * Sigma.matvec(w)),
+        np.ones(n) / n,
+        jac=True,
+        method="SLSQP",
+        bounds=[(0.0, 1.0)] * n,
+        constraints=[{"type": "eq", "fun": lambda w: np.sum(w) - 1}],
+        options={"ftol": 1e-12, "maxiter": 1000}
+    )
+    if not res.success:
+        raise RuntimeError(res.message)
+    return mu @ res.x
+
+
+def efficient_frontier(
+    expected_returns: pd.Series,
+    cov,
+    n_points: int = 50,
+    allow_short: bool = False,
+    min_return: float = None,
+    max_return: float = None
+) -> np.ndarray:
+    """
+    Đường biên hiệu quả Markowitz trong 1 lần gọi:
+        min wᵀΣw  s.t. 1ᵀw = 1, μᵀw = target (+ w >= 0 nếu long-only)
+
+    - bán khống  : nghiệm đóng từ Σ⁻¹1 và Σ⁻¹μ
+    - long-only  : QP tham số hóa (cvxpy, dựng 1 lần), không có cvxpy → SLSQP warm start
+
+    Target mặc định chạy từ lợi suất danh mục phương sai nhỏ nhất tới max(μ).
+    Trả về structured ndarray (n_points,) với các trường ret, vol, weights.
+    """
+    mu = expected_returns.values.astype(np.float64)
+    Sigma = as_covariance_operator(cov)
+
+    lo = _min_variance_return(mu, Sigma, allow_short) if min_return is None else min_return
+    hi = mu.max() if max_return is None else max_return
+    targets = np.linspace(lo, hi, n_points)
+
+    if allow_short:
+        W = _frontier_closed_form(mu, Sigma, targets)
+    elif cp is not None:
+        W = _frontier_qp(mu, Sigma, targets)
+    else:
+        W = _frontier_slsqp(mu, Sigma, targets)
+
+    if not allow_short:
+        W = np.clip(W, 0, None)
+        W = W / W.sum(axis=1, keepdims=True)
+
+    out = np.empty(len(targets), dtype=frontier_dtype(len(mu)))
+    out["weights"] = W
+    out["ret"] = W @ mu
+    out["vol"] = np.sqrt([Sigma.quad_form(w) for w in W])
+    return out
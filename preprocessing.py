@@ -1,33 +1,108 @@
 # processing.py
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 
+from covariance import LowRankCovariance, single_index_operator
 
-def calculate_log_returns(price_df: pd.DataFrame) -> pd.DataFrame:
+
+def calculate_log_returns(price_df: pd.DataFrame, dropna: bool = True) -> pd.DataFrame:
     """
     Log return giống Excel: ln(Pt / Pt-1)
+
+    dropna=True  → bỏ mọi ngày có NaN ở bất kỳ mã nào (như cũ)
+    dropna=False → giữ NaN theo từng cột: mã niêm yết muộn không làm mất lịch sử
+                   của các mã khác (estimate_capm_regression bỏ NaN theo từng cột)
+
+    Tính trong 1 buffer (chia rồi log tại chỗ), không tạo frame shift / frame trung gian
     """
-    log_returns = np.log(price_df / price_df.shift(1))
-    return log_returns.dropna(how="any")
+    P = price_df.to_numpy(dtype=np.float64)
+    out = np.empty_like(P)
+    if len(P):
+        out[0] = np.nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(P[1:], P[:-1], out=out[1:])
+            np.log(out, out=out)
 
+    index = price_df.index
+    if dropna:
+        keep = ~np.isnan(out).any(axis=1) if out.ndim == 2 else ~np.isnan(out)
+        out = out[keep]
+        index = index[keep]
 
-def estimate_betas(stock_returns: pd.DataFrame, market_returns: pd.Series) -> pd.Series:
+    if isinstance(price_df, pd.Series):
+        return pd.Series(out, index=index, name=price_df.name)
+    return pd.DataFrame(out, index=index, columns=price_df.columns)
+
+
+def estimate_capm_regression(
+    stock_returns: pd.DataFrame,
+    market_returns: pd.Series
+) -> pd.DataFrame:
     """
-    Ước lượng beta từng cổ phiếu theo CAPM:
+    Hồi quy CAPM cho TẤT CẢ cổ phiếu trong 1 lần tính ma trận:
     Ri = alpha + beta * Rm
+
+    - beta = cov(Ri, Rm) / var(Rm)
+    - NaN được bỏ theo từng cột (mã niêm yết muộn không làm mất dữ liệu mã khác)
+
+    Trả về DataFrame (index = mã):
+        beta, alpha, r2, resid_var (phương sai phần dư, ddof=2), n_obs
     """
-    betas = {}
+    Y = stock_returns.to_numpy(dtype=np.float64)
+    x = market_returns.reindex(stock_returns.index).to_numpy(dtype=np.float64)
+
+    mask = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    n = mask.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if mask.all():
+            # Không có NaN: 1 phép nhân ma trận dxᵀ · dY
+            dx = x - x.mean()
+            dy = Y - Y.mean(axis=0)
+            mean_x = np.full(Y.shape[1], x.mean())
+            mean_y = Y.mean(axis=0)
 
-    X = market_returns.values.reshape(-1, 1)
+            sxy = dx @ dy
+            sxx = np.full(Y.shape[1], dx @ dx)
+            syy = np.einsum("tn,tn->n", dy, dy)
+        else:
+            Y0 = np.where(mask, Y, 0.0)
+            X0 = np.where(mask, x[:, None], 0.0)
 
-    for symbol in stock_returns.columns:
-        y = stock_returns[symbol].values
-        model = LinearRegression()
-        model.fit(X, y)
-        betas[symbol] = model.coef_[0]
+            mean_y = Y0.sum(axis=0) / n
+            mean_x = X0.sum(axis=0) / n
 
-    return pd.Series(betas)
+            # Tâm hóa theo từng cột (giống LinearRegression) để giữ độ chính xác
+            dy = np.where(mask, Y0 - mean_y, 0.0)
+            dx = np.where(mask, X0 - mean_x, 0.0)
+
+            sxy = np.einsum("tn,tn->n", dx, dy)
+            sxx = np.einsum("tn,tn->n", dx, dx)
+            syy = np.einsum("tn,tn->n", dy, dy)
+
+        beta = sxy / sxx
+        alpha = mean_y - beta * mean_x
+        r2 = sxy * sxy / (sxx * syy)
+        resid_var = (syy - beta * sxy) / (n - 2)
+
+    return pd.DataFrame(
+        {
+            "beta": beta,
+            "alpha": alpha,
+            "r2": r2,
+            "resid_var": resid_var,
+            "n_obs": n
+        },
+        index=stock_returns.columns
+    )
+
+
+def estimate_betas(stock_returns: pd.DataFrame, market_returns: pd.Series) -> pd.Series:
+    """
+    Ước lượng beta từng cổ phiếu theo CAPM:
+    Ri = alpha + beta * Rm
+    """
+    return estimate_capm_regression(stock_returns, market_returns)["beta"].rename(None)
 
 
 def estimate_market_parameters(market_returns: pd.Series):
@@ -60,13 +135,26 @@ def capm_covariance_matrix(
     market_variance: float
 ) -> pd.DataFrame:
     """
-    Σ = β βᵀ σ²(M)
+    Σ = β βᵀ σ²(M) dạng ma trận N x N (covariance.single_index_operator)
     """
-    beta_vec = betas.values.reshape(-1, 1)
-    cov = market_variance * (beta_vec @ beta_vec.T)
+    cov = single_index_operator(betas.values, market_variance).to_dense()
 
     return pd.DataFrame(
         cov,
         index=betas.index,
         columns=betas.index
     )
+
+
+def capm_covariance_operator(
+    betas: pd.Series,
+    market_variance: float,
+    specific_variance: pd.Series = None
+) -> LowRankCovariance:
+    """
+    Σ = β βᵀ σ²(M) + diag(σ²(ε)) dạng operator (không tạo ma trận N x N)
+    specific_variance: phương sai phần dư từng mã (vd: resid_var của
+    estimate_capm_regression); None → giống capm_covariance_matrix
+    """
+    specific = None if specific_variance is None else specific_variance.reindex(betas.index).values
+    return single_index_operator(betas.values, market_variance, specific, betas.index)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(__file__)
+PRICE_DIR = os.path.join(BASE_DIR, "price_offline")
+STORE_DIR = os.path.join(PRICE_DIR, "_store")
+CLOSE_SUFFIX = "_close_2022_now.csv"
+
+DATES_FILE = "dates.npy"
+CLOSE_FILE = "close.npy"
+MANIFEST_FILE = "manifest.json"
+
+# Quét lại thư mục CSV nguồn tối đa 1 lần / FRESHNESS_TTL giây (đặt STORE_FRESHNESS_TTL để đổi)
+FRESHNESS_TTL = float(os.environ.get("STORE_FRESHNESS_TTL", 2.0))
+
+
+# ===================== INGEST =====================
+
+def _scan_close_files(price_dir):
+    """
+    Liệt kê các file giá đóng cửa: {symbol: (path, mtime)}
+    """
+    files = {}
+    if not os.path.isdir(price_dir):
+        return files
+
+    for entry in os.scandir(price_dir):
+        if entry.is_file() and entry.name.endswith(CLOSE_SUFFIX):
+            symbol = entry.name[:-len(CLOSE_SUFFIX)]
+            files[symbol] = (entry.path, entry.stat().st_mtime)
+
+    return files
+
+
+def write_price_store(dates, symbols, close, store_dir=STORE_DIR, source_mtime=0.0):
+    """
+    Ghi panel giá dạng cột:
+        - dates.npy : trục thời gian chung, int64 (ns từ epoch), tăng dần
+        - close.npy : ma trận float32 (T x N), Fortran-order (mỗi mã 1 cột liền mạch)
+        - manifest.json : danh sách mã + thông tin nguồn
+    """
+    os.makedirs(store_dir, exist_ok=True)
+
+    dates = np.ascontiguousarray(dates, dtype=np.int64)
+    close = np.asfortranarray(close, dtype=np.float32)
+
+    if close.shape != (len(dates), len(symbols)):
+        raise ValueError("Kích thước ma trận giá không khớp với dates/symbols")
+
+    # Ghi ra file tạm rồi os.replace để reader không đọc phải file dở dang
+    for name, arr in [(DATES_FILE, dates), (CLOSE_FILE, close)]:
+        tmp = os.path.join(store_dir, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(store_dir, name))
+
+    manifest = {
+        "symbols": list(symbols),
+        "source_mtime": source_mtime,
+    }
+    tmp = os.path.join(store_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(store_dir, MANIFEST_FILE))
+
+
+def build_price_store(price_dir=PRICE_DIR, store_dir=STORE_DIR):
+    """
+    Ingest 1 lần: đọc toàn bộ {SYMBOL}_close_2022_now.csv
+    và gộp thành 1 panel giá dùng chung trục thời gian
+    """
+    files = _scan_close_files(price_dir)
+    symbols = sorted(files)
+
+    series = []
+    for sym in symbols:
+        df = pd.read_csv(files[sym][0])
+        s = pd.Series(
+            df["close_price"].values,
+            index=pd.to_datetime(df["date"]),
+            name=sym
+        )
+        series.append(s[~s.index.duplicated(keep="last")])
+
+    if series:
+        panel = pd.concat(series, axis=1, join="outer").sort_index()
+        dates = panel.index.values.astype("datetime64[ns]").view(np.int64)
+        close = panel.values
+    else:
+        dates = np.empty(0, dtype=np.int64)
+        close = np.empty((0, 0), dtype=np.float32)
+
+    source_mtime = max((m for _, m in files.values()), default=0.0)
+
+    # Windows không cho os.replace file đang được memory-map → bỏ memmap của store cũ trước
+    cached = _STORES.pop(store_dir, None)
+    if cached is not None:
+        cached.release()
+    write_price_store(dates, symbols, close, store_dir, source_mtime)
+
+    return load_price_store(store_dir)
+
+
+# ===================== STORE =====================
+
+class PriceStore:
+    """
+    Panel giá memory-mapped: dates (T,) int64 + close (T, N) float32
+    """
+
+    def __init__(self, dates, close, symbols, source_mtime=0.0):
+        self.dates = dates
+        self.close = close
+        self.symbols = list(symbols)
+        self.source_mtime = source_mtime
+        self.columns = {s: i for i, s in enumerate(self.symbols)}
+
+    def __contains__(self, symbol):
+        return symbol in self.columns
+
+    def release(self):
+        """
+        Bỏ tham chiếu tới memmap (file được unmap khi không còn ai giữ) để ghi đè được
+        dates.npy / close.npy; store đã release không dùng được nữa
+        """
+        self.dates = None
+        self.close = None
+
+    def row_range(self, start=None, end=None):
+        """
+        Tìm khoảng dòng [r0, r1) bằng binary search trên trục thời gian
+        (start, end đều tính cả 2 đầu, giống bản đọc CSV)
+        """
+        r0 = 0
+        r1 = len(self.dates)
+        if start:
+            r0 = int(np.searchsorted(self.dates, pd.Timestamp(start).value, side="left"))
+        if end:
+            r1 = int(np.searchsorted(self.dates, pd.Timestamp(end).value, side="right"))
+        return r0, max(r0, r1)
+
+    def frame(self, symbols, start=None, end=None):
+        """
+        Cắt panel theo mã + thời gian, trả về DataFrame giống bản outer join:
+            - bỏ mã không có dữ liệu trong khoảng thời gian
+            - chỉ giữ các ngày mà ít nhất 1 mã có giá
+        Chọn cột / dòng trên memmap không copy; DataFrame trả về là 1 bản copy float64
+        (dòng x mã được chọn, không phải cả panel) để khớp dtype của bản đọc CSV
+        """
+        r0, r1 = self.row_range(start, end)
+
+        cols = []
+        names = []
+        for sym in symbols:
+            j = self.columns.get(sym)
+            if j is None:
+                continue
+            # View liền mạch trên memmap (không copy)
+            col = self.close[r0:r1, j]
+            if np.isnan(col).all():
+                continue
+            cols.append(col)
+            names.append(sym)
+
+        if not cols:
+            return None
+
+        values = np.column_stack(cols).astype(np.float64)
+        keep = ~np.isnan(values).all(axis=1)
+
+        index = pd.DatetimeIndex(self.dates[r0:r1][keep].astype("datetime64[ns]"), name="date")
+        return pd.DataFrame(values[keep], index=index, columns=names)
+
+
+def load_price_store(store_dir=STORE_DIR):
+    """
+    Mở panel giá ở chế độ memory-map (không đọc toàn bộ vào RAM)
+    """
+    with open(os.path.join(store_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    dates = np.load(os.path.join(store_dir, DATES_FILE), mmap_mode="r")
+    close = np.load(os.path.join(store_dir, CLOSE_FILE), mmap_mode="r")
+
+    return PriceStore(dates, close, manifest["symbols"], manifest.get("source_mtime", 0.0))
+
+
+class FreshnessCheck:
+    """
+    Nhớ lần quét thư mục nguồn gần nhất của mỗi store: trong FRESHNESS_TTL giây và mtime
+    thư mục không đổi (không thêm / xóa / đổi tên file) thì bỏ qua scandir + stat từng file,
+    chỉ còn 1 lần stat thư mục. Sửa nội dung file tại chỗ được phát hiện sau TTL.
+    """
+
+    def __init__(self):
+        self._seen = {}
+
+    @staticmethod
+    def dir_mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def fresh(self, key, price_dir):
+        seen = self._seen.get(key)
+        return (
+            seen is not None
+            and time.monotonic() - seen[1] < FRESHNESS_TTL
+            and seen[0] == self.dir_mtime(price_dir)
+        )
+
+    def mark(self, key, dir_mtime):
+        # dir_mtime lấy TRƯỚC khi quét: file thêm vào trong lúc quét → lần sau quét lại
+        self._seen[key] = (dir_mtime, time.monotonic())
+
+
+_STORES = {}
+_freshness = FreshnessCheck()
+
+
+def get_price_store(price_dir=PRICE_DIR, store_dir=STORE_DIR):
+    """
+    Trả về panel giá dùng chung cho cả process.
+    Tự ingest lại nếu chưa có store hoặc file CSV nguồn thay đổi.
+    """
+    store = _STORES.get(store_dir)
+    if store is not None and _freshness.fresh((price_dir, store_dir), price_dir):
+        return store
+
+    dir_mtime = FreshnessCheck.dir_mtime(price_dir)
+    files = _scan_close_files(price_dir)
+    source_mtime = max((m for _, m in files.values()), default=0.0)
+
+    if store is None or store.source_mtime < source_mtime or set(files) - set(store.symbols):
+        try:
+            store = load_price_store(store_dir)
+        except (OSError, ValueError, KeyError):
+            store = None
+
+        if store is None or store.source_mtime < source_mtime or set(files) - set(store.symbols):
+            if store is not None:
+                store.release()
+            store = build_price_store(price_dir, store_dir)
+
+        _STORES[store_dir] = store
+
+    _freshness.mark((price_dir, store_dir), dir_mtime)
+    return store
+
+
+if __name__ == "__main__":
+    store = build_price_store()
+    print(f"✅ Đã tạo price store: {len(store.symbols)} mã x {len(store.dates)} ngày → {STORE_DIR}")
@@ -0,0 +1,256 @@
+# query_parser.py
+import re
+from typing import List, NamedTuple, Optional
+
+# ===================== VOCABULARY =====================
+
+# Từ khóa intent (cùng thứ tự ưu tiên với bản cũ trong intent_router)
+FINANCE_KEYWORDS = [
+    "cổ phiếu", "ngành", "ngân hàng", "bất động", "thép", "chứng khoán",
+    "roa", "de", "d/e", "p/b", "pb", "doanh thu", "lợi nhuận",
+    "báo cáo", "vốn hóa", "so sánh", "top", "xếp hạng",
+    "chiến lược", "rủi ro", "chu kỳ"
+]
+COMPARISON_KEYWORDS = ["so sánh", "vs", "với"]
+RANKING_KEYWORDS = ["top", "xếp hạng", "cao nhất", "thấp nhất"]
+RATIO_KEYWORDS = ["roa", "d/e", "de", "p/b", "pb", "đòn bẩy"]
+STATEMENT_KEYWORDS = ["báo cáo tài chính", "bctc"]
+REPORT_KEYWORDS = ["báo cáo", "doanh thu", "chiến lược", "rủi ro"]
+SECTOR_KEYWORDS = ["chu kỳ", "toàn ngành", "triển vọng"]
+
+# Bit cờ intent
+DOMAIN, COMPARISON, RANKING, RATIO, STATEMENT, REPORT, SECTOR = (1 << i for i in range(7))
+
+INTENT_KEYWORDS = [
+    (DOMAIN, FINANCE_KEYWORDS),
+    (COMPARISON, COMPARISON_KEYWORDS),
+    (RANKING, RANKING_KEYWORDS),
+    (RATIO, RATIO_KEYWORDS),
+    (STATEMENT, STATEMENT_KEYWORDS),
+    (REPORT, REPORT_KEYWORDS),
+    (SECTOR, SECTOR_KEYWORDS),
+]
+
+INDUSTRY_KEYWORDS = {
+    "bia": "bia và đồ uống",
+    "đồ uống": "bia và đồ uống",
+    "ngân hàng": "ngân hàng",
+    "bank": "ngân hàng",
+    "y tế": "thiết bị và dịch vụ y tế",
+    "dược": "dược phẩm",
+    "bệnh viện": "thiết bị và dịch vụ y tế",
+    "bán lẻ": "bán lẻ",
+    "bảo hiểm nhân thọ": "bảo hiểm nhân thọ",
+    "nhân thọ": "bảo hiểm nhân thọ",
+    "bảo hiểm": "bảo hiểm phi nhân thọ",
+    "chứng khoán": "dịch vụ tài chính",
+    "tài chính": "dịch vụ tài chính",
+    "xây dựng": "xây dựng và vật liệu",
+    "vật liệu": "xây dựng và vật liệu",
+    "điện": "sản xuất & phân phối điện",
+    "dầu khí": "sản xuất dầu khí",
+    "viễn thông": "viễn thông di động",
+    "thép": "kim loại",
+    "kim loại": "kim loại",
+    "hóa chất": "hóa chất",
+    "khai khoáng": "khai khoáng",
+    "vận tải": "vận tải",
+    "ô tô": "ô tô và phụ tùng",
+    "xe": "ô tô và phụ tùng",
+    "phần mềm": "phần mềm & dịch vụ máy tính",
+    "cntt": "phần mềm & dịch vụ máy tính",
+    "thực phẩm": "sản xuất thực phẩm",
+    "truyền thông": "truyền thông",
+    "thuốc lá": "thuốc lá",
+    "điện tử": "điện tử & thiết bị điện",
+}
+
+FACTOR_MAP = {
+    "roa": "ROA",
+    "roe": "ROE",
+    "de": "DE",
+    "d/e": "DE",
+    "pb": "PB",
+    "p/b": "PB",
+    "eps": "EPS",
+    "bv": "BV",
+    "giá trị sổ sách": "BV",
+    "vốn hóa": "Market_Cap",
+    "market cap": "Market_Cap",
+    "lợi nhuận trên cổ phiếu": "EPS",
+    "score": "Score"
+}
+
+
+class QueryParse(NamedTuple):
+    intent: str
+    industry: Optional[str]
+    factor: Optional[str]
+    top_n: Optional[int]        # None nếu câu hỏi không có "top N"
+    tickers: List[str]          # token 2–5 chữ cái Latin (viết hoa), theo thứ tự xuất hiện
+
+
+# ===================== PARSER =====================
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def _tokens(text):
+    return tuple(_TOKEN.findall(text))
+
+
+class QueryParser:
+    """
+    Tách intent + ngành + chỉ số + top-N + ticker trong 1 lần quét câu hỏi:
+        - tách từ 1 lần (1 regex), rồi đi qua các từ với bảng tra
+          từ đầu tiên → các cụm từ khóa (dài nhất trước)
+        - từ khóa phải khớp trọn từ (không còn "de" khớp trong "để", "đề")
+        - cùng lúc bắt token ticker và "top N"
+        - từ khóa so sánh + ít nhất 2 ticker (không phải từ khóa) cũng tính là câu hỏi
+          tài chính: "THT vs LPB thì nên chọn mã nào"
+    """
+
+    def __init__(self, industries=()):
+        self.industries = list(industries)
+
+        # Vai trò trực tiếp của từng từ khóa
+        vocab = {}
+
+        def entry(word):
+            return vocab.setdefault(_tokens(word), {"flags": 0, "industry": None, "keyword": None, "factor": None})
+
+        for flag, words in INTENT_KEYWORDS:
+            for w in words:
+                entry(w)["flags"] |= flag
+        for i, name in enumerate(self.industries):
+            entry(name)["industry"] = i
+        for i, w in enumerate(INDUSTRY_KEYWORDS):
+            entry(w)["keyword"] = i
+        for i, w in enumerate(FACTOR_MAP):
+            entry(w)["factor"] = i
+
+        # Cờ intent của 1 cụm gồm cả cờ của các từ khóa nằm trọn trong nó
+        # ("báo cáo tài chính" cũng là "báo cáo")
+        def contains(phrase, sub):
+            return any(phrase[i:i + len(sub)] == sub for i in range(len(phrase) - len(sub) + 1))
+
+        flags = {}
+        for phrase in vocab:
+            flags[phrase] = 0
+            for other, role in vocab.items():
+                if role["flags"] and contains(phrase, other):
+                    flags[phrase] |= role["flags"]
+
+        # Bảng tra: từ đầu → [(cụm, vai trò)], cụm dài trước
+        self._table = {}
+        for phrase, role in sorted(vocab.items(), key=lambda kv: len(kv[0]), reverse=True):
+            roles = (flags[phrase], role["industry"], role["keyword"], role["factor"])
+            self._table.setdefault(phrase[0], []).append((phrase, roles))
+
+        # "top5" là 1 từ nhưng vẫn tính là từ khóa "top"
+        self._top_flags = flags[("top",)]
+        # Token thuộc từ khóa ("vs", "so", "top", "roa"...) không tính là ticker khi xét domain
+        self._words = {tok for phrase in vocab for tok in phrase}
+        self._keyword_targets = list(INDUSTRY_KEYWORDS.values())
+        self._factor_targets = list(FACTOR_MAP.values())
+
+    def parse(self, query: str) -> QueryParse:
+        tokens = _tokens(query.lower())
+        table = self._table
+
+        flags = 0
+        industry = keyword = factor = top_n = None
+        tickers = []
+        names = 0
+
+        for i, tok in enumerate(tokens):
+            # Ticker: token 2–5 chữ cái Latin
+            if 2 <= len(tok) <= 5 and tok.isascii() and tok.isalpha():
+                tickers.append(tok.upper())
+                if tok not in self._words:
+                    names += 1
+
+            # "top N" / "topN"
+            if tok.startswith("top"):
+                n = tok[3:]
+                if not n and i + 1 < len(tokens) and tokens[i + 1].isdigit():
+                    n = tokens[i + 1]
+                if n.isdigit():
+                    flags |= self._top_flags
+                    if top_n is None:
+                        top_n = int(n)
+
+            candidates = table.get(tok)
+            if candidates is None:
+                continue
+            for phrase, roles in candidates:
+                if tokens[i:i + len(phrase)] == phrase:
+                    f, ind, kw, fac = roles
+                    flags |= f
+                    if ind is not None and (industry is None or ind < industry):
+                        industry = ind
+                    if kw is not None and (keyword is None or kw < keyword):
+                        keyword = kw
+                    if fac is not None and (factor is None or fac < factor):
+                        factor = fac
+                    break
+
+        if flags & COMPARISON and names >= 2:
+            flags |= DOMAIN
+
+        if industry is not None:
+            industry_name = self.industries[industry]
+        elif keyword is not None:
+            industry_name = self._keyword_targets[keyword]
+        else:
+            industry_name = None
+
+        return QueryParse(
+            intent=_intent(flags),
+            industry=industry_name,
+            factor=None if factor is None else self._factor_targets[factor],
+            top_n=top_n,
+            tickers=tickers
+        )
+
+
+def _intent(flags):
+    """
+    Thứ tự ưu tiên giữ nguyên như detect_intent cũ
+    """
+    if not flags & DOMAIN:
+        return "out_of_domain"
+    if flags & COMPARISON:
+        return "comparison"
+    if flags & RANKING:
+        return "ranking"
+    if flags & RATIO:
+        return "ratio_analysis"
+    if flags & STATEMENT:
+        return "financial_statement"
+    if flags & REPORT:
+        return "report_qa"
+    if flags & SECTOR:
+        return "sector_analysis"
+    return "recommendation"
+
+
+_parsers = {}
+
+
+def get_parser(industries=()):
+    """
+    Parser đã biên dịch cho danh sách ngành (dựng lại khi danh sách đổi)
+    """
+    key = tuple(industries)
+    parser = _parsers.get(key)
+    if parser is None:
+        if len(_parsers) >= 8:
+            _parsers.clear()
+        parser = QueryParser(key)
+        _parsers[key] = parser
+    return parser
+
+
+def parse_query(query: str, industries=()) -> QueryParse:
+    return get_parser(industries).parse(query)
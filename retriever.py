@@ -1,3 +1,7 @@
+import os
+import threading
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -8,44 +12,167 @@ MODEL_NAME = "gemma2:2b"
 TOP_SCORE_N = 5
 TOP_MARKETCAP_N = 5
 
-# ===================== LOAD DATA =====================
-df = pd.read_csv(CSV_PATH)
-df.columns = df.columns.str.strip()
-ALL_INDUSTRIES = sorted(df["industry"].dropna().unique().tolist())
-ALL_INDUSTRIES_LOWER = [x.lower() for x in ALL_INDUSTRIES]
-
-df = df.rename(columns={
-    "Score_industry": "Score",
-    "Market_Cap": "Market_Cap",
-    "Rank_in_Industry": "Rank_in_Industry"
-})
-
-df = df.dropna(subset=["Score", "Market_Cap"]).reset_index(drop=True)
-
 # ===================== NORMALIZE INDUSTRY =====================
 def normalize_industry(x):
     if not isinstance(x, str):
         return None
     return x.lower()
 
-df["industry_norm"] = df["industry"].apply(normalize_industry)
+# ===================== RANKING INDEX =====================
+class RankingIndex:
+    """
+    Chỉ mục dựng 1 lần khi load:
+        - mỗi cột số: vị trí dòng đã sắp theo (ngành, giá trị) cả 2 chiều, NaN cuối;
+          cùng giá trị → ticker tăng dần (cả khi sắp giảm dần), rồi thứ tự dòng trong bảng.
+          Thứ tự hòa được cố định, không phụ thuộc thuật toán sắp của pandas
+        - ngành → đoạn [start, end) trong các mảng trên
+        - ticker → các vị trí dòng
+    Top-N / xếp hạng / so sánh chỉ lấy đúng số dòng cần (df.iloc), không quét cả bảng
+    """
+
+    def __init__(self, data):
+        self.df = data
+
+        codes, industries = pd.factorize(data["industry_norm"], sort=True)
+        self.industry_code = {ind: i for i, ind in enumerate(industries)}
+
+        # Dòng không có ngành (code -1) xếp cuối, không thuộc đoạn nào
+        key = np.where(codes < 0, len(industries), codes)
+        counts = np.bincount(key, minlength=len(industries) + 1)[:len(industries)]
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+
+        self.tickers = data["ticker"].to_numpy()
+        ticker_code = pd.factorize(data["ticker"], sort=True)[0]
+
+        self.desc = {}
+        self.asc = {}
+        for col in data.select_dtypes("number").columns:
+            v = data[col].to_numpy(dtype=np.float64)
+            nan = np.isnan(v)
+            # lexsort ổn định: khóa cuối là khóa chính
+            self.desc[col] = np.lexsort((ticker_code, -v, nan, key))
+            self.asc[col] = np.lexsort((ticker_code, v, nan, key))
+
+        self.score = data["Score"].to_numpy(dtype=np.float64)
+        self.ticker_rows = {}
+        for pos, t in enumerate(self.tickers):
+            self.ticker_rows.setdefault(t, []).append(pos)
+
+    def top_positions(self, industry, col, n, ascending=False):
+        """
+        Vị trí n dòng đầu của ngành theo col (None nếu không có ngành)
+        """
+        code = self.industry_code.get(industry)
+        if code is None:
+            return None
+        order = self.asc[col] if ascending else self.desc[col]
+        start = self.starts[code]
+        end = min(self.ends[code], start + max(n, 0))
+        return order[start:end]
+
+    def top(self, industry, col, n, ascending=False, columns=None):
+        pos = self.top_positions(industry, col, n, ascending)
+        if pos is None:
+            return None
+        if columns is None:
+            return self.df.iloc[pos]
+        return self.df.iloc[pos, self.df.columns.get_indexer(columns)]
+
+    def rows_of(self, tickers):
+        """
+        Vị trí dòng của các ticker, theo thứ tự trong bảng
+        """
+        pos = [p for t in set(tickers) for p in self.ticker_rows.get(t, ())]
+        return np.sort(np.asarray(pos, dtype=np.intp))
+
+
+# ===================== LOAD DATA (LAZY) =====================
+class RankingData:
+    """
+    Bảng xếp hạng + chỉ mục, đọc từ CSV ở lần dùng đầu tiên
+    """
+
+    def __init__(self, path=CSV_PATH):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+
+        df = pd.read_csv(path)
+        df.columns = df.columns.str.strip()
+        self.all_industries = sorted(df["industry"].dropna().unique().tolist())
+        self.all_industries_lower = [x.lower() for x in self.all_industries]
+
+        df = df.rename(columns={
+            "Score_industry": "Score",
+            "Market_Cap": "Market_Cap",
+            "Rank_in_Industry": "Rank_in_Industry"
+        })
+
+        df = df.dropna(subset=["Score", "Market_Cap"]).reset_index(drop=True)
+        df["industry_norm"] = df["industry"].str.lower()
+
+        self.df = df
+        self.index = RankingIndex(df)
+
+
+_data = None
+_data_lock = threading.Lock()
+
+
+def get_ranking_data(path=CSV_PATH):
+    """
+    Dữ liệu dùng chung trong process (giữ qua các lần rerun của Streamlit),
+    tự nạp lại khi file CSV được ghi mới (mtime đổi)
+    """
+    global _data
+    data = _data
+    if data is not None and data.path == path and data.mtime == os.path.getmtime(path):
+        return data
+
+    with _data_lock:
+        if _data is None or _data.path != path or _data.mtime != os.path.getmtime(path):
+            _data = RankingData(path)
+        return _data
+
+
+def __getattr__(name):
+    # Giữ tương thích: retriever.df, retriever.ALL_INDUSTRIES, ...
+    if name == "df":
+        return get_ranking_data().df
+    if name == "ALL_INDUSTRIES":
+        return get_ranking_data().all_industries
+    if name == "ALL_INDUSTRIES_LOWER":
+        return get_ranking_data().all_industries_lower
+    if name == "RANKING_INDEX":
+        return get_ranking_data().index
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # -------- Recommendation --------
 TOP_SCORE_N = 5
 TOP_MARKETCAP_N = 5
 
 def retrieve_stock_groups(industry):
-    data = df[df["industry_norm"] == industry].copy()
-    if data.empty:
+    data = get_ranking_data()
+    df, index = data.df, data.index
+
+    score_pos = index.top_positions(industry, "Score", TOP_SCORE_N)
+    if score_pos is None:
         return None
+    cap_pos = index.top_positions(industry, "Market_Cap", TOP_MARKETCAP_N)
 
-    top_score = data.sort_values("Score", ascending=False).head(TOP_SCORE_N)
-    top_cap = data.sort_values("Market_Cap", ascending=False).head(TOP_MARKETCAP_N)
+    # Các nhóm con tính trên vị trí dòng (top_score đã sắp theo Score giảm dần)
+    tickers = index.tickers
+    score = index.score
+    in_cap = np.isin(tickers[score_pos], tickers[cap_pos])
+    balanced_pos = score_pos[in_cap]
+    safe_pos = cap_pos[np.argsort(-score[cap_pos], kind="stable")[:1]]
 
-    balanced = top_score[top_score["ticker"].isin(top_cap["ticker"])]
-    best_growth = top_score[~top_score["ticker"].isin(top_cap["ticker"])].head(1)
-    best_safe = top_cap.sort_values("Score", ascending=False).head(1)
-    best_balance = balanced.sort_values("Score", ascending=False).head(1)
+    top_score = df.iloc[score_pos]
+    top_cap = df.iloc[cap_pos]
+    best_growth = top_score[~in_cap].head(1)
+    best_safe = df.iloc[safe_pos]
+    best_balance = df.iloc[balanced_pos[:1]]
 
     return {
         "top_score": top_score,
@@ -58,8 +185,10 @@ def retrieve_stock_groups(industry):
 
 # -------- Comparison --------
 def get_comparison(tickers):
+    data = get_ranking_data()
+    df = data.df
     cols = ["ticker", "Score", "Market_Cap", "ROA", "DE", "BV","EPS", "PB"]
-    out = df[df["ticker"].isin(tickers)][cols].copy()
+    out = df.iloc[data.index.rows_of(tickers), df.columns.get_indexer(cols)]
     out["Market_Cap"] = out["Market_Cap"] / 1e9  # sang tỷ
     out["BV"] = out["BV"] / 1e9  # sang tỷ
     return out
@@ -70,48 +199,55 @@ def get_comparison(tickers):
 
 # -------- Ranking --------
 def get_ranking(industry, factor, top_n=10, ascending=False):
-    data = df[df["industry_norm"] == industry].copy()
-    if data.empty or factor not in data.columns:
+    data = get_ranking_data()
+    df = data.df
+    if factor not in df.columns:
         return None
 
-    result = data.sort_values(factor, ascending=ascending).head(top_n)
-    return result[["ticker", factor]]
+    if factor not in data.index.desc:
+        # Cột không phải số: sắp bằng pandas, cùng quy tắc hòa với RankingIndex
+        rows = df[df["industry_norm"] == industry]
+        if rows.empty:
+            return None
+        rows = rows.sort_values([factor, "ticker"], ascending=[ascending, True], kind="stable")
+        return rows.head(top_n)[["ticker", factor]]
+
+    return data.index.top(industry, factor, top_n, ascending, columns=["ticker", factor])
 
 
 
 # -------- PDF RAG (simple) --------
 # -------- PDF RAG (offline financials) --------
-import pandas as pd
-import os
+from statement_store import get_statement_store
 
 DATA_DIR = "price_offline"
 
 def get_latest_financials(ticker):
     try:
-        is_path = os.path.join(DATA_DIR, f"{ticker}_income_statement.csv")
-        bs_path = os.path.join(DATA_DIR, f"{ticker}_balance_sheet.csv")
-        cf_path = os.path.join(DATA_DIR, f"{ticker}_cashflow.csv")
-
-        if not (os.path.exists(is_path) and os.path.exists(bs_path) and os.path.exists(cf_path)):
+        store = get_statement_store()
+        if ticker not in store:
             return None
 
-        is_df = pd.read_csv(is_path)
-        bs_df = pd.read_csv(bs_path)
-        cf_df = pd.read_csv(cf_path)
-
         # Cột năm là yearReport
-        latest_year = bs_df["yearReport"].max()
-
-        return {
-            "year": latest_year,
-            "balance_sheet": bs_df[bs_df["yearReport"] == latest_year],
-            "income_statement": is_df[is_df["yearReport"] == latest_year],
-            "cash_flow": cf_df[cf_df["yearReport"] == latest_year]
-        }
+        latest_year = store.get("balance_sheet", ticker)["yearReport"].max()
+        return {"year": latest_year, **store.financials(ticker, latest_year)}
 
     except Exception as e:
         print("Financial load error:", e)
         return None
 
 
+def get_financials(ticker, years=None, last_n=None):
+    """
+    Báo cáo nhiều năm (câu hỏi xu hướng): years=[...] hoặc last_n năm gần nhất
+    """
+    store = get_statement_store()
+    if ticker not in store:
+        return None
+
+    if years is None:
+        years = store.years(ticker, "balance_sheet")
+        if last_n is not None:
+            years = years[-last_n:]
 
+    return {"years": list(years), **store.financials(ticker, years)}
@@ -1,3 +1,5 @@
+import os
+import time
 import pandas as pd
 from pathlib import Path
 
@@ -80,18 +82,66 @@ def get_ranking(industry, factor, top_n=10, ascending=False):
 
 
 # -------- PDF RAG (simple) --------
-from vnstock import Vnstock
+from statement_store import get_statement_store, update_statement_store
 
-def get_latest_financials(ticker):
-    vn = Vnstock()
-    stock = vn.stock(symbol=ticker, source="VCI")
+# Báo cáo trong statement store cũ hơn số ngày này thì tải lại từ vnstock
+STATEMENT_MAX_AGE_DAYS = float(os.environ.get("STATEMENT_MAX_AGE_DAYS", 30))
 
-    bs = stock.finance.balance_sheet(period="year")
-    is_ = stock.finance.income_statement(period="year")
-    cf = stock.finance.cash_flow(period="year")
+_vnstock = None
+_stocks = {}
+_refresh_tried = {}     # ticker → lần thử tải lại gần nhất (không gọi mạng liên tục khi offline)
 
-    if bs is None or is_ is None or cf is None:
-        return None
+
+def get_stock(ticker):
+    """
+    Dùng lại 1 client Vnstock và 1 đối tượng stock cho mỗi mã
+    """
+    global _vnstock
+    stock = _stocks.get(ticker)
+    if stock is None:
+        if _vnstock is None:
+            from vnstock import Vnstock
+            _vnstock = Vnstock()
+        stock = _vnstock.stock(symbol=ticker, source="VCI")
+        _stocks[ticker] = stock
+    return stock
+
+
+def fetch_financials(ticker):
+    stock = get_stock(ticker)
+    return {
+        "balance_sheet": stock.finance.balance_sheet(period="year"),
+        "income_statement": stock.finance.income_statement(period="year"),
+        "cash_flow": stock.finance.cash_flow(period="year"),
+    }
+
+
+def get_latest_financials(ticker):
+    # Có sẵn trong statement store và chưa quá STATEMENT_MAX_AGE_DAYS → không gọi mạng
+    store = get_statement_store()
+    max_age = STATEMENT_MAX_AGE_DAYS * 86400
+    now = time.time()
+
+    if ticker not in store or (store.age(ticker) > max_age and now - _refresh_tried.get(ticker, 0.0) > max_age):
+        _refresh_tried[ticker] = now
+        try:
+            frames = fetch_financials(ticker)
+        except Exception as e:
+            # Không tải lại được → dùng bản cũ trong store (nếu có)
+            if ticker not in store:
+                raise
+            print(f"Không tải lại được báo cáo {ticker}, dùng bản offline:", e)
+            frames = None
+
+        if frames is not None and all(df is not None for df in frames.values()):
+            # Write-through: lần sau đọc từ store, không gọi mạng
+            store = update_statement_store(ticker, frames)
+        elif ticker not in store:
+            return None
+
+    bs = store.get("balance_sheet", ticker)
+    is_ = store.get("income_statement", ticker)
+    cf = store.get("cash_flow", ticker)
 
     year = bs["yearReport"].max()
 
@@ -101,4 +151,3 @@ def get_latest_financials(ticker):
         "income_statement": is_[is_["yearReport"] == year],
         "cash_flow": cf[cf["yearReport"] == year]
     }
-
@@ -0,0 +1,241 @@
+# return_stream.py
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from covariance import DenseCovariance
+from price_store import PRICE_DIR, STORE_DIR, get_price_store
+
+CHUNK_ROWS = 4096           # số phiên mỗi chunk đọc từ memmap (bộ nhớ ~ CHUNK_ROWS x N x 8 byte / buffer)
+
+
+class ReturnChunk(NamedTuple):
+    dates: np.ndarray           # (rows,) int64 ns
+    values: np.ndarray          # (rows, N) log return, NaN = không có giá
+    mask: np.ndarray            # (rows, N) bool, True = có return
+
+
+# ===================== STREAM =====================
+
+def iter_log_returns(symbols, start=None, end=None, chunk_rows=CHUNK_ROWS, dtype=np.float64, store=None):
+    """
+    Log return ln(Pt / Pt-1) đọc từng chunk dòng của panel giá memory-mapped:
+        - giá của mỗi chunk chỉ copy các cột được chọn (chunk_rows x N)
+        - chia + log tại chỗ trong 1 buffer dtype (float32 / float64) dùng lại giữa các chunk
+        - giá cuối của chunk trước được giữ lại cho dòng đầu của chunk sau
+        - NaN theo từng cột (không dropna toàn cục); ngày mà mọi mã đều không có giá
+          bị bỏ như store.frame
+
+    Cùng kết quả với calculate_log_returns(store.frame(symbols, start, end), dropna=False)
+    (bỏ dòng đầu). values / mask là view vào buffer dùng lại: cần giữ thì .copy()
+
+    Mã không có trong store bị bỏ qua; danh sách mã thật sự dùng: stream_columns(...)
+    """
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+
+    cols = [store.columns[s] for s in symbols if s in store]
+    n = len(cols)
+    r0, r1 = store.row_range(start, end)
+
+    buf = np.empty((chunk_rows, n), dtype=dtype)
+    prev = None                     # dòng giá cuối của chunk trước
+
+    for a in range(r0, r1, chunk_rows):
+        b = min(a + chunk_rows, r1)
+        P = store.close[a:b, cols]
+        keep = ~np.isnan(P).all(axis=1)
+        dates = store.dates[a:b]
+        if not keep.all():
+            P = P[keep]
+            dates = dates[keep]
+        if not len(P):
+            continue
+
+        if prev is None:
+            # Dòng đầu tiên không có giá hôm trước
+            prev, P, dates = P[0], P[1:], dates[1:]
+            if not len(P):
+                continue
+
+        rows = len(P)
+        out = buf[:rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # dtype= → phép chia chạy ở độ chính xác của buffer (giá lưu float32)
+            np.divide(P[0], prev, out=out[0], dtype=dtype)
+            np.divide(P[1:], P[:-1], out=out[1:], dtype=dtype)
+            np.log(out, out=out)
+        prev = P[-1].copy()
+
+        yield ReturnChunk(dates, out, ~np.isnan(out))
+
+
+def stream_columns(symbols, store=None):
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+    return [s for s in symbols if s in store]
+
+
+# ===================== MOMENTS =====================
+
+class StreamingMoments:
+    """
+    Mômen cộng dồn trên stream return có NaN theo từng cột (1 lượt đọc):
+        - trung bình / phương sai từng cột
+        - hồi quy CAPM của từng cột theo cột thị trường (market=tên cột)
+        - hiệp phương sai pairwise-complete N x N (pairwise=True), giống DataFrame.cov()
+
+    Cộng dồn trên dữ liệu đã trừ 1 điểm neo K (trung bình chunk đầu) để giữ độ chính xác
+    """
+
+    def __init__(self, columns, market=None, pairwise=False):
+        self.columns = list(columns)
+        n = len(self.columns)
+        self.market = None if market is None else self.columns.index(market)
+        self.pairwise = pairwise
+        self.rows = 0
+        self.shift = None
+
+        self.n = np.zeros(n)
+        self.s = np.zeros(n)
+        self.ss = np.zeros(n)
+
+        if self.market is not None:
+            # Trên các dòng mà cả mã i và thị trường đều có return
+            self.xy_n = np.zeros(n)
+            self.xy_x = np.zeros(n)      # Σ thị trường
+            self.xy_y = np.zeros(n)      # Σ mã i
+            self.xy_xx = np.zeros(n)
+            self.xy_yy = np.zeros(n)
+            self.xy_xy = np.zeros(n)
+
+        if pairwise:
+            self.pair_n = np.zeros((n, n))
+            self.pair_s = np.zeros((n, n))    # [i, j] = Σ y_i trên dòng cả i và j có return
+            self.pair_q = np.zeros((n, n))
+
+    def update(self, values, mask=None):
+        if mask is None:
+            mask = ~np.isnan(values)
+        if not len(values):
+            return self
+
+        if self.shift is None:
+            with np.errstate(invalid="ignore"):
+                n0 = mask.sum(axis=0)
+                s0 = np.where(mask, values, 0).sum(axis=0, dtype=np.float64)
+                self.shift = np.where(n0 > 0, s0 / np.maximum(n0, 1), 0.0)
+
+        Y = np.where(mask, values - self.shift, 0.0)
+        M = mask.astype(np.float64)
+        self.rows += len(values)
+
+        self.n += M.sum(axis=0)
+        self.s += Y.sum(axis=0)
+        self.ss += np.einsum("tn,tn->n", Y, Y)
+
+        if self.market is not None:
+            # Cột thị trường là vector → các tổng theo cặp là tích vector · ma trận
+            x = Y[:, self.market]
+            both = M * M[:, self.market:self.market + 1]
+            y = Y * both
+            self.xy_n += both.sum(axis=0)
+            self.xy_x += x @ both
+            self.xy_y += y.sum(axis=0)
+            self.xy_xx += (x * x) @ both
+            self.xy_yy += np.einsum("tn,tn->n", y, Y)
+            self.xy_xy += x @ y
+
+        if self.pairwise:
+            self.pair_n += M.T @ M
+            self.pair_s += Y.T @ M
+            self.pair_q += Y.T @ Y
+
+        return self
+
+    def consume(self, chunks):
+        """
+        Đọc hết 1 stream ReturnChunk (vd: iter_log_returns)
+        """
+        for chunk in chunks:
+            self.update(chunk.values, chunk.mask)
+        return self
+
+    # ----- kết quả -----
+
+    def mean(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(self.shift + self.s / self.n, index=self.columns)
+
+    def var(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            v = (self.ss - self.s * self.s / self.n) / (self.n - ddof)
+        return pd.Series(v, index=self.columns)
+
+    def cov(self, annualize=1):
+        """
+        Hiệp phương sai pairwise-complete (ddof=1), cặp có < 2 quan sát chung → NaN
+        """
+        if not self.pairwise:
+            raise ValueError("cần StreamingMoments(..., pairwise=True)")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            n = self.pair_n
+            c = (self.pair_q - self.pair_s * self.pair_s.T / n) / (n - 1)
+        c[n < 2] = np.nan
+        return pd.DataFrame(c * annualize, index=self.columns, columns=self.columns)
+
+    def covariance_operator(self, annualize=252):
+        c = self.cov(annualize)
+        return DenseCovariance(c.values, c.index)
+
+    def capm_regression(self):
+        """
+        Như preprocessing.estimate_capm_regression nhưng từ mômen cộng dồn:
+        beta, alpha, r2, resid_var, n_obs cho mọi cột (trừ cột thị trường)
+        """
+        if self.market is None:
+            raise ValueError("cần StreamingMoments(..., market=...)")
+
+        n = self.xy_n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sxx = self.xy_xx - self.xy_x * self.xy_x / n
+            syy = self.xy_yy - self.xy_y * self.xy_y / n
+            sxy = self.xy_xy - self.xy_x * self.xy_y / n
+
+            mean_x = self.shift[self.market] + self.xy_x / n
+            mean_y = self.shift + self.xy_y / n
+
+            beta = sxy / sxx
+            alpha = mean_y - beta * mean_x
+            r2 = sxy * sxy / (sxx * syy)
+            resid_var = (syy - beta * sxy) / (n - 2)
+
+        table = pd.DataFrame(
+            {
+                "beta": beta,
+                "alpha": alpha,
+                "r2": r2,
+                "resid_var": resid_var,
+                "n_obs": n.astype(np.int64)
+            },
+            index=self.columns
+        )
+        return table.drop(index=self.columns[self.market])
+
+
+def stream_capm_moments(symbols, market="VNINDEX", start=None, end=None,
+                        pairwise=False, chunk_rows=CHUNK_ROWS, dtype=np.float64, store=None):
+    """
+    1 lượt đọc panel giá → StreamingMoments cho symbols + thị trường
+    (không giữ cả ma trận return trong RAM)
+    """
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+    wanted = [s for s in symbols if s != market] + [market]
+    columns = stream_columns(wanted, store)
+    if market not in columns:
+        raise KeyError(f"Không có giá của {market}")
+
+    moments = StreamingMoments(columns, market=market, pairwise=pairwise)
+    return moments.consume(iter_log_returns(columns, start, end, chunk_rows, dtype, store))
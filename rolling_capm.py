@@ -0,0 +1,156 @@
+# rolling_capm.py
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from covariance import single_index_operator
+
+# Thứ tự stat trong trục cuối của mảng kết quả
+STATS = ("beta", "alpha", "expected_return", "resid_var")
+MARKET_STATS = ("expected_rm", "market_variance")
+
+BETA, ALPHA, EXPECTED_RETURN, RESID_VAR = range(len(STATS))
+EXPECTED_RM, MARKET_VARIANCE = range(len(MARKET_STATS))
+
+
+# ===================== RUNNING SUMS =====================
+
+def _window_sums(a, window=None, halflife=None, power=1):
+    """
+    Tổng chạy theo trục thời gian (axis=0), O(T) cho mỗi cột:
+        - expanding : cumsum
+        - rolling   : cumsum[t] - cumsum[t - window]
+        - EWMA      : S_t = λ^power · S_{t-1} + a_t (lọc IIR)
+    """
+    if halflife is not None:
+        lam = (0.5 ** (1.0 / halflife)) ** power
+        return lfilter([1.0], [1.0, -lam], a, axis=0)
+
+    c = np.cumsum(a, axis=0)
+    if window is not None and window < len(c):
+        c[window:] = c[window:] - c[:-window]
+    return c
+
+
+def _moments(x, y, mask, window, halflife):
+    """
+    Tính Σw, Σw², Σx, Σy, Σxy, Σx², Σy² theo cửa sổ (chỉ trên quan sát hợp lệ)
+    """
+    w = mask.astype(np.float64)
+    x0 = np.where(mask, x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+
+    W = _window_sums(w, window, halflife)
+    W2 = _window_sums(w, window, halflife, power=2) if halflife is not None else W
+    Sx = _window_sums(x0, window, halflife)
+    Sy = _window_sums(y0, window, halflife)
+    Sxy = _window_sums(x0 * y0, window, halflife)
+    Sxx = _window_sums(x0 * x0, window, halflife)
+    Syy = _window_sums(y0 * y0, window, halflife)
+
+    return W, W2, Sx, Sy, Sxy, Sxx, Syy
+
+
+# ===================== ENGINE =====================
+
+def rolling_capm(
+    stock_returns: pd.DataFrame,
+    market_returns: pd.Series,
+    rf: float,
+    window: int = None,
+    halflife: float = None,
+    min_periods: int = 20
+):
+    """
+    Ước lượng CAPM theo thời gian cho mọi cửa sổ trong O(N × T):
+        - window=None, halflife=None : expanding window
+        - window=k                   : rolling k phiên gần nhất
+        - halflife=h                 : trọng số mũ (EWMA), nửa chu kỳ h phiên
+
+    Công thức giống bản full-sample trong preprocessing:
+        beta = cov(Ri, Rm) / var(Rm)
+        E(Rm) = mean(Rm) * 365, σ²(M) = var(Rm)
+        E(Ri) = rf + beta * (E(Rm) - rf)
+
+    Trả về:
+        stats  : ndarray (T, N, len(STATS))         – beta, alpha, E(Ri), phương sai phần dư
+        market : ndarray (T, len(MARKET_STATS))     – E(Rm), σ²(M)
+    Các cửa sổ chưa đủ min_periods quan sát là NaN.
+    """
+    if window is not None and halflife is not None:
+        raise ValueError("Chỉ chọn 1 trong window hoặc halflife")
+    if window is not None and (int(window) != window or window < 1):
+        raise ValueError(f"window phải là số nguyên >= 1: {window}")
+    if halflife is not None and not halflife > 0:
+        raise ValueError(f"halflife phải > 0: {halflife}")
+    if int(min_periods) != min_periods or min_periods < 1:
+        raise ValueError(f"min_periods phải là số nguyên >= 1: {min_periods}")
+    if window is not None and min_periods > window:
+        raise ValueError(f"min_periods ({min_periods}) lớn hơn window ({window})")
+    window = None if window is None else int(window)
+
+    Y = stock_returns.to_numpy(dtype=np.float64)
+    x = market_returns.reindex(stock_returns.index).to_numpy(dtype=np.float64)
+    T, N = Y.shape
+
+    # Dời gốc về trung bình toàn mẫu để tổng chạy không bị mất chính xác
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        x_shift = np.nan_to_num(np.nanmean(x)) if T else 0.0
+        y_shift = np.nan_to_num(np.nanmean(Y, axis=0)) if T else np.zeros(N)
+    xc = x - x_shift
+    yc = Y - y_shift
+
+    # ---------- Market ----------
+    m_mask = ~np.isnan(x)
+    mW, mW2, mSx, _, _, mSxx, _ = _moments(xc, xc, m_mask, window, halflife)
+    m_count = _window_sums(m_mask.astype(np.float64), None if halflife is not None else window)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m_mean = mSx / mW
+        m_neff = mW * mW / mW2
+        m_var = (mSxx - mSx * m_mean) / mW * m_neff / (m_neff - 1)
+
+    market = np.full((T, len(MARKET_STATS)), np.nan)
+    ok = m_count >= min_periods
+    market[ok, EXPECTED_RM] = (m_mean[ok] + x_shift) * 365
+    market[ok, MARKET_VARIANCE] = m_var[ok]
+
+    # ---------- Stocks (mask theo từng cột) ----------
+    mask = ~np.isnan(Y) & m_mask[:, None]
+    W, W2, Sx, Sy, Sxy, Sxx, Syy = _moments(xc[:, None], yc, mask, window, halflife)
+    count = _window_sums(mask.astype(np.float64), None if halflife is not None else window)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = Sx / W
+        mean_y = Sy / W
+        cxy = Sxy - Sx * mean_y
+        cxx = Sxx - Sx * mean_x
+        cyy = Syy - Sy * mean_y
+
+        beta = cxy / cxx
+        alpha = (mean_y + y_shift) - beta * (mean_x + x_shift)
+
+        n_eff = W * W / W2
+        resid_var = (cyy - beta * cxy) / W * n_eff / (n_eff - 2)
+
+    stats = np.full((T, N, len(STATS)), np.nan)
+    ok = count >= min_periods
+    stats[..., BETA] = np.where(ok, beta, np.nan)
+    stats[..., ALPHA] = np.where(ok, alpha, np.nan)
+    stats[..., RESID_VAR] = np.where(ok, resid_var, np.nan)
+
+    erm = market[:, EXPECTED_RM][:, None]
+    stats[..., EXPECTED_RETURN] = rf + stats[..., BETA] * (erm - rf)
+
+    return stats, market
+
+
+def covariance_at(stats, market, t, include_specific=False):
+    """
+    Ma trận hiệp phương sai single-index tại thời điểm t (covariance.single_index_operator):
+        Σ_t = β_t β_tᵀ σ²_t(M)  (+ diag(phương sai phần dư) nếu include_specific)
+    """
+    specific = stats[t, :, RESID_VAR] if include_specific else None
+    return single_index_operator(stats[t, :, BETA], market[t, MARKET_VARIANCE], specific).to_dense()
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import pickle
+import threading
+import pandas as pd
+
+from price_store import PRICE_DIR, STORE_DIR, FreshnessCheck
+
+try:
+    import pyarrow  # noqa: F401
+    STORE_FORMAT = "parquet"
+except ImportError:  # pyarrow là tùy chọn, thiếu thì ghi pickle (cùng 1 DataFrame)
+    STORE_FORMAT = "pkl"
+
+STATEMENT_DIR = os.path.join(STORE_DIR, "statements")
+MANIFEST_FILE = "manifest.json"
+INDEX = ["ticker", "yearReport"]
+
+# Loại báo cáo → hậu tố file CSV theo mã trong price_offline/
+STATEMENT_SUFFIXES = {
+    "balance_sheet": "_balance_sheet.csv",
+    "income_statement": "_income_statement.csv",
+    "cash_flow": "_cashflow.csv",
+}
+
+
+# ===================== INGEST =====================
+
+def _scan_statement_files(price_dir):
+    """
+    Liệt kê file báo cáo: {loại: {ticker: (path, mtime)}}
+    """
+    files = {kind: {} for kind in STATEMENT_SUFFIXES}
+    if not os.path.isdir(price_dir):
+        return files
+
+    for entry in os.scandir(price_dir):
+        if not entry.is_file():
+            continue
+        for kind, suffix in STATEMENT_SUFFIXES.items():
+            if entry.name.endswith(suffix):
+                ticker = entry.name[:-len(suffix)]
+                files[kind][ticker] = (entry.path, entry.stat().st_mtime)
+    return files
+
+
+def _source_mtime(files):
+    return max((m for by_ticker in files.values() for _, m in by_ticker.values()), default=0.0)
+
+
+def _dtype_kind(dtype):
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    return "str"
+
+
+def _normalize_dtypes(frame, dtypes):
+    """
+    Gộp các mã có bộ cột khác nhau làm pandas tự đổi kiểu (int thiếu ở mã khác → float,
+    bool → object, int ở mã này / chuỗi ở mã kia → object lẫn kiểu, parquet không ghi được).
+    Chọn 1 kiểu cho mỗi cột theo kiểu gốc của các mã có cột đó (dtypes: {ticker: {cột: dtype}}):
+        bool → boolean, int (+ bool) → Int64, số → float64, còn lại → string
+    """
+    kinds = {}
+    for by_col in dtypes.values():
+        for col, dtype in by_col.items():
+            kinds.setdefault(col, set()).add(_dtype_kind(dtype))
+    # Store ghi trước khi có manifest "dtypes": lấy thêm kiểu hiện tại của cột
+    if set(frame.index.get_level_values("ticker")) - set(dtypes):
+        for col in frame.columns:
+            kinds.setdefault(col, set()).add(_dtype_kind(frame[col].dtype))
+
+    for col in frame.columns:
+        k = kinds.get(col, {"str"})
+        if k == {"bool"}:
+            target = "boolean"
+        elif k <= {"bool", "int"}:
+            target = "Int64"
+        elif k <= {"bool", "int", "float"}:
+            target = "float64"
+        else:
+            target = "string"
+        if target == "string":
+            values = frame[col]
+            frame[col] = values.where(values.isna(), values.astype(str)).astype("string")
+        else:
+            frame[col] = frame[col].astype(target)
+    return frame
+
+
+def _to_frame(by_ticker):
+    """
+    {ticker: DataFrame} → 1 DataFrame chỉ mục (ticker, yearReport), giữ thứ tự dòng của từng mã
+    """
+    parts = [df.assign(ticker=ticker) for ticker, df in by_ticker.items()]
+    if not parts:
+        return pd.DataFrame(columns=INDEX).set_index(INDEX)
+    return pd.concat(parts, ignore_index=True).set_index(INDEX)
+
+
+def _column_dtypes(df):
+    return {col: str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def write_statement_store(store, store_dir=STATEMENT_DIR):
+    """
+    Ghi 1 file cho mỗi loại báo cáo, gộp mọi mã:
+        - {loại}.parquet (hoặc .pkl khi thiếu pyarrow): DataFrame chỉ mục (ticker, yearReport)
+        - manifest.json: cột + kiểu gốc của từng mã, thời điểm lấy dữ liệu, thông tin nguồn
+    """
+    os.makedirs(store_dir, exist_ok=True)
+
+    # Ghi ra file tạm rồi os.replace để reader không đọc phải file dở dang
+    for kind, frame in store.frames.items():
+        path = os.path.join(store_dir, f"{kind}.{STORE_FORMAT}")
+        tmp = path + ".tmp"
+        if STORE_FORMAT == "parquet":
+            frame.to_parquet(tmp)
+        else:
+            frame.to_pickle(tmp, compression=None)
+        os.replace(tmp, path)
+
+    manifest = {
+        "format": STORE_FORMAT,
+        "columns": store.columns,
+        "dtypes": store.dtypes,
+        "updated": store.updated,
+        "source_mtime": store.source_mtime,
+    }
+    tmp = os.path.join(store_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(store_dir, MANIFEST_FILE))
+
+
+def build_statement_store(price_dir=PRICE_DIR, store_dir=STATEMENT_DIR):
+    """
+    Chuyển đổi 1 lần: đọc toàn bộ {TICKER}_{loại}.csv và gộp theo loại báo cáo.
+    Mã đã ghi vào store từ nguồn online (update_statement_store) được giữ lại
+    nếu không có CSV hoặc bản online mới hơn CSV.
+    """
+    files = _scan_statement_files(price_dir)
+    tables = {
+        kind: {ticker: pd.read_csv(path) for ticker, (path, _) in sorted(by_ticker.items())}
+        for kind, by_ticker in files.items()
+    }
+    updated = {}
+    for by_ticker in files.values():
+        for ticker, (_, mtime) in by_ticker.items():
+            updated[ticker] = max(updated.get(ticker, 0.0), mtime)
+
+    try:
+        previous = load_statement_store(store_dir)
+    except (OSError, ValueError, KeyError, ImportError, pickle.UnpicklingError, EOFError):
+        previous = None
+    if previous is not None:
+        for ticker in previous.tickers:
+            if previous.updated.get(ticker, 0.0) > updated.get(ticker, 0.0):
+                for kind in STATEMENT_SUFFIXES:
+                    tables[kind][ticker] = previous.get(kind, ticker)
+                updated[ticker] = previous.updated[ticker]
+
+    dtypes = {kind: {t: _column_dtypes(df) for t, df in by_ticker.items()} for kind, by_ticker in tables.items()}
+    store = StatementStore(
+        frames={kind: _normalize_dtypes(_to_frame(by_ticker), dtypes[kind]) for kind, by_ticker in tables.items()},
+        columns={kind: {t: list(df.columns) for t, df in by_ticker.items()} for kind, by_ticker in tables.items()},
+        updated=updated,
+        source_mtime=_source_mtime(files),
+        dtypes=dtypes
+    )
+    write_statement_store(store, store_dir)
+    return store
+
+
+# ===================== STORE =====================
+
+class StatementStore:
+    """
+    Báo cáo tài chính năm của mọi mã: mỗi loại là 1 DataFrame chỉ mục (ticker, yearReport),
+    mỗi cột 1 kiểu thống nhất (xem _normalize_dtypes), get trả lại kiểu gốc của từng mã.
+    Tra 1 năm / nhiều năm là tra dict vị trí dòng, không đọc file.
+    """
+
+    def __init__(self, frames, columns, updated=None, source_mtime=0.0, dtypes=None):
+        self.frames = frames                # {loại: DataFrame chỉ mục (ticker, yearReport)}
+        self.columns = columns              # {loại: {ticker: cột theo thứ tự gốc}}
+        self.updated = updated or {}        # {ticker: thời điểm dữ liệu được lấy (epoch)}
+        self.source_mtime = source_mtime
+        self.dtypes = dtypes or {}          # {loại: {ticker: {cột: dtype gốc}}}
+
+        # (loại, ticker) → {năm: [vị trí dòng]}
+        self._years = {}
+        for kind, frame in frames.items():
+            for pos, (ticker, year) in enumerate(frame.index):
+                self._years.setdefault((kind, ticker), {}).setdefault(year, []).append(pos)
+
+    @property
+    def tickers(self):
+        """
+        Mã có đủ cả 3 loại báo cáo
+        """
+        sets = [set(by_ticker) for by_ticker in self.columns.values()]
+        return set.intersection(*sets) if sets else set()
+
+    def __contains__(self, ticker):
+        return all(ticker in by_ticker for by_ticker in self.columns.values())
+
+    def age(self, ticker):
+        """
+        Số giây kể từ lần dữ liệu của mã được lấy (CSV: mtime file, online: lúc tải)
+        """
+        return time.time() - self.updated.get(ticker, 0.0)
+
+    def years(self, ticker, kind="balance_sheet"):
+        return sorted(self._years.get((kind, ticker), ()))
+
+    def get(self, kind, ticker, years=None):
+        """
+        Các dòng của 1 mã cho 1 năm hoặc danh sách năm (None → mọi năm),
+        đúng cột và thứ tự dòng như file CSV gốc (index 0..k-1)
+        """
+        rows = self._years.get((kind, ticker))
+        if rows is None:
+            return None
+
+        if years is None:
+            pos = sorted(p for ps in rows.values() for p in ps)
+        else:
+            if not isinstance(years, (list, tuple, set, range)):
+                years = [years]
+            pos = sorted(p for y in years for p in rows.get(y, ()))
+        out = self.frames[kind].iloc[pos].reset_index()[self.columns[kind][ticker]]
+        for col, dtype in self.dtypes.get(kind, {}).get(ticker, {}).items():
+            if str(out[col].dtype) != dtype:
+                try:
+                    out[col] = out[col].astype(dtype)
+                except (TypeError, ValueError):
+                    pass
+        return out
+
+    def financials(self, ticker, years):
+        return {kind: self.get(kind, ticker, years) for kind in STATEMENT_SUFFIXES}
+
+    def replace(self, ticker, by_kind, updated=None):
+        """
+        Store mới với báo cáo của 1 mã thay bằng by_kind ({loại: DataFrame});
+        store cũ không đổi (reader đang dùng vẫn an toàn)
+        """
+        frames, columns, dtypes = {}, {}, {}
+        for kind in STATEMENT_SUFFIXES:
+            frame = self.frames[kind]
+            keep = frame[frame.index.get_level_values("ticker") != ticker]
+            columns[kind] = {**self.columns[kind], ticker: list(by_kind[kind].columns)}
+            dtypes[kind] = {**self.dtypes.get(kind, {}), ticker: _column_dtypes(by_kind[kind])}
+            frames[kind] = _normalize_dtypes(pd.concat([keep, _to_frame({ticker: by_kind[kind]})]), dtypes[kind])
+        updated = time.time() if updated is None else updated
+        return StatementStore(frames, columns, {**self.updated, ticker: updated}, self.source_mtime, dtypes)
+
+
+def load_statement_store(store_dir=STATEMENT_DIR):
+    with open(os.path.join(store_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    fmt = manifest["format"]
+    frames = {}
+    for kind in STATEMENT_SUFFIXES:
+        path = os.path.join(store_dir, f"{kind}.{fmt}")
+        frames[kind] = pd.read_parquet(path) if fmt == "parquet" else pd.read_pickle(path, compression=None)
+
+    return StatementStore(
+        frames,
+        manifest["columns"],
+        manifest.get("updated"),
+        manifest.get("source_mtime", 0.0),
+        manifest.get("dtypes")
+    )
+
+
+_STORES = {}
+_freshness = FreshnessCheck()
+_write_lock = threading.Lock()
+
+
+def get_statement_store(price_dir=PRICE_DIR, store_dir=STATEMENT_DIR):
+    """
+    Store báo cáo dùng chung cho cả process.
+    Tự chuyển đổi lại nếu chưa có store hoặc file CSV nguồn thay đổi
+    (kiểm tra tối đa 1 lần / FRESHNESS_TTL giây, xem price_store.FreshnessCheck).
+    """
+    store = _STORES.get(store_dir)
+    if store is not None and _freshness.fresh((price_dir, store_dir), price_dir):
+        return store
+
+    dir_mtime = FreshnessCheck.dir_mtime(price_dir)
+    files = _scan_statement_files(price_dir)
+    source_mtime = _source_mtime(files)
+
+    def stale(store):
+        return (
+            store is None
+            or store.source_mtime < source_mtime
+            or any(set(files[kind]) - set(store.columns[kind]) for kind in STATEMENT_SUFFIXES)
+        )
+
+    if stale(store):
+        try:
+            store = load_statement_store(store_dir)
+        except (OSError, ValueError, KeyError, ImportError, pickle.UnpicklingError, EOFError):
+            store = None
+
+        if stale(store):
+            store = build_statement_store(price_dir, store_dir)
+
+        _STORES[store_dir] = store
+
+    _freshness.mark((price_dir, store_dir), dir_mtime)
+    return store
+
+
+def update_statement_store(ticker, by_kind, price_dir=PRICE_DIR, store_dir=STATEMENT_DIR):
+    """
+    Ghi báo cáo vừa tải online của 1 mã vào store (write-through), trả về store mới
+    """
+    with _write_lock:
+        store = get_statement_store(price_dir, store_dir).replace(ticker, by_kind)
+        write_statement_store(store, store_dir)
+        _STORES[store_dir] = store
+    return store
+
+
+if __name__ == "__main__":
+    store = build_statement_store()
+    print(f"✅ Đã tạo statement store: {len(store.tickers)} mã → {STATEMENT_DIR}")
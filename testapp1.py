@@ -2,38 +2,40 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import threading
-import time
 import matplotlib.pyplot as plt
 
 
-from data_loader import (
-    download_multiple_prices,
-    download_market_index
-)
-
-from preprocessing import (
-    calculate_log_returns,
-    estimate_betas,
-    estimate_market_parameters,
-    capm_expected_returns,
-    capm_covariance_matrix
-)
+from preprocessing import capm_expected_returns
 
-from optimizer import optimize_capm_portfolio
+from optimizer import optimize_capm_portfolio, efficient_frontier
+from covariance import COVARIANCE_ESTIMATORS, estimate_covariance
+from moments_cache import get_moments_cache
+from universe_sigma import get_universe_sigma
+from monte_carlo import simulate_portfolio
+from tracing import span
 
-import subprocess
 import os
+import testml
+
+ML_OUTPUT = testml.OUTPUT_CSV
+
 
-ML_SCRIPT = "testml.py"
-ML_OUTPUT = "ket_qua_ranking_co_phieu_ml_industry_scaled.csv"
+@st.cache_resource
+def start_ranking_pipeline():
+    # Chạy 1 lần cho mỗi server process, trong thread nền
+    return testml.run_pipeline_in_background(verbose=False)
 
-# Chỉ chạy ML nếu file kết quả chưa tồn tại
-if not os.path.exists(ML_OUTPUT):
-    with st.spinner("Đang huấn luyện mô hình ML và tạo bảng xếp hạng..."):
-        subprocess.run(["python", ML_SCRIPT], check=True)
 
-from testengine import answer 
+# Chỉ chạy ML nếu bảng xếp hạng chưa có / cũ hơn dữ liệu đầu vào
+# (không chặn lần render đầu tiên của trang)
+ranking_job = start_ranking_pipeline() if testml.ranking_is_stale() else None
+
+
+def ranking_ready():
+    if ranking_job is not None and ranking_job.is_alive():
+        return False
+    return os.path.exists(ML_OUTPUT)
+
 # ===================== CONFIG =====================
 st.set_page_config(
     page_title="CAPM Portfolio Optimization (Excel-style)",
@@ -49,9 +51,28 @@ symbols_input = st.text_input(
     "VNM, FPT, HPG"
 )
 
+# Σ toàn thị trường do job đêm (python universe_sigma.py) tính sẵn
+universe = get_universe_sigma()
+# Cửa sổ dữ liệu lúc dựng Σ toàn thị trường (start/end None = toàn bộ lịch sử giá)
+universe_window = None if universe is None else (
+    f"{universe.meta.get('start') or 'đầu lịch sử'} → {universe.meta.get('end') or 'hiện tại'}"
+)
+use_universe = st.checkbox(
+    "Dùng Σ toàn thị trường tính sẵn (cắt theo rổ, không tính lại)",
+    value=False,
+    disabled=universe is None,
+    help=(
+        "Hiệp phương sai pairwise-complete tính sẵn, không theo ngày bắt đầu bên dưới"
+        + ("" if universe_window is None else f" (cửa sổ: {universe_window})")
+    )
+)
+
+# Σ tính sẵn có cửa sổ cố định → ngày bắt đầu chỉ dùng khi rổ có mã ngoài Σ (tính lại từ giá)
 start_date = st.date_input(
     "Ngày bắt đầu",
-    value=pd.to_datetime("2020-01-01")
+    value=pd.to_datetime("2020-01-01"),
+    disabled=use_universe,
+    help=None if not use_universe else f"Σ tính sẵn dùng cửa sổ {universe_window}"
 )
 
 rf = st.number_input(
@@ -61,6 +82,24 @@ rf = st.number_input(
     format="%.3f"
 )
 
+# Rổ nhiều mã so với số phiên → Σ mẫu gần suy biến, nên dùng shrinkage / mô hình nhân tố
+cov_method = st.selectbox(
+    "Ước lượng Σ",
+    list(COVARIANCE_ESTIMATORS),
+    index=0,
+    disabled=use_universe
+)
+
+# Monte Carlo danh mục sau tối ưu (0 kịch bản = bỏ qua)
+mc_paths = st.number_input("Số kịch bản Monte Carlo (0 = bỏ qua)", value=0, min_value=0, step=100_000)
+mc_horizon = st.number_input("Kỳ hạn mô phỏng (phiên)", value=21, min_value=1, step=1)
+mc_method = st.selectbox(
+    "Cách mô phỏng",
+    ["parametric", "bootstrap"],
+    disabled=use_universe,
+    help="parametric: lấy mẫu từ μ, Σ; bootstrap: bốc lại log return lịch sử của rổ"
+)
+
 
 # ===================== RUN =====================
 if st.button("Tối ưu danh mục"):
@@ -71,55 +110,58 @@ if st.button("Tối ưu danh mục"):
         st.warning("Cần ít nhất 2 cổ phiếu")
         st.stop()
 
-    # ===================== LOAD DATA =====================
-    with st.spinner("Đang tải dữ liệu giá..."):
-        prices = download_multiple_prices(
-            symbols,
-            start=start_date.strftime("%Y-%m-%d")
-        )
-
-        market_price = download_market_index(
-            start=start_date.strftime("%Y-%m-%d")
+    missing = universe.missing(symbols) if use_universe else []
+    if missing:
+        st.info(f"Σ tính sẵn không có {', '.join(missing)} → tính lại từ giá")
+
+    if use_universe and not missing:
+        # ===================== μ, Σ, β CẮT TỪ MA TRẬN TOÀN THỊ TRƯỜNG =====================
+        with span("capm.universe_slice", symbols=len(symbols)):
+            expected_returns, cov_capm, betas = universe.slice(symbols, rf)
+        expected_rm, market_variance = universe.expected_rm, universe.market_variance
+        stock_log_returns = None
+    else:
+        # ===================== LOAD DATA + CAPM PARAMETERS =====================
+        # Log return, beta, E(Rm), σ²(M), Σ không phụ thuộc rf → lấy từ cache nếu đã tính
+        # (đổi rf / bấm lại cùng rổ / rổ con của rổ đã tính đều không tính lại)
+        # Mỗi bước đo bằng span "capm.*" (bật bằng TRACE=1, xem: python tracing.py --prefix capm.)
+        with st.spinner("Đang tải dữ liệu giá..."):
+            moments = get_moments_cache().get_or_compute(
+                symbols,
+                start=start_date.strftime("%Y-%m-%d")
+            )
+
+        if moments is None:
+            st.error("Không tải được dữ liệu")
+            st.stop()
+
+        stock_log_returns = moments.stock_returns
+        market_log_returns = moments.market_returns
+        betas = moments.betas
+        expected_rm, market_variance = moments.expected_rm, moments.market_variance
+
+        expected_returns = capm_expected_returns(
+            betas=betas,
+            expected_rm=expected_rm,
+            rf=rf
         )
 
-    if prices is None or market_price is None:
-        st.error("Không tải được dữ liệu")
-        st.stop()
-
-    # ===================== LOG RETURNS =====================
-    stock_log_returns = calculate_log_returns(prices)
-    market_log_returns = calculate_log_returns(market_price)["VNINDEX"]
-
-    # Đồng bộ thời gian (GIỐNG EXCEL)
-    data = stock_log_returns.join(market_log_returns, how="inner")
-    # ÉP lại đúng khoảng thời gian user chọn
-    data = data[data.index >= pd.to_datetime(start_date)]
-    stock_log_returns = data[symbols]
-    market_log_returns = data["VNINDEX"]
-
-    # ===================== CAPM PARAMETERS =====================
-    betas = estimate_betas(stock_log_returns, market_log_returns)
-
-    expected_rm, market_variance = estimate_market_parameters(
-        market_log_returns
-    )
+        # "sample": Σ = stock_log_returns.cov() * 252 dạng operator, lấy sẵn từ cache
+        if cov_method == "sample":
+            cov_capm = moments.cov
+        else:
+            with span("capm.cov", method=cov_method):
+                cov_capm = estimate_covariance(stock_log_returns, cov_method, market_log_returns)
 
     # 👉 Market premium (THIẾU DÒNG NÀY TRƯỚC ĐÂY)
     market_premium = expected_rm - rf
 
-    expected_returns = capm_expected_returns(
-        betas=betas,
-        expected_rm=expected_rm,
-        rf=rf
-    )
-
-    cov_capm = stock_log_returns.cov() * 252
-
     st.write("Expected returns:", expected_returns)
-    st.write("Cov diag:", np.diag(cov_capm))
+    st.write("Cov diag:", cov_capm.diag())
+    st.write(f"Số điều kiện Σ (λmax / λmin): {cov_capm.condition_number():,.1f}")
 
     # ===================== OPTIMIZATION (EXCEL SOLVER) =====================
-    with st.spinner("Đang tối ưu danh mục (Excel Solver logic)..."):
+    with st.spinner("Đang tối ưu danh mục (Excel Solver logic)..."), span("capm.optimize"):
       weights = optimize_capm_portfolio(
             expected_returns=expected_returns,
             cov=cov_capm,
@@ -141,7 +183,7 @@ if st.button("Tối ưu danh mục"):
 
     # ===================== PORTFOLIO METRICS =====================
     port_return = np.dot(weights.values, expected_returns.values)
-    port_variance = weights.values @ cov_capm.values @ weights.values
+    port_variance = cov_capm.quad_form(weights.values)
     port_vol = np.sqrt(port_variance)
 
     sharpe = (port_return - rf) / port_vol if port_vol > 0 else 0
@@ -151,6 +193,46 @@ if st.button("Tối ưu danh mục"):
     st.write(f"📌 Std Dev σp: **{port_vol:.4f}**")
     st.write(f"📌 Sharpe Ratio: **{sharpe:.4f}**")
 
+    # ===================== MONTE CARLO =====================
+    if mc_paths:
+        # Σ toàn thị trường không kèm log return lịch sử → chỉ parametric
+        method = "parametric" if stock_log_returns is None else mc_method
+        with st.spinner("Đang mô phỏng Monte Carlo..."), \
+                span("capm.monte_carlo", method=method, paths=int(mc_paths)):
+            mc = simulate_portfolio(
+                weights.values,
+                expected_returns=expected_returns.values,
+                cov=cov_capm,
+                history=None if stock_log_returns is None else stock_log_returns[weights.index],
+                method=method,
+                n_paths=int(mc_paths),
+                horizon=int(mc_horizon)
+            )
+
+        st.markdown(f"### 🎲 Monte Carlo ({mc.n_paths:,} kịch bản, {mc.horizon} phiên, {method})")
+        st.write(f"📌 Lợi suất TB: **{mc.mean:.4f}**, độ lệch chuẩn: **{mc.std:.4f}**")
+        st.dataframe(mc.table())
+
+    # ===================== EFFICIENT FRONTIER =====================
+    st.markdown("### 📈 Đường biên hiệu quả")
+
+    # Cả đường biên trong 1 lần gọi (ret, vol, weights cho từng điểm)
+    try:
+        with span("capm.frontier"):
+            frontier = efficient_frontier(expected_returns, cov_capm, n_points=30)
+    except (RuntimeError, np.linalg.LinAlgError) as e:
+        frontier = None
+        st.warning(f"Không vẽ được đường biên hiệu quả: {e}")
+
+    if frontier is not None:
+        fig, ax = plt.subplots()
+        ax.plot(frontier["vol"], frontier["ret"], label="Efficient frontier")
+        ax.scatter([port_vol], [port_return], color="red", zorder=3, label="Max Sharpe")
+        ax.set_xlabel("Std Dev σp")
+        ax.set_ylabel("Expected Return")
+        ax.legend()
+        st.pyplot(fig)
+
     # ===================== CAPM TABLE =====================
     st.markdown("### 📉 Tham số CAPM")
     st.dataframe(
@@ -160,13 +242,22 @@ if st.button("Tối ưu danh mục"):
         })
     )
 
-    st.write("Số quan sát:", len(stock_log_returns))
-    st.write(
-        "Thời gian:",
-        stock_log_returns.index.min(),
-        "→",
-        stock_log_returns.index.max()
-    )
+    if stock_log_returns is not None:
+        st.write("Số quan sát:", len(stock_log_returns))
+        st.write(
+            "Thời gian:",
+            stock_log_returns.index.min(),
+            "→",
+            stock_log_returns.index.max()
+        )
+    else:
+        n_obs = universe.n_obs[universe.positions(symbols)]
+        st.write("Số quan sát (theo mã):", dict(zip(symbols, n_obs.tolist())))
+        st.write("Cửa sổ Σ toàn thị trường (không theo ngày bắt đầu):", universe_window)
+        st.write("Σ toàn thị trường tính lúc:", pd.Timestamp(universe.meta["built_at"], unit="s"))
+
+    with st.expander("Cache mômen (log return / beta / Σ)"):
+        st.write(get_moments_cache().stats())
 # =========================
 # ==============SIDEBAR===========
 with st.sidebar:
@@ -196,8 +287,6 @@ with st.sidebar:
 
     user_input = st.chat_input("Nhập câu hỏi về cổ phiếu...")
 
-    from queue import Queue
-
     if user_input:
         # 1. Lưu và hiển thị ngay câu hỏi người dùng
         st.session_state.chat_messages.append(
@@ -207,41 +296,27 @@ with st.sidebar:
         with st.chat_message("user"):
             st.write(user_input)
 
-        # 2. Tạo bong bóng bot với trạng thái đang suy luận
+        # 2. Bong bóng bot: hiện token ngay khi LLM sinh ra
         with st.chat_message("assistant"):
-            typing_placeholder = st.empty()
-            typing_placeholder.markdown("⏳ *Đang suy luận...*")
-
-        def bot_task():
-            try:
-                return answer(user_input)
-            except Exception as e:
-                return f"Lỗi hệ thống: {e}"
-
-        from queue import Queue
-        q = Queue()
-
-        def run():
-            q.put(bot_task())
-
-        t = threading.Thread(target=run)
-        t.start()
-
-        # 3. Chờ bot xử lý
-        while t.is_alive():
-            typing_placeholder.markdown("⏳ *Đang suy luận...*")
-            time.sleep(0.2)
-
-        final_answer = q.get()
-
-        # 4. Hiệu ứng gõ chữ
-        typed = ""
-        for ch in final_answer:
-            typed += ch
-            typing_placeholder.markdown(typed)
-            time.sleep(0.01)
-
-        # 5. Lưu lịch sử
+            if not ranking_ready():
+                final_answer = "⏳ Hệ thống đang huấn luyện mô hình ML và tạo bảng xếp hạng, vui lòng thử lại sau giây lát."
+                st.markdown(final_answer)
+            else:
+                try:
+                    from testengine import answer
+                    with st.spinner("Đang suy luận..."):
+                        response = answer(user_input, stream=True)
+
+                    if isinstance(response, str):
+                        final_answer = response
+                        st.markdown(final_answer)
+                    else:
+                        final_answer = st.write_stream(response)
+                except Exception as e:
+                    final_answer = f"Lỗi hệ thống: {e}"
+                    st.markdown(final_answer)
+
+        # 3. Lưu lịch sử
         st.session_state.chat_messages.append(
             {"role": "assistant", "content": final_answer}
         )
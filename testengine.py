@@ -1,165 +1,273 @@
-from intent_router import detect_intent
+from query_parser import QueryParse, parse_query
+import retriever
 from retriever import (
     retrieve_stock_groups,
     get_comparison,
     get_ranking,
-    get_latest_financials,
-    ALL_INDUSTRIES_LOWER
+    get_latest_financials
 )
 
 from testgenerator import (
-    build_recommend_context, ask_llm_recommend,
-    build_comparison_context, ask_llm_comparison,
-    build_ranking_context, ask_llm_ranking,
-    ask_llm_financial
+    build_recommend_context, build_recommend_prompt,
+    build_comparison_context, build_comparison_prompt,
+    build_ranking_context, build_ranking_prompt,
+    build_financial_context, build_financial_prompt,
+    call_llm, acall_llm, aclose_async_client,
+    estimate_tokens, context_stats
 )
-import re
+from tracing import span
+import asyncio
+from typing import NamedTuple, Optional
 
 
-# ===================== INDUSTRY =====================
+# ===================== ENTITIES =====================
+
+def parse(query: str) -> QueryParse:
+    """
+    Intent + ngành + chỉ số + top-N + ticker trong 1 lần quét
+    (danh sách ngành nạp lười ở lần truy vấn đầu, không đọc CSV khi import)
+    """
+    return parse_query(query, retriever.ALL_INDUSTRIES_LOWER)
+
 
 def extract_industry(query_lower):
-    for ind in ALL_INDUSTRIES_LOWER:
-        if ind in query_lower:
-            return ind
-
-    keyword_map = {
-        "bia": "bia và đồ uống",
-        "đồ uống": "bia và đồ uống",
-        "ngân hàng": "ngân hàng",
-        "bank": "ngân hàng",
-        "y tế": "thiết bị và dịch vụ y tế",
-        "dược": "dược phẩm",
-        "bệnh viện": "thiết bị và dịch vụ y tế",
-        "bán lẻ": "bán lẻ",
-        "bảo hiểm nhân thọ": "bảo hiểm nhân thọ",
-        "nhân thọ": "bảo hiểm nhân thọ",
-        "bảo hiểm": "bảo hiểm phi nhân thọ",
-        "chứng khoán": "dịch vụ tài chính",
-        "tài chính": "dịch vụ tài chính",
-        "xây dựng": "xây dựng và vật liệu",
-        "vật liệu": "xây dựng và vật liệu",
-        "điện": "sản xuất & phân phối điện",
-        "dầu khí": "sản xuất dầu khí",
-        "viễn thông": "viễn thông di động",
-        "thép": "kim loại",
-        "kim loại": "kim loại",
-        "hóa chất": "hóa chất",
-        "khai khoáng": "khai khoáng",
-        "vận tải": "vận tải",
-        "ô tô": "ô tô và phụ tùng",
-        "xe": "ô tô và phụ tùng",
-        "phần mềm": "phần mềm & dịch vụ máy tính",
-        "cntt": "phần mềm & dịch vụ máy tính",
-        "thực phẩm": "sản xuất thực phẩm",
-        "truyền thông": "truyền thông",
-        "thuốc lá": "thuốc lá",
-        "điện tử": "điện tử & thiết bị điện",
-    }
-
-    for k, v in keyword_map.items():
-        if k in query_lower:
-            return v
-
-    return None
-
-# ===================== FACTOR =====================
-
-FACTOR_MAP = {
-    "roa": "ROA",
-    "roe": "ROE",
-    "de": "DE",
-    "d/e": "DE",
-    "pb": "PB",
-    "p/b": "PB",
-    "eps": "EPS",
-    "bv": "BV",
-    "giá trị sổ sách": "BV",
-    "vốn hóa": "Market_Cap",
-    "market cap": "Market_Cap",
-    "lợi nhuận trên cổ phiếu": "EPS",
-    "score": "Score"
-}
+    return parse(query_lower).industry
+
 
 def extract_factor(query_lower):
-    for k, v in FACTOR_MAP.items():
-        if k in query_lower:
-            return v
-    return None
+    return parse(query_lower).factor
+
 
 def extract_top_n(query_lower, default=5):
-    m = re.search(r"top\s*(\d+)", query_lower)
-    if m:
-        return int(m.group(1))
-    return default
+    top_n = parse(query_lower).top_n
+    return default if top_n is None else top_n
 
 # ===================== MAIN ENGINE =====================
 
-def answer(query: str):
-    intent = detect_intent(query)
-    ql = query.lower()
+class Plan(NamedTuple):
+    """
+    Kết quả định tuyến + truy xuất (chưa gọi LLM):
+    prompt để gửi LLM, hoặc message trả thẳng cho người dùng
+    """
+    intent: str
+    prompt: Optional[str] = None
+    message: Optional[str] = None
+    tokens: int = 0             # số token ước lượng của prompt
+
+
+def plan(query: str) -> Plan:
+    """
+    Phần chạy local của answer: intent → truy xuất dữ liệu → dựng prompt
+    (ghi kích thước prompt theo intent vào context_stats)
+    """
+    p = _plan(query)
+    if p.prompt is None:
+        return p
+    tokens = estimate_tokens(p.prompt)
+    context_stats.record(p.intent, tokens)
+    return p._replace(tokens=tokens)
+
+
+def _plan(query: str) -> Plan:
+    with span("parse"):
+        parsed = parse(query)
+    intent = parsed.intent
 
     if intent == "out_of_domain":
-        return "Hệ thống chỉ hỗ trợ các câu hỏi về tài chính, cổ phiếu và báo cáo doanh nghiệp."
+        return Plan(intent, message="Hệ thống chỉ hỗ trợ các câu hỏi về tài chính, cổ phiếu và báo cáo doanh nghiệp.")
 
     # ===== CASE 1: RECOMMENDATION =====
     if intent == "recommendation":
-        industry = extract_industry(ql)
+        industry = parsed.industry
         if not industry:
-            return "Không xác định được ngành."
+            return Plan(intent, message="Không xác định được ngành.")
 
-        groups = retrieve_stock_groups(industry)
+        with span("retrieve"):
+            groups = retrieve_stock_groups(industry)
         if not groups:
-            return "Không có dữ liệu cho ngành này."
+            return Plan(intent, message="Không có dữ liệu cho ngành này.")
 
-        context = build_recommend_context(groups, industry)
-        return ask_llm_recommend(context, industry)
+        with span("context"):
+            context = build_recommend_context(groups, industry)
+            return Plan(intent, prompt=build_recommend_prompt(context, industry))
 
     # ===== CASE 2: COMPARISON =====
     if intent == "comparison":
-        tickers = re.findall(r"\b[A-Z]{2,5}\b", query.upper())
-        table = get_comparison(tickers)
+        with span("retrieve"):
+            table = get_comparison(parsed.tickers)
 
-        table = table.rename(columns={
-            "roa": "ROA", "ROA_mean": "ROA", "return_on_assets": "ROA",
-            "de": "DE", "de_ratio": "DE",
-            "pb": "PB", "p_b": "PB",
-            "bv": "BV", "book_value": "BV",
-            "market_cap": "Market_Cap", "MarketCap": "Market_Cap",
-        })
+            table = table.rename(columns={
+                "roa": "ROA", "ROA_mean": "ROA", "return_on_assets": "ROA",
+                "de": "DE", "de_ratio": "DE",
+                "pb": "PB", "p_b": "PB",
+                "bv": "BV", "book_value": "BV",
+                "market_cap": "Market_Cap", "MarketCap": "Market_Cap",
+            })
 
-        context = build_comparison_context(table)
-        return ask_llm_comparison(context, table)
+        with span("context"):
+            context = build_comparison_context(table)
+            return Plan(intent, prompt=build_comparison_prompt(context, table))
 
     # ===== CASE 3: RANKING =====
     if intent == "ranking":
-        industry = extract_industry(ql)
+        industry = parsed.industry
         if not industry:
-            return "Không xác định được ngành."
+            return Plan(intent, message="Không xác định được ngành.")
 
-        factor = extract_factor(ql)
+        factor = parsed.factor
         if not factor:
-            return "Không xác định được chỉ số (ROA, ROE, D/E, P/B, EPS, BV, Market Cap, Score)."
+            return Plan(intent, message="Không xác định được chỉ số (ROA, ROE, D/E, P/B, EPS, BV, Market Cap, Score).")
 
-        top_n = extract_top_n(ql, default=5)
+        top_n = 5 if parsed.top_n is None else parsed.top_n
 
-        table = get_ranking(industry, factor, top_n=top_n, ascending=False)
+        with span("retrieve"):
+            table = get_ranking(industry, factor, top_n=top_n, ascending=False)
         if table is None or table.empty:
-            return f"Ngành {industry} không có dữ liệu cho chỉ số {factor}."
+            return Plan(intent, message=f"Ngành {industry} không có dữ liệu cho chỉ số {factor}.")
 
-        context = build_ranking_context(table, industry, factor)
-        return ask_llm_ranking(context, industry, factor)
+        with span("context"):
+            context = build_ranking_context(table, industry, factor)
+            return Plan(intent, prompt=build_ranking_prompt(context, industry, factor))
 
     # ===== CASE 4: FINANCIAL STATEMENT =====
     if intent == "financial_statement":
-        ticker = re.findall(r"\b[A-Z]{2,5}\b", query.upper())[-1]
+        ticker = parsed.tickers[-1]
 
-        fin_data = get_latest_financials(ticker)
+        with span("retrieve"):
+            fin_data = get_latest_financials(ticker)
         if not fin_data:
-            return "Không lấy được báo cáo tài chính cho mã này."
+            return Plan(intent, message="Không lấy được báo cáo tài chính cho mã này.")
+
+    with span("context"):
+        latest_year = fin_data["year"].max()
+        context = build_financial_context(fin_data, ticker)
+        return Plan(intent, prompt=build_financial_prompt(context, ticker, latest_year))
+
+
+def answer(query: str, stream: bool = False):
+    """
+    Trả lời câu hỏi của người dùng
+    stream=True → câu trả lời của LLM là generator từng đoạn token
+    (các thông báo lỗi / ngoài phạm vi vẫn là str)
+    """
+    with span("answer", stream=stream) as s:
+        p = plan(query)
+        s.set(intent=p.intent, tokens=p.tokens)
+        if p.prompt is None:
+            return p.message
+        return call_llm(p.prompt, stream=stream)
+
+
+# ===================== ASYNC / BATCH =====================
+
+class BatchResult(NamedTuple):
+    index: int                  # vị trí trong danh sách queries
+    query: str
+    answer: Optional[str]
+    error: Optional[BaseException]
+    elapsed: float              # giây, tính từ lúc bắt đầu batch
+
+
+class RateLimiter:
+    """
+    Giới hạn `rate` lần gọi LLM / giây (dàn đều khoảng cách giữa các lần gọi)
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def aanswer(query: str, timeout: float = None):
+    """
+    Bản async của answer (không stream)
+    """
+    with span("answer") as s:
+        p = plan(query)
+        s.set(intent=p.intent, tokens=p.tokens)
+        if p.prompt is None:
+            return p.message
+        return await acall_llm(p.prompt, timeout=timeout)
+
+
+async def aanswer_many(queries, concurrency: int = 8, rate: float = None, timeout: float = 60.0):
+    """
+    Trả lời nhiều câu hỏi, trả về BatchResult ngay khi từng câu xong (thứ tự hoàn thành):
+        - định tuyến + truy xuất chạy local cho mọi câu trước
+        - câu có cùng prompt (context giống hệt) chỉ gọi LLM 1 lần
+        - tối đa `concurrency` lời gọi LLM đồng thời, `rate` lời gọi / giây,
+          mỗi lời gọi quá `timeout` giây → lỗi asyncio.TimeoutError
+    """
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+
+    async def run(prompt):
+        async with semaphore:
+            return await acall_llm(prompt, timeout=timeout, limiter=limiter)
+
+    by_prompt = {}
+    for i, q in enumerate(queries):
+        try:
+            p = plan(q)
+        except Exception as e:
+            yield BatchResult(i, q, None, e, loop.time() - t0)
+            continue
+        if p.prompt is None:
+            yield BatchResult(i, q, p.message, None, loop.time() - t0)
+        else:
+            by_prompt.setdefault(p.prompt, []).append((i, q))
+
+    pending = {asyncio.ensure_future(run(prompt)): items for prompt, items in by_prompt.items()}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                items = pending.pop(task)
+                error = task.exception()
+                text = None if error is not None else task.result()
+                for i, q in items:
+                    yield BatchResult(i, q, text, error, loop.time() - t0)
+    finally:
+        # Người gọi dừng giữa chừng → hủy các lời gọi còn lại và chờ chúng dừng hẳn
+        # (answer_many đóng event loop ngay sau đó)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
 
-    latest_year = fin_data["year"].max()
-    return ask_llm_financial(fin_data, ticker, latest_year)
+def answer_many(queries, concurrency: int = 8, rate: float = None, timeout: float = 60.0):
+    """
+    Bản đồng bộ của aanswer_many (generator, kết quả theo thứ tự hoàn thành);
+    event loop riêng của lần gọi → đóng luôn AsyncOpenAI của loop đó khi xong
+    """
+    loop = asyncio.new_event_loop()
+    results = aanswer_many(queries, concurrency=concurrency, rate=rate, timeout=timeout)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        try:
+            loop.run_until_complete(results.aclose())
+        finally:
+            loop.run_until_complete(aclose_async_client())
+            loop.close()
 
 
         
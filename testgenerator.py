@@ -1,50 +1,256 @@
-from openai import OpenAI
-import streamlit as st
+import os
+import re
+import asyncio
+import threading
+import weakref
 
-# ===================== LLM SETUP =====================
-GROQ_API_KEY = st.secrets["GROQ_API_KEY"]
+import numpy as np
+import pandas as pd
 
-client = OpenAI(
-    api_key=GROQ_API_KEY,
-    base_url="https://api.groq.com/openai/v1"
-)
+from llm_cache import get_cache, make_key, data_version
+from tracing import span, traced_iter
+from retriever import CSV_PATH
 
+# ===================== LLM SETUP =====================
 MODEL_NAME = "llama-3.1-8b-instant"
-
-def call_llm(prompt: str):
-    response = client.chat.completions.create(
+SYSTEM_PROMPT = "Bạn là mô hình ngôn ngữ tuân thủ tuyệt đối định dạng và chỉ dùng dữ liệu trong CONTEXT."
+TEMPERATURE = 0.2
+MAX_TOKENS = 1500
+# Endpoint OpenAI-compatible (đổi sang server local / fake khi load-test)
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+
+_client = None
+_async_client = None
+_async_clients = weakref.WeakKeyDictionary()   # AsyncOpenAI gắn với event loop
+
+
+def get_api_key():
+    """
+    GROQ_API_KEY trong st.secrets (app), không có thì lấy biến môi trường
+    """
+    try:
+        import streamlit as st
+        return st.secrets["GROQ_API_KEY"]
+    except Exception:
+        key = os.environ.get("GROQ_API_KEY")
+        if not key:
+            raise RuntimeError("Chưa cấu hình GROQ_API_KEY (st.secrets hoặc biến môi trường)")
+        return key
+
+
+def get_client():
+    """
+    OpenAI client tạo ở lần gọi LLM đầu tiên (import module không tốn chi phí)
+    """
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(
+            api_key=get_api_key(),
+            base_url=LLM_BASE_URL
+        )
+    return _client
+
+
+def get_async_client():
+    """
+    AsyncOpenAI cho event loop đang chạy (mỗi loop 1 client, dùng chung connection pool)
+    """
+    if _async_client is not None:
+        return _async_client
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=get_api_key(), base_url=LLM_BASE_URL)
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """
+    Đóng AsyncOpenAI của event loop đang chạy (connection pool) và bỏ khỏi bảng;
+    gọi trước khi đóng loop. Client gắn bằng set_async_client do người gắn tự đóng
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def set_client(client):
+    """
+    Thay client (vd: stub local thay cho endpoint Groq khi test)
+    """
+    global _client
+    _client = client
+
+
+def set_async_client(client):
+    global _async_client
+    _async_client = client
+
+
+def _cache_key(prompt):
+    return make_key(MODEL_NAME, SYSTEM_PROMPT, prompt, TEMPERATURE, MAX_TOKENS, data_version(CSV_PATH))
+
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def call_llm(prompt: str, use_cache: bool = True, stream: bool = False):
+    """
+    stream=False → trả về toàn bộ câu trả lời (str)
+    stream=True  → generator trả từng đoạn token ngay khi model sinh ra
+    """
+    # Câu hỏi trùng context → trả lời từ cache, tự mất hiệu lực khi CSV xếp hạng đổi
+    key = _cache_key(prompt)
+    cache = get_cache()
+    cached = cache.get(key) if use_cache else None
+
+    if stream:
+        return traced_iter("llm.stream", _stream_llm(prompt, key, cached), cached=cached is not None)
+    if cached is not None:
+        return cached
+
+    with span("llm"):
+        response = get_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=_messages(prompt),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS
+        )
+    text = response.choices[0].message.content.strip()
+    cache.put(key, text)
+    return text
+
+
+def _stream_llm(prompt, key, cached):
+    if cached is not None:
+        yield cached
+        return
+
+    response = get_client().chat.completions.create(
         model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": "Bạn là mô hình ngôn ngữ tuân thủ tuyệt đối định dạng và chỉ dùng dữ liệu trong CONTEXT."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.2,
-        max_tokens=1500
+        messages=_messages(prompt),
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        stream=True
     )
-    return response.choices[0].message.content.strip()
 
-# ===================== CONTEXT BUILDER (DÙNG CHUNG) =====================
+    parts = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            # Bỏ khoảng trắng đầu như bản không stream (.strip())
+            if not parts:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+            parts.append(delta)
+            yield delta
+
+    # Chỉ cache khi stream chạy hết (người dùng không ngắt giữa chừng)
+    cache_text = "".join(parts).strip()
+    if cache_text:
+        get_cache().put(key, cache_text)
+
+
+async def acall_llm(prompt: str, use_cache: bool = True, timeout: float = None, limiter=None):
+    """
+    Bản async của call_llm (dùng chung cache), timeout tính bằng giây
+    limiter: chỉ chờ rate limit khi thật sự gọi LLM (cache hit không tốn lượt)
+    """
+    key = _cache_key(prompt)
+    cache = get_cache()
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if limiter is not None:
+        await limiter.wait()
+
+    with span("llm"):
+        response = await asyncio.wait_for(
+            get_async_client().chat.completions.create(
+                model=MODEL_NAME,
+                messages=_messages(prompt),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS
+            ),
+            timeout
+        )
+    text = response.choices[0].message.content.strip()
+    cache.put(key, text)
+    return text
 
-def fnum(x, nd=3):
-    return f"{x:.{nd}f}"
+# ===================== CONTEXT BUILDER (DÙNG CHUNG) =====================
 
 def fcap(x):
     return f"{x/1e9:,.0f} tỷ"
 
+def _format_column(df, f):
+    """
+    Định dạng cả cột 1 lần (thay cho định dạng từng ô)
+    """
+    values = df[f].tolist()
+    if f in ["Market_Cap", "BV"]:
+        return [f"{f} {x / 1e9:,.0f} tỷ" for x in values]
+    return [f"{f} {x:.3f}" for x in values]
+
+
 def inline(df, fields):
-    rows = []
-    for _, r in df.iterrows():
-        parts = [r["ticker"]]
-        for f in fields:
-            if f in r:
-                if f in ["Market_Cap", "BV"]:
-                    parts.append(f"{f} {fcap(r[f])}")
-                else:
-                    parts.append(f"{f} {fnum(r[f])}")
-        rows.append(" (" + ", ".join(parts) + ")")
-    return " và ".join(rows)
-
-    
+    columns = [df["ticker"].tolist()]
+    columns += [_format_column(df, f) for f in fields if f in df.columns]
+    return " và ".join(" (" + ", ".join(parts) + ")" for parts in zip(*columns))
+
+
+# ===================== TOKEN BUDGET =====================
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Ước lượng số token của prompt (không phụ thuộc tokenizer của model):
+    mỗi từ / dấu câu ~1 token, từ dài (số lớn, từ ghép tiếng Anh) tính thêm mỗi 4 ký tự
+    """
+    return sum(1 + (len(t) - 1) // 4 for t in _TOKEN.findall(text))
+
+
+class ContextStats:
+    """
+    Thống kê kích thước context theo intent (số lần, tổng / lớn nhất / gần nhất)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_intent = {}
+
+    def record(self, intent, tokens):
+        with self._lock:
+            s = self.by_intent.setdefault(intent, {"count": 0, "total": 0, "max": 0, "last": 0})
+            s["count"] += 1
+            s["total"] += tokens
+            s["max"] = max(s["max"], tokens)
+            s["last"] = tokens
+
+    def summary(self):
+        with self._lock:
+            return {
+                intent: {**s, "mean": s["total"] / s["count"]}
+                for intent, s in self.by_intent.items()
+            }
+
+
+context_stats = ContextStats()
+
 
 def build_context(title, df, fields):
     return f"""
@@ -69,8 +275,8 @@ CÂN BẰNG:
 {inline(groups["best_balance"], ["Score", "Market_Cap"])}
 """
 
-def ask_llm_recommend(context, industry):
-    prompt = f"""
+def build_recommend_prompt(context, industry):
+    return f"""
 Bạn là chuyên gia phân tích đầu tư định lượng. 
 CHỈ được sử dụng dữ liệu trong CONTEXT.
 
@@ -99,7 +305,10 @@ Viết 1 -2 câu bám sát theo ý này:
 Đoạn kết luận (1–2 câu, không dài hơn):
 Từ góc độ đầu tư bền vững, cổ phiếu đáng chú ý nhất là cổ phiếu thuộc nhóm dẫn đầu về quy mô vốn hóa (ở đoạn 2) nhưng có Score cao nhất, thể hiện sự cân bằng giữa chất lượng doanh nghiệp, mức độ ổn định và tiềm năng sinh lời dài hạn.
 """
-    return call_llm(prompt)
+
+
+def ask_llm_recommend(context, industry, stream=False):
+    return call_llm(build_recommend_prompt(context, industry), stream=stream)
 
 # ===================== COMPARISON =====================
 
@@ -129,10 +338,10 @@ def build_comparison_context(table):
 
 
 
-def ask_llm_comparison(context, table):
+def build_comparison_prompt(context, table):
     a, b = table.iloc[0]["ticker"], table.iloc[1]["ticker"]
 
-    prompt = f"""
+    return f"""
 Bạn là chuyên gia phân tích tài chính.
 
 CHỈ dùng số liệu trong CONTEXT.
@@ -168,7 +377,10 @@ Câu kết luận:
  Tổng hợp lại, cổ phiếu đáng ưu tiên đầu tư hơn là ..., vì ...
 
 """
-    return call_llm(prompt)
+
+
+def ask_llm_comparison(context, table, stream=False):
+    return call_llm(build_comparison_prompt(context, table), stream=stream)
 
 # ===================== RANKING =====================
 
@@ -191,8 +403,8 @@ def build_ranking_context(table, industry, factor):
     )
 
 
-def ask_llm_ranking(context, industry, factor):
-    prompt = f"""
+def build_ranking_prompt(context, industry, factor):
+    return f"""
 Bạn là hệ thống báo cáo định lượng.
 
 CHỈ sao chép và sắp xếp lại dữ liệu trong CONTEXT.
@@ -212,13 +424,99 @@ BẮT BUỘC ĐỊNH DẠNG (vi phạm là sai):
 Dòng cuối cùng:
 Đây là toàn bộ nhóm dẫn đầu theo {factor} của ngành {industry}.
 """
-    return call_llm(prompt)
+
+
+def ask_llm_ranking(context, industry, factor, stream=False):
+    return call_llm(build_ranking_prompt(context, industry, factor), stream=stream)
 
 
 # ===================== FINANCIAL REPORT =====================
 
-def ask_llm_financial(context, ticker, year):
-    prompt = f"""
+# Ngân sách token cho phần số liệu báo cáo tài chính trong prompt
+FINANCIAL_TOKEN_BUDGET = 400
+
+STATEMENT_TITLES = {
+    "balance_sheet": "BẢNG CÂN ĐỐI KẾ TOÁN",
+    "income_statement": "KẾT QUẢ KINH DOANH",
+    "cash_flow": "LƯU CHUYỂN TIỀN TỆ",
+}
+
+# Dòng ưu tiên (cấu trúc vốn, sinh lời, dòng tiền) – lấy trước khi còn ngân sách
+KEY_LINES = {
+    "balance_sheet": [
+        "TOTAL ASSETS (Bn. VND)", "CURRENT ASSETS (Bn. VND)", "Cash and cash equivalents (Bn. VND)",
+        "LONG-TERM ASSETS (Bn. VND)", "LIABILITIES (Bn. VND)", "Current liabilities (Bn. VND)",
+        "Long-term liabilities (Bn. VND)", "Short-term borrowings (Bn. VND)", "Long-term borrowings (Bn. VND)",
+        "OWNER'S EQUITY(Bn.VND)", "Undistributed earnings (Bn. VND)",
+    ],
+    "income_statement": [
+        "Revenue (Bn. VND)", "Revenue YoY (%)", "Gross Profit", "Operating Profit/Loss",
+        "Profit before tax", "Net Profit For the Year", "Attribute to parent company (Bn. VND)",
+        "Attribute to parent company YoY (%)", "Financial Expenses", "Interest Expenses",
+    ],
+    "cash_flow": [
+        "Net cash inflows/outflows from operating activities", "Net Cash Flows from Investing Activities",
+        "Cash flows from financial activities", "Purchase of fixed assets", "Dividends paid",
+        "Net increase/decrease in cash and cash equivalents", "Cash and Cash Equivalents at the end of period",
+    ],
+}
+
+
+_UNIT = re.compile(r"\s*\(Bn\.\s*VND\)")
+
+
+def _statement_lines(kind, table):
+    """
+    1 dòng "chỉ tiêu: giá trị" cho mỗi cột số khác 0 của năm báo cáo
+    → [(độ ưu tiên, thứ tự cột, text)], độ ưu tiên (0, i) cho KEY_LINES, (1, 0) cho phần còn lại
+    """
+    if table is None or table.empty:
+        return []
+
+    row = table.iloc[0].drop(["ticker", "yearReport"], errors="ignore")
+    values = pd.to_numeric(row, errors="coerce")
+    values = values[values.notna() & (values != 0)]
+
+    key_rank = {name: (0, i) for i, name in enumerate(KEY_LINES.get(kind, []))}
+    lines = []
+    for order, (name, x) in enumerate(values.items()):
+        # Đơn vị đã ghi ở tiêu đề → bỏ "(Bn. VND)" khỏi tên chỉ tiêu cho gọn
+        label = _UNIT.sub("", name)
+        text = f"{label}: {x * 100:.2f}%" if "(%)" in name else f"{label}: {fcap(x)}"
+        lines.append((key_rank.get(name, (1, 0)), order, text))
+    return lines
+
+
+def build_financial_context(fin_data, ticker, max_tokens=FINANCIAL_TOKEN_BUDGET):
+    """
+    Báo cáo tài chính năm gần nhất dạng "chỉ tiêu: giá trị" gọn,
+    chỉ giữ các dòng quan trọng nhất vừa ngân sách max_tokens
+    (ưu tiên KEY_LINES, sau đó các dòng còn lại theo thứ tự cột)
+    """
+    header = f"BÁO CÁO TÀI CHÍNH {ticker} NĂM {fin_data['year']} (đơn vị: tỷ đồng)"
+    budget = max_tokens - estimate_tokens(header)
+
+    candidates = []
+    for s_idx, kind in enumerate(STATEMENT_TITLES):
+        budget -= estimate_tokens(STATEMENT_TITLES[kind])
+        for rank, order, text in _statement_lines(kind, fin_data.get(kind)):
+            candidates.append((rank, s_idx, order, text))
+
+    # Lấy theo độ ưu tiên tới khi hết ngân sách, rồi in lại theo thứ tự báo cáo
+    candidates.sort()
+    cost = np.cumsum([estimate_tokens(c[3]) for c in candidates]) if candidates else np.empty(0)
+    chosen = sorted(candidates[:int(np.searchsorted(cost, budget, side="right"))], key=lambda c: (c[1], c[2]))
+
+    sections = [header]
+    for s_idx, kind in enumerate(STATEMENT_TITLES):
+        lines = [c[3] for c in chosen if c[1] == s_idx]
+        if lines:
+            sections.append(STATEMENT_TITLES[kind] + ":\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def build_financial_prompt(context, ticker, year):
+    return f"""
 Bạn là chuyên gia phân tích tài chính doanh nghiệp.
 
 {context}
@@ -232,7 +530,10 @@ Sau khi hiển thị nguyên văn các bảng, hãy phân tích:
 
 Không bịa số, không suy diễn.
 """
-    return call_llm(prompt)
+
+
+def ask_llm_financial(context, ticker, year, stream=False):
+    return call_llm(build_financial_prompt(context, ticker, year), stream=stream)
 
 
 
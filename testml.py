@@ -1,3 +1,8 @@
+import os
+import hashlib
+import threading
+
+import joblib
 import pandas as pd
 import numpy as np
 
@@ -8,93 +13,318 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import r2_score
 from scipy.stats import spearmanr
 
-# ===================== LOAD DATA =====================
-df = pd.read_csv("filegopchoml_final_clean.csv")
+from compiled_forest import META_FILE, compile_forest, load_compiled_forest
+
+# ===================== CONFIG =====================
+INPUT_CSV = "filegopchoml_final_clean.csv"
+OUTPUT_CSV = "ket_qua_ranking_co_phieu_ml_industry_scaled.csv"
+ARTIFACT_DIR = "ml_artifacts"
+ARTIFACT_PATH = os.path.join(ARTIFACT_DIR, "ranking_model.joblib")
+FOREST_DIR = os.path.join(ARTIFACT_DIR, "forest")   # forest đã biên dịch (memory-map)
 
 features = ["ROA", "DE", "BV", "PB"]
 target = "EPS"
 
-df = df.dropna(subset=features + [target]).reset_index(drop=True)
+cols = [
+    "ticker",
+    "industry",
+    "Rank_in_Industry",
+    "Score_industry",
+    "Score_global",
+    "ROA", "DE", "BV", "PB", "EPS", "Market_Cap"
+]
 
-print("Số mã hợp lệ:", len(df))
 
-# ===================== X / y =====================
-X = df[features]
-y = df[target]
+# ===================== LOAD DATA =====================
+
+def load_data(path=INPUT_CSV):
+    df = pd.read_csv(path)
+    return df.dropna(subset=features + [target]).reset_index(drop=True)
+
+
+def content_hash(df, columns):
+    """
+    Hash nội dung (sha256) của các cột đầu vào
+    """
+    h = pd.util.hash_pandas_object(df[columns], index=False).values
+    return hashlib.sha256(h.tobytes()).hexdigest()
+
+
+def row_hashes(df):
+    """
+    Hash từng dòng của (industry + features) → phát hiện mã thay đổi
+    """
+    return pd.Series(
+        pd.util.hash_pandas_object(df[["industry"] + features], index=False).values,
+        index=df["ticker"].values
+    )
 
-# ===================== SPLIT (CHỈ ĐỂ KIỂM TRA MODEL) =====================
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.3, random_state=42
-)
 
 # ===================== MODEL =====================
-model = Pipeline([
-    ("scaler", StandardScaler()),
-    ("rf", RandomForestRegressor(
-        n_estimators=300,
-        max_depth=6,
-        random_state=42,
-        n_jobs=-1
-    ))
-])
-
-# ===================== TRAIN =====================
-model.fit(X_train, y_train)
-
-# ===================== CHECK MODEL (THAM KHẢO) =====================
-y_pred = model.predict(X_test)
-
-print("R2 (tham khảo):", round(r2_score(y_test, y_pred), 4))
-print(
-    "Spearman rank corr:",
-    round(spearmanr(y_test, y_pred).correlation, 4)
-)
-
-# ===================== SCORING FULL MARKET =====================
-df["Score_raw"] = model.predict(X)
-
-# ===================== GLOBAL SCALING =====================
-df["Score_global"] = (df["Score_raw"] - df["Score_raw"].min()) / (
-    df["Score_raw"].max() - df["Score_raw"].min()
-)
-
-# ===================== SAFE INDUSTRY SCALING =====================
+
+def train_model(df, verbose=True):
+    X = df[features]
+    y = df[target]
+
+    # SPLIT (CHỈ ĐỂ KIỂM TRA MODEL)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.3, random_state=42
+    )
+
+    model = Pipeline([
+        ("scaler", StandardScaler()),
+        ("rf", RandomForestRegressor(
+            n_estimators=300,
+            max_depth=6,
+            random_state=42,
+            n_jobs=-1
+        ))
+    ])
+
+    model.fit(X_train, y_train)
+
+    # CHECK MODEL (THAM KHẢO)
+    if verbose:
+        y_pred = model.predict(X_test)
+
+        print("R2 (tham khảo):", round(r2_score(y_test, y_pred), 4))
+        print(
+            "Spearman rank corr:",
+            round(spearmanr(y_test, y_pred).correlation, 4)
+        )
+
+    return model
+
+
+# ===================== SCALING / RANKING =====================
+
 def minmax_safe(x):
     if x.max() == x.min():
         return pd.Series([0.5] * len(x), index=x.index)
     return (x - x.min()) / (x.max() - x.min())
 
-df["Score_industry"] = (
-    df.groupby("industry")["Score_raw"]
-      .transform(minmax_safe)
-)
 
-# ===================== RANKING THEO NGÀNH =====================
-df = df.sort_values(
-    ["industry", "Score_industry"],
-    ascending=[True, False]
-).reset_index(drop=True)
+def rank_in_industry(df):
+    """
+    Score_industry (min-max trong ngành) + Rank_in_Industry
+    """
+    df = df.copy()
+    df["Score_industry"] = (
+        df.groupby("industry")["Score_raw"]
+          .transform(minmax_safe)
+    )
 
-df["Rank_in_Industry"] = (
-    df.groupby("industry")["Score_industry"]
-      .rank(method="first", ascending=False)
-      .astype(int)
-)
+    df = df.sort_values(
+        ["industry", "Score_industry"],
+        ascending=[True, False]
+    ).reset_index(drop=True)
 
-# ===================== EXPORT =====================
-cols = [
-    "ticker",
-    "industry",
-    "Rank_in_Industry",
-    "Score_industry",
-    "Score_global",
-    "ROA", "DE", "BV", "PB", "EPS", "Market_Cap"
-]
+    df["Rank_in_Industry"] = (
+        df.groupby("industry")["Score_industry"]
+          .rank(method="first", ascending=False)
+          .astype(int)
+    )
+    return df
+
+
+def global_scaling(df):
+    df["Score_global"] = (df["Score_raw"] - df["Score_raw"].min()) / (
+        df["Score_raw"].max() - df["Score_raw"].min()
+    )
+    return df
+
+
+# ===================== PIPELINE =====================
+
+def _full_run(df, verbose):
+    model = train_model(df, verbose)
+
+    # SCORING FULL MARKET
+    df["Score_raw"] = model.predict(df[features])
+    df = global_scaling(df)
+    df = rank_in_industry(df)
+    return model, df
+
+
+def _incremental_run(df, state, forest_dir, verbose):
+    """
+    Chỉ chấm lại mã có ROA/DE/BV/PB (hoặc ngành) thay đổi,
+    chỉ xếp hạng lại các ngành bị ảnh hưởng
+    """
+    prev = state["scored"].set_index("ticker")
+    new_hash = row_hashes(df)
+    old_hash = state["row_hashes"]
+
+    same = new_hash.reindex(old_hash.index) == old_hash
+    unchanged = set(same[same].index)
+    changed = df["ticker"][~df["ticker"].isin(unchanged)]
+    removed = prev.index.difference(df["ticker"])
+
+    affected = set(df.loc[df["ticker"].isin(changed), "industry"])
+    affected |= set(prev.loc[prev.index.isin(changed) | prev.index.isin(removed), "industry"])
+
+    if verbose:
+        print(f"Chấm lại {len(changed)} mã, xếp hạng lại {len(affected)} ngành")
+
+    df["Score_raw"] = df["ticker"].map(prev["Score_raw"])
+    mask = df["ticker"].isin(changed)
+    if mask.any():
+        df.loc[mask, "Score_raw"] = score_rows(df.loc[mask, features], forest_dir)
+
+    df = global_scaling(df)
+
+    in_affected = df["industry"].isin(affected)
+    kept = df[~in_affected].copy()
+    kept["Score_industry"] = kept["ticker"].map(prev["Score_industry"])
+    kept["Rank_in_Industry"] = kept["ticker"].map(prev["Rank_in_Industry"]).astype(int)
+
+    reranked = rank_in_industry(df[in_affected])
+
+    df = pd.concat([kept, reranked]).sort_values(
+        ["industry", "Rank_in_Industry"]
+    ).reset_index(drop=True)
+    return df
+
+
+# ===================== FAST SCORING =====================
+
+_forests = {}
+
+
+def get_compiled_forest(forest_dir=FOREST_DIR):
+    """
+    Forest đã biên dịch (mảng node memory-map), nạp 1 lần mỗi process
+    """
+    key = (forest_dir, os.path.getmtime(os.path.join(forest_dir, META_FILE)))
+    forest = _forests.get(key)
+    if forest is None:
+        forest = load_compiled_forest(forest_dir)
+        _forests.clear()
+        _forests[key] = forest
+    return forest
+
+
+def score_rows(X, forest_dir=FOREST_DIR):
+    """
+    Score_raw cho 1 hoặc nhiều dòng ROA/DE/BV/PB (vd: what-if đổi ROA từ chat)
+    Kết quả trùng model.predict của sklearn. 1 dòng (forest 300 cây, sâu 6): ~0.5 ms
+    khi truyền DataFrame (phần lớn là chọn cột pandas), ~0.1 ms với ndarray;
+    Pipeline.predict ~25 ms. Lô lớn (hàng nghìn dòng) không nhanh hơn sklearn
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X[features].to_numpy(dtype=np.float64)
+    return get_compiled_forest(forest_dir).predict(X)
+
+
+def _forest_dir(artifact_path):
+    return os.path.join(os.path.dirname(artifact_path), "forest")
+
+
+def _save_state(model, df, input_hash, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    state = {
+        "model": model,
+        "input_hash": input_hash,
+        "row_hashes": row_hashes(df),
+        "scored": df[["ticker", "industry", "Score_raw", "Score_industry", "Rank_in_Industry"]],
+    }
+    tmp = path + ".tmp"
+    joblib.dump(state, tmp)
+    os.replace(tmp, path)
+
+    compile_forest(model).save(_forest_dir(path))
+    return state
+
+
+def load_state(path=ARTIFACT_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except Exception as e:
+        print("Không đọc được model artifact:", e)
+        return None
+
+
+def run_pipeline(
+    input_csv=INPUT_CSV,
+    output_csv=OUTPUT_CSV,
+    artifact_path=ARTIFACT_PATH,
+    force_retrain=False,
+    verbose=True
+):
+    """
+    Chạy pipeline xếp hạng:
+        - chưa có artifact / force_retrain → train + chấm toàn thị trường
+        - có artifact → dùng lại model, chỉ chấm lại mã thay đổi
+    Trả về DataFrame kết quả (đã ghi ra output_csv)
+    """
+    df = load_data(input_csv)
+
+    if verbose:
+        print("Số mã hợp lệ:", len(df))
+
+    state = None if force_retrain else load_state(artifact_path)
+    input_hash = content_hash(df, df.columns.tolist())
+
+    if state is not None and state.get("input_hash") == input_hash and os.path.exists(output_csv):
+        if verbose:
+            print("Dữ liệu đầu vào không đổi, giữ nguyên", output_csv)
+        # Chạm mtime để ranking_is_stale không coi file đầu vào được ghi lại (cùng nội dung) là mới hơn
+        os.utime(output_csv)
+        return pd.read_csv(output_csv)
+
+    # Artifact cũ (chưa có forest biên dịch) → biên dịch 1 lần
+    forest_dir = _forest_dir(artifact_path)
+    if state is not None and not os.path.exists(os.path.join(forest_dir, META_FILE)):
+        compile_forest(state["model"]).save(forest_dir)
+
+    if state is None:
+        model, df = _full_run(df, verbose)
+    else:
+        model = state["model"]
+        df = _incremental_run(df, state, forest_dir, verbose)
+
+    _save_state(model, df, input_hash, artifact_path)
+
+    # EXPORT
+    tmp = output_csv + ".tmp"
+    df[cols].to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, output_csv)
+
+    if verbose:
+        print(f"✅ Đã lưu: {output_csv}")
+
+    return df[cols]
+
+
+# ===================== BACKGROUND =====================
+
+def ranking_is_stale(input_csv=INPUT_CSV, output_csv=OUTPUT_CSV):
+    """
+    Bảng xếp hạng chưa có hoặc cũ hơn file đặc trưng đầu vào
+    (run_pipeline chạm mtime của bảng cả khi nội dung đầu vào không đổi)
+    """
+    if not os.path.exists(output_csv):
+        return True
+    return os.path.getmtime(input_csv) > os.path.getmtime(output_csv)
+
+
+_lock = threading.Lock()
+
+
+def run_pipeline_in_background(**kwargs):
+    """
+    Chạy pipeline trong thread nền (không chặn lần render đầu của app)
+    """
+    def _run():
+        with _lock:
+            run_pipeline(**kwargs)
+
+    t = threading.Thread(target=_run, name="ranking-pipeline", daemon=True)
+    t.start()
+    return t
 
-df[cols].to_csv(
-    "ket_qua_ranking_co_phieu_ml_industry_scaled.csv",
-    index=False,
-    encoding="utf-8-sig"
-)
 
-print("✅ Đã lưu: ket_qua_ranking_co_phieu_ml_industry_scaled.csv")
+if __name__ == "__main__":
+    run_pipeline()
@@ -0,0 +1,263 @@
+"""
+testengine.aanswer_many / answer_many với server LLM giả chạy trong process
+(HTTP thật, định dạng OpenAI chat completions)
+"""
+import os
+import json
+import time
+import sys
+import asyncio
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import testengine
+import testgenerator
+from llm_cache import LLMCache
+
+SLOW_SECONDS = 1.0
+
+
+class FakeLLMServer:
+    """
+    POST /chat/completions: trả lời "echo: <prompt>" sau `latency` giây
+    (prompt chứa "slow" → SLOW_SECONDS), ghi lại thời điểm nhận và số request đồng thời
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = []          # (thời điểm nhận, prompt)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["messages"][-1]["content"]
+                with server.lock:
+                    server.requests.append((time.perf_counter(), prompt))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(SLOW_SECONDS if "slow" in prompt else server.latency)
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+                payload = json.dumps({
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": f"echo: {prompt}"},
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass        # client đã hủy (timeout / dừng batch)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_port
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def prompts(self):
+        return [p for _, p in self.requests]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HTTPChatClient:
+    """
+    Client async tối thiểu kiểu AsyncOpenAI (client.chat.completions.create) gọi server
+    giả qua socket thật; đếm số lời gọi bị hủy
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        body = json.dumps({"model": model, "messages": messages, **kwargs}).encode("utf-8")
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            writer.write(
+                b"POST /chat/completions HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                b"Content-Type: application/json\r\nConnection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            raw = await reader.read()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            writer.close()
+
+        data = json.loads(raw.partition(b"\r\n\r\n")[2])
+        message = SimpleNamespace(content=data["choices"][0]["message"]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def fake_plan(query):
+    """
+    "prompt#n" → prompt (các câu cùng prompt trước dấu #), "ngoài phạm vi" → message
+    """
+    if query == "ngoài phạm vi":
+        return testengine.Plan("out_of_domain", message="không hỗ trợ")
+    return testengine.Plan("comparison", prompt=query.split("#")[0])
+
+
+@pytest.fixture
+def server(monkeypatch):
+    srv = FakeLLMServer()
+    client = HTTPChatClient(srv.port)
+    testgenerator.set_async_client(client)
+    monkeypatch.setattr(testengine, "plan", fake_plan)
+    cache = LLMCache()
+    monkeypatch.setattr(testgenerator, "get_cache", lambda: cache)
+    srv.client = client
+    yield srv
+    testgenerator.set_async_client(None)
+    srv.close()
+
+
+def collect(queries, **kwargs):
+    async def run():
+        return [r async for r in testengine.aanswer_many(queries, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_dedup_by_prompt(server):
+    queries = ["A#1", "B", "A#2", "ngoài phạm vi", "A#3"]
+    results = sorted(collect(queries))
+
+    assert sorted(server.prompts) == ["A", "B"]
+    assert [r.index for r in results] == list(range(len(queries)))
+    assert [r.answer for r in results] == ["echo: A", "echo: B", "echo: A", "không hỗ trợ", "echo: A"]
+    assert all(r.error is None for r in results)
+
+
+def test_concurrency_cap(server):
+    server.latency = 0.2
+    results = collect([f"P{i}" for i in range(8)], concurrency=3)
+
+    assert len(server.requests) == 8
+    assert server.max_in_flight == 3
+    assert all(r.error is None for r in results)
+
+
+def test_rate_limit(server):
+    results = collect([f"P{i}" for i in range(5)], concurrency=5, rate=10)
+
+    starts = sorted(t for t, _ in server.requests)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    # 10 lời gọi / giây → cách nhau ~0.1 s (trừ sai số lập lịch)
+    assert min(gaps) > 0.08
+    assert starts[-1] - starts[0] > 0.35
+    assert all(r.error is None for r in results)
+
+
+def test_timeout_reported_as_error(server):
+    t0 = time.perf_counter()
+    results = {r.query: r for r in collect(["fast", "slow"], timeout=0.3)}
+
+    assert results["fast"].answer == "echo: fast" and results["fast"].error is None
+    assert results["slow"].answer is None
+    assert isinstance(results["slow"].error, asyncio.TimeoutError)
+    assert time.perf_counter() - t0 < SLOW_SECONDS
+
+
+def test_early_close_cancels_pending(server):
+    server.latency = 0.2
+    queries = [f"P{i}" for i in range(6)]
+
+    results = testengine.answer_many(queries, concurrency=1)
+    first = next(results)
+    results.close()
+    time.sleep(0.5)
+
+    assert first.error is None
+    # Lời gọi đang chạy (nếu đã gửi) bị hủy, các câu còn lại không được gửi
+    assert len(server.requests) <= 2
+    assert server.client.cancelled == len(server.requests) - 1
+
+
+def test_async_early_close_cancels_pending(server):
+    async def run():
+        gen = testengine.aanswer_many(["fast", "slow", "P2", "P3"], concurrency=2)
+        first = await gen.__anext__()
+        await gen.aclose()
+        await asyncio.sleep(0.3)
+        return first
+
+    assert asyncio.run(run()).query == "fast"
+    # "slow" đang chạy bị hủy ngay, P2 / P3 không được gửi
+    assert sorted(server.prompts) == ["fast", "slow"]
+    assert server.client.cancelled == 1
+
+
+def test_real_openai_client_against_fake_server(server, monkeypatch):
+    pytest.importorskip("openai")
+    testgenerator.set_async_client(None)
+    monkeypatch.setattr(testgenerator, "LLM_BASE_URL", f"http://127.0.0.1:{server.port}")
+    monkeypatch.setenv("GROQ_API_KEY", "fake")
+
+    results = sorted(collect(["A#1", "B", "A#2"]))
+    assert [r.answer for r in results] == ["echo: A", "echo: B", "echo: A"]
+    assert sorted(server.prompts) == ["A", "B"]
+
+
+def test_answer_many_closes_its_client(server, monkeypatch):
+    # AsyncOpenAI giả (không cần cài openai): client gọi server giả, ghi lại lần close()
+    created = []
+
+    class FakeAsyncOpenAI(HTTPChatClient):
+        def __init__(self, api_key, base_url):
+            super().__init__(server.port)
+            self.closed = False
+            created.append(self)
+
+        async def close(self):
+            self.closed = True
+
+    monkeypatch.setitem(sys.modules, "openai", SimpleNamespace(AsyncOpenAI=FakeAsyncOpenAI))
+    monkeypatch.setenv("GROQ_API_KEY", "fake")
+    testgenerator.set_async_client(None)
+
+    for n in range(2):
+        answers = sorted(r.answer for r in testengine.answer_many([f"A{n}", f"B{n}"]))
+        assert answers == [f"echo: A{n}", f"echo: B{n}"]
+
+    # Mỗi lần gọi 1 loop mới → 1 client, đóng khi loop xong, không còn giữ trong bảng
+    assert len(created) == 2 and all(c.closed for c in created)
+    assert len(testgenerator._async_clients) == 0
+
+    # Dừng giữa chừng cũng đóng client
+    results = testengine.answer_many(["C", "D"], concurrency=1)
+    next(results)
+    results.close()
+    assert len(created) == 3 and created[-1].closed
@@ -0,0 +1,88 @@
+"""
+backtest.walk_forward: ngày bắt đầu tái cân bằng của 2 mô hình Σ, P&L so với vòng lặp
+theo ngày, không nhìn trước dữ liệu
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import COV_MODELS, MARKET, MIN_PERIODS, _portfolio_pnl, rebalance_rows, walk_forward
+
+# rf âm → mọi mã đều có lợi suất vượt rf, QP luôn có nghiệm
+RF = -0.3
+
+
+def synthetic_prices(n_days=400, n_symbols=20, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.011, n_days)
+    beta = rng.uniform(0.3, 1.8, n_symbols)
+    returns = np.column_stack([market[:, None] * beta + rng.normal(0, 0.015, (n_days, n_symbols)), market])
+    return pd.DataFrame(
+        20 * np.exp(np.cumsum(returns, axis=0)),
+        index=pd.bdate_range("2020-01-01", periods=n_days),
+        columns=[f"S{i:02d}" for i in range(n_symbols)] + [MARKET]
+    )
+
+
+def naive_pnl(R, rows, weights, cost_bps):
+    """
+    Vòng lặp theo ngày: giữ giá trị từng mã, trôi theo giá, tái cân bằng tại rows
+    """
+    R = np.nan_to_num(R)
+    holdings = np.zeros(R.shape[1])
+    daily, turnover = [], []
+    k = 0
+    for t in range(rows[0] + 1, len(R)):
+        cost = 0.0
+        if k < len(rows) and t - 1 == rows[k]:
+            total = holdings.sum()
+            drift = holdings / total if total > 0 else np.zeros_like(holdings)
+            turnover.append(np.abs(weights[k] - drift).sum())
+            cost = turnover[-1] * cost_bps / 1e4
+            holdings = weights[k].copy()
+            k += 1
+        before = holdings.sum()
+        holdings = holdings * np.exp(R[t])
+        gross = holdings.sum() / before if before > 0 else 1.0
+        daily.append(gross * (1 - cost) - 1)
+    return np.array(daily), np.array(turnover)
+
+
+def test_models_start_on_same_date():
+    prices = synthetic_prices()
+    results = {model: walk_forward(prices, RF, cov_model=model) for model in COV_MODELS}
+
+    for model, result in results.items():
+        assert result.info["skipped"] == 0, model
+        assert result.weights.index[0] == prices.index[rebalance_rows(prices.index, first=MIN_PERIODS)[0]]
+        assert (result.weights.sum(axis=1) > 0).all(), model
+    pd.testing.assert_index_equal(results["sample"].weights.index, results["single_index"].weights.index)
+
+
+def test_pnl_matches_daily_loop():
+    rng = np.random.default_rng(1)
+    R = rng.normal(0, 0.02, (300, 6))
+    R[0] = np.nan
+    R[50:80, 2] = np.nan
+    rows = rebalance_rows(pd.bdate_range("2020-01-01", periods=300), 15, first=20)
+    weights = rng.dirichlet(np.ones(6), len(rows))
+    weights[3] = 0.0            # 1 kỳ nắm tiền mặt
+
+    daily, turnover = _portfolio_pnl(R, rows, weights, cost_bps=25)
+    expected_daily, expected_turnover = naive_pnl(R, rows, weights, cost_bps=25)
+
+    np.testing.assert_allclose(daily, expected_daily, rtol=0, atol=1e-14)
+    np.testing.assert_allclose(turnover, expected_turnover, rtol=0, atol=1e-14)
+
+
+@pytest.mark.parametrize("cov_model", COV_MODELS)
+def test_no_lookahead(cov_model):
+    prices = synthetic_prices(n_days=250)
+    full = walk_forward(prices, RF, rebalance=10, cov_model=cov_model)
+
+    # Cắt dữ liệu ngay sau 1 ngày tái cân bằng giữa kỳ: tỷ trọng đến ngày đó không đổi
+    cut = full.weights.index[len(full.weights) // 2]
+    end = prices.index.get_loc(cut) + 2
+    truncated = walk_forward(prices.iloc[:end], RF, rebalance=10, cov_model=cov_model)
+
+    np.testing.assert_allclose(truncated.weights.to_numpy(), full.weights.loc[:cut].to_numpy(), atol=1e-6)
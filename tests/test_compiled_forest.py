@@ -0,0 +1,73 @@
+"""
+compiled_forest: dự đoán trùng từng bit với model.predict của sklearn
+(kể cả giá trị nằm đúng trên ngưỡng chia), trước và sau khi ghi / memory-map
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import compile_forest, load_compiled_forest
+
+
+def training_data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(0.05, 0.03, n),
+        rng.uniform(0.1, 3.0, n),
+        rng.uniform(5e3, 5e4, n),
+        rng.uniform(0.5, 4.0, n),
+    ])
+    y = 2e4 * X[:, 0] + 500 * X[:, 3] + rng.normal(0, 300, n)
+    return X, y
+
+
+def boundary_rows(model, X):
+    """
+    Dòng có 1 feature đặt đúng tại ngưỡng chia (quy về thang gốc) và 2 float kề bên
+    """
+    scaler, forest = model.steps[0][1], model.steps[-1][1]
+    rows = []
+    for est in forest.estimators_[:5]:
+        tree = est.tree_
+        for node in np.flatnonzero(tree.children_left != -1)[:10]:
+            f = tree.feature[node]
+            x = tree.threshold[node] * scaler.scale_[f] + scaler.mean_[f]
+            for v in (np.nextafter(x, -np.inf), x, np.nextafter(x, np.inf)):
+                row = X[node % len(X)].copy()
+                row[f] = v
+                rows.append(row)
+    return np.array(rows)
+
+
+@pytest.fixture(scope="module")
+def model():
+    X, y = training_data()
+    return Pipeline([
+        ("scaler", StandardScaler()),
+        ("rf", RandomForestRegressor(n_estimators=40, max_depth=6, random_state=0)),
+    ]).fit(X, y)
+
+
+def test_matches_pipeline_bit_for_bit(model, tmp_path):
+    X, _ = training_data()
+    X_new, _ = training_data(seed=1)
+    rows = np.vstack([X, X_new, boundary_rows(model, X)])
+
+    compiled = compile_forest(model)
+    expected = model.predict(rows)
+    np.testing.assert_array_equal(compiled.predict(rows), expected)
+    assert compiled.predict(rows[0]).shape == (1,)
+
+    compiled.save(str(tmp_path))
+    loaded = load_compiled_forest(str(tmp_path))
+    np.testing.assert_array_equal(loaded.predict(rows), expected)
+
+
+def test_bare_forest():
+    X, y = training_data()
+    forest = RandomForestRegressor(n_estimators=20, max_depth=5, random_state=0).fit(X, y)
+    np.testing.assert_array_equal(compile_forest(forest).predict(X), forest.predict(X))
@@ -0,0 +1,137 @@
+"""
+covariance: LowRankCovariance so với ma trận dense, ngưỡng chuyển sang dạng dense,
+các builder single-index dùng chung 1 cách dựng Σ,
+Ledoit-Wolf so với sklearn.covariance.ledoit_wolf
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import covariance
+from covariance import (
+    DenseCovariance,
+    LowRankCovariance,
+    QP_DENSE_RANK_RATIO,
+    estimate_covariance,
+    sample_covariance_operator,
+    single_index_operator,
+)
+from preprocessing import capm_covariance_matrix, capm_covariance_operator
+from rolling_capm import BETA, MARKET_VARIANCE, RESID_VAR, covariance_at, rolling_capm
+
+
+def low_rank(n=40, k=3, specific=True, seed=0):
+    rng = np.random.default_rng(seed)
+    return LowRankCovariance(rng.normal(0, 0.1, (n, k)), rng.uniform(0.01, 0.05, n) if specific else None)
+
+
+def test_operations_match_dense():
+    cov = low_rank()
+    dense = cov.to_dense()
+    rng = np.random.default_rng(1)
+    w = rng.normal(size=40)
+
+    np.testing.assert_allclose(cov.matvec(w), dense @ w, rtol=1e-12)
+    assert cov.quad_form(w) == pytest.approx(w @ dense @ w, rel=1e-12)
+    np.testing.assert_allclose(cov.diag(), np.diag(dense), rtol=1e-12)
+    np.testing.assert_allclose(cov.take([3, 7, 11]).to_dense(), dense[np.ix_([3, 7, 11], [3, 7, 11])])
+
+    # Woodbury (có rủi ro riêng), cả vector lẫn gọi lại dùng phân rã đã lưu
+    np.testing.assert_allclose(cov.solve(w), np.linalg.solve(dense, w), rtol=1e-9)
+    np.testing.assert_allclose(cov.solve(np.ones(40)), np.linalg.solve(dense, np.ones(40)), rtol=1e-9)
+
+
+def test_condition_number_constant_specific():
+    rng = np.random.default_rng(2)
+    cov = LowRankCovariance(rng.normal(0, 0.1, (30, 5)), np.full(30, 0.02))
+    assert cov.condition_number() == pytest.approx(np.linalg.cond(cov.to_dense()), rel=1e-8)
+
+
+def test_singular_solve_thresholds(monkeypatch):
+    rng = np.random.default_rng(3)
+    # Không có rủi ro riêng, hạng đủ (k = N): N <= DENSE_SOLVE_MAX → giải dense
+    cov = LowRankCovariance(rng.normal(0, 0.1, (20, 20)))
+    b = rng.normal(size=20)
+    np.testing.assert_allclose(cov.matvec(cov.solve(b)), b, rtol=1e-8, atol=1e-10)
+
+    # N > DENSE_SOLVE_MAX → báo suy biến thay vì tạo ma trận N x N
+    monkeypatch.setattr(covariance, "DENSE_SOLVE_MAX", 10)
+    with pytest.raises(np.linalg.LinAlgError):
+        cov.solve(b)
+
+
+def test_sample_operator_dense_when_more_rows_than_assets():
+    rng = np.random.default_rng(4)
+    tall = pd.DataFrame(rng.normal(0, 0.01, (60, 10)))
+    wide = pd.DataFrame(rng.normal(0, 0.01, (8, 10)))
+
+    assert isinstance(sample_covariance_operator(tall), DenseCovariance)
+    assert isinstance(sample_covariance_operator(wide), LowRankCovariance)
+    for returns in (tall, wide):
+        np.testing.assert_allclose(sample_covariance_operator(returns).to_dense(), returns.cov().to_numpy() * 252)
+
+
+@pytest.mark.parametrize("k, dense", [(2, False), (int(np.ceil(QP_DENSE_RANK_RATIO * 40)), True)])
+def test_qp_dense_switch(k, dense, monkeypatch):
+    cp = pytest.importorskip("cvxpy")
+    from cvxpy.atoms.quad_form import QuadForm
+
+    cov = low_rank(n=40, k=k)
+    y = cp.Variable(40)
+    y.value = np.random.default_rng(5).normal(size=40)
+
+    expr = cov.cvx_quad_form(y)
+    assert isinstance(expr, QuadForm) == dense
+    assert expr.value == pytest.approx(cov.quad_form(y.value), rel=1e-9)
+
+    # N lớn hơn DENSE_SOLVE_MAX → luôn giữ dạng low-rank
+    monkeypatch.setattr(covariance, "DENSE_SOLVE_MAX", 10)
+    assert not isinstance(cov.cvx_quad_form(y), QuadForm)
+
+
+def test_single_index_builders_agree():
+    rng = np.random.default_rng(6)
+    index = pd.Index(["AAA", "BBB", "CCC", "DDD"])
+    betas = pd.Series(rng.uniform(0.3, 1.8, 4), index=index)
+    resid = pd.Series(rng.uniform(1e-4, 4e-4, 4), index=index)
+    var = 1.2e-4
+
+    expected = var * np.outer(betas, betas) + np.diag(resid)
+    np.testing.assert_allclose(single_index_operator(betas, var, resid).to_dense(), expected)
+    np.testing.assert_allclose(capm_covariance_operator(betas, var, resid).to_dense(), expected)
+    np.testing.assert_allclose(capm_covariance_matrix(betas, var).to_numpy(), var * np.outer(betas, betas))
+
+    # Estimator single_index: β, σ²(ε) từ hồi quy trên cùng dữ liệu
+    market = pd.Series(rng.normal(0, 0.01, 250))
+    returns = pd.DataFrame(market.to_numpy()[:, None] * betas.to_numpy() + rng.normal(0, 0.01, (250, 4)), columns=index)
+    cov = estimate_covariance(returns, "single_index", market_returns=market)
+    X = returns - returns.mean()
+    m = market - market.mean()
+    beta = X.T @ m / (m @ m)
+    resid_var = ((X - np.outer(m, beta)) ** 2).sum() / 248
+    np.testing.assert_allclose(
+        cov.to_dense(), (np.outer(beta, beta) * m.var() + np.diag(resid_var)) * 252, rtol=1e-10
+    )
+
+    # rolling_capm.covariance_at tại 1 thời điểm
+    stats, market_stats = rolling_capm(returns, market, 0.04, window=100)
+    at = covariance_at(stats, market_stats, 200, include_specific=True)
+    b = stats[200, :, BETA]
+    np.testing.assert_allclose(at, market_stats[200, MARKET_VARIANCE] * np.outer(b, b) + np.diag(stats[200, :, RESID_VAR]))
+
+
+@pytest.mark.parametrize("T, N", [(250, 30), (40, 120)])
+def test_ledoit_wolf_matches_sklearn(T, N):
+    sk = pytest.importorskip("sklearn.covariance")
+    rng = np.random.default_rng(7)
+    market = rng.normal(0, 0.01, T)
+    returns = pd.DataFrame(market[:, None] * rng.uniform(0.3, 1.8, N) + rng.normal(0, 0.015, (T, N)))
+
+    cov, info = estimate_covariance(returns, "ledoit_wolf", annualize=1, return_info=True)
+    expected, shrinkage = sk.ledoit_wolf(returns.to_numpy())
+
+    # dạng low-rank khi N > T (không tạo ma trận N x N)
+    assert isinstance(cov, LowRankCovariance)
+    assert info["shrinkage"] == pytest.approx(shrinkage, rel=1e-10)
+    np.testing.assert_allclose(cov.to_dense(), expected, rtol=1e-10, atol=1e-17)
+    np.testing.assert_allclose(estimate_covariance(returns, "ledoit_wolf").to_dense(), expected * 252, rtol=1e-10, atol=1e-15)
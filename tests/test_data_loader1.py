@@ -0,0 +1,177 @@
+"""
+data_loader1 với nguồn giá giả lập local (thay vnstock.Quote qua set_quote_factory)
+"""
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+import data_loader1
+
+
+class FakeQuote:
+    """
+    Stand-in cho vnstock.Quote: giá = số thứ tự ngày làm việc, ghi lại mọi khoảng được gọi
+    """
+
+    def __init__(self, source, symbol):
+        self.source = source
+        self.symbol = symbol
+
+    def history(self, start, end, interval="d"):
+        return self.source.history(self.symbol, start, end)
+
+
+class FakeSource:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def history(self, symbol, start, end):
+        with self.lock:
+            self.calls.append((symbol, start, end))
+        if symbol in self.failing:
+            raise ConnectionError(f"{symbol}: 503")
+        days = pd.bdate_range(start, end)
+        close = [float(d.toordinal() % 1000) for d in days]
+        return pd.DataFrame({"time": days, "close": close})
+
+    def factory(self, symbol):
+        return FakeQuote(self, symbol)
+
+
+@pytest.fixture
+def source(monkeypatch):
+    src = FakeSource()
+    data_loader1.set_quote_factory(src.factory)
+    monkeypatch.setattr(data_loader1, "BACKOFF_SECONDS", 0.0)
+    yield src
+    data_loader1.set_quote_factory(None)
+
+
+def read_meta(cache_dir):
+    with open(cache_dir / data_loader1.META_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_cache_hit_skips_network(source, tmp_path):
+    first = data_loader1.download_price("AAA", start="2024-01-01", end="2024-03-31", cache_dir=tmp_path)
+    assert len(source.calls) == 1
+
+    again = data_loader1.download_price("AAA", start="2024-01-01", end="2024-03-31", cache_dir=tmp_path)
+    assert len(source.calls) == 1
+    pd.testing.assert_frame_equal(first, again, check_freq=False)
+
+    # Khoảng con của khoảng đã tải cũng không gọi mạng
+    data_loader1.download_price("AAA", start="2024-02-01", end="2024-02-29", cache_dir=tmp_path)
+    assert len(source.calls) == 1
+
+
+def test_incremental_range_fetch(source, tmp_path):
+    data_loader1.download_price("AAA", start="2024-01-01", end="2024-01-31", cache_dir=tmp_path)
+    source.calls.clear()
+
+    df = data_loader1.download_price("AAA", start="2023-12-01", end="2024-02-15", cache_dir=tmp_path)
+
+    # Chỉ tải 2 phần thiếu ở 2 đầu
+    assert sorted(source.calls) == [
+        ("AAA", "2023-12-01", "2023-12-31"),
+        ("AAA", "2024-02-01", "2024-02-15"),
+    ]
+    assert df.index[0] == pd.Timestamp("2023-12-01")
+    assert df.index[-1] == pd.Timestamp("2024-02-15")
+    assert len(df) == len(pd.bdate_range("2023-12-01", "2024-02-15"))
+    assert read_meta(tmp_path)["AAA"] == ["2023-12-01", "2024-02-15"]
+
+
+def test_write_through_to_disk(source, tmp_path):
+    df = data_loader1.download_price("AAA", start="2024-01-01", end="2024-01-31", cache_dir=tmp_path)
+
+    path = tmp_path / f"AAA{data_loader1.CLOSE_SUFFIX}"
+    on_disk = pd.read_csv(path)
+    assert list(on_disk.columns) == ["date", "close_price"]
+    assert on_disk["close_price"].tolist() == df["AAA"].tolist()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    # Client mới (như process mới): đọc lại từ đĩa, không gọi mạng
+    fresh = FakeSource()
+    data_loader1.set_quote_factory(fresh.factory)
+    again = data_loader1.download_price("AAA", start="2024-01-01", end="2024-01-31", cache_dir=tmp_path)
+    assert fresh.calls == []
+    assert again["AAA"].tolist() == df["AAA"].tolist()
+
+
+def test_partial_failure_keeps_other_symbols(source, tmp_path):
+    source.failing.add("BAD")
+
+    prices = data_loader1.download_multiple_prices(
+        ["AAA", "BAD", "CCC"], start="2024-01-01", end="2024-01-31", cache_dir=tmp_path
+    )
+
+    assert list(prices.columns) == ["AAA", "CCC"]
+    # Mã lỗi được thử lại MAX_RETRIES lần, không được ghi là đã tải
+    assert sum(1 for c in source.calls if c[0] == "BAD") == data_loader1.MAX_RETRIES
+    meta = read_meta(tmp_path)
+    assert "BAD" not in meta and set(meta) == {"AAA", "CCC"}
+    assert not (tmp_path / f"BAD{data_loader1.CLOSE_SUFFIX}").exists()
+
+    # Nguồn hồi phục → lần sau chỉ tải mã còn thiếu
+    source.failing.clear()
+    source.calls.clear()
+    prices = data_loader1.download_multiple_prices(
+        ["AAA", "BAD", "CCC"], start="2024-01-01", end="2024-01-31", cache_dir=tmp_path
+    )
+    assert [c[0] for c in source.calls] == ["BAD"]
+    assert list(prices.columns) == ["AAA", "BAD", "CCC"]
+
+
+def test_open_session_not_marked_covered(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader1, "_market_now", lambda: pd.Timestamp("2024-03-13 10:30"))
+    df = data_loader1.download_price("AAA", start="2024-03-01", cache_dir=tmp_path)
+    assert df.index[-1] == pd.Timestamp("2024-03-13")
+    assert read_meta(tmp_path)["AAA"] == ["2024-03-01", "2024-03-12"]
+
+    # Sau giờ đóng cửa: tải lại bar hôm nay, lúc này mới tính là đã có
+    source.calls.clear()
+    monkeypatch.setattr(data_loader1, "_market_now", lambda: pd.Timestamp("2024-03-13 15:30"))
+    data_loader1.download_price("AAA", start="2024-03-01", cache_dir=tmp_path)
+    assert source.calls == [("AAA", "2024-03-13", "2024-03-13")]
+    assert read_meta(tmp_path)["AAA"] == ["2024-03-01", "2024-03-13"]
+
+
+def test_concurrent_downloads_keep_all_meta(source, tmp_path):
+    symbols = [f"S{i:02d}" for i in range(12)]
+    threads = [
+        threading.Thread(
+            target=data_loader1.download_price,
+            args=(sym,),
+            kwargs={"start": "2024-01-01", "end": "2024-01-31", "cache_dir": tmp_path}
+        )
+        for sym in symbols
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert set(read_meta(tmp_path)) == set(symbols)
+
+
+def test_batch_fetched_in_one_round_trip(source, tmp_path, monkeypatch):
+    # Barrier chỉ mở khi cả 100 lời gọi cùng đang chờ → pool nhỏ hơn lô sẽ kẹt và lỗi
+    symbols = [f"S{i:03d}" for i in range(100)]
+    barrier = threading.Barrier(len(symbols), timeout=10)
+    history = source.history
+
+    def one_round_trip(symbol, start, end):
+        barrier.wait()
+        return history(symbol, start, end)
+
+    monkeypatch.setattr(source, "history", one_round_trip)
+    monkeypatch.setattr(data_loader1, "MAX_RETRIES", 1)
+
+    prices = data_loader1.download_multiple_prices(symbols, start="2024-01-01", end="2024-01-31", cache_dir=tmp_path)
+    assert list(prices.columns) == symbols
+    assert len(source.calls) == len(symbols)
@@ -0,0 +1,134 @@
+"""
+Cache câu trả lời LLM (llm_cache + testgenerator.call_llm) với client stub local
+thay cho endpoint Groq
+"""
+import unicodedata
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+import testgenerator
+from llm_cache import LLMCache, make_key
+
+
+class StubClient:
+    """
+    Giống OpenAI client tối thiểu: client.chat.completions.create(...) → choices[0].message.content
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature, max_tokens, stream=False):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        message = SimpleNamespace(content=f"  trả lời #{len(self.prompts)}  ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    client = StubClient()
+    testgenerator.set_client(client)
+    cache = LLMCache(maxsize=8)
+    monkeypatch.setattr(testgenerator, "get_cache", lambda: cache)
+    # Phiên bản dữ liệu từ 1 CSV tạm (không phụ thuộc file xếp hạng thật)
+    csv = tmp_path / "ranking.csv"
+    csv.write_text("ticker\nAAA\n", encoding="utf-8")
+    monkeypatch.setattr(testgenerator, "CSV_PATH", str(csv))
+    client.cache = cache
+    client.csv = csv
+    yield client
+    testgenerator.set_client(None)
+
+
+def test_memory_hit_skips_llm(stub):
+    first = testgenerator.call_llm("top 5 ngân hàng theo ROA")
+    second = testgenerator.call_llm("top 5 ngân hàng theo ROA")
+
+    assert first == second == "trả lời #1"
+    assert len(stub.prompts) == 1
+    stats = stub.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["disk_hits"]) == (1, 1, 0)
+
+    # use_cache=False luôn gọi LLM
+    testgenerator.call_llm("top 5 ngân hàng theo ROA", use_cache=False)
+    assert len(stub.prompts) == 2
+
+
+def test_disk_hit_survives_new_process(stub, tmp_path, monkeypatch):
+    db = str(tmp_path / "llm.sqlite")
+    cache = LLMCache(db_path=db)
+    monkeypatch.setattr(testgenerator, "get_cache", lambda: cache)
+    testgenerator.call_llm("so sánh VCB với TCB")
+
+    # Cache mới cùng file SQLite (như process mới): LRU trống, lấy từ đĩa
+    fresh = LLMCache(db_path=db)
+    monkeypatch.setattr(testgenerator, "get_cache", lambda: fresh)
+    assert testgenerator.call_llm("so sánh VCB với TCB") == "trả lời #1"
+    assert len(stub.prompts) == 1
+    assert fresh.stats()["disk_hits"] == 1
+
+    # Lần sau đã nằm trong LRU
+    testgenerator.call_llm("so sánh VCB với TCB")
+    assert fresh.stats()["disk_hits"] == 1 and fresh.stats()["hits"] == 2
+
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    db = str(tmp_path / "llm.sqlite")
+    LLMCache(db_path=db, ttl=60).put("k", "v")
+
+    now[0] += 59
+    assert LLMCache(db_path=db, ttl=60).get("k") == "v"
+
+    now[0] += 2
+    cache = LLMCache(db_path=db, ttl=60)
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1
+    # Mục hết hạn bị xóa khỏi đĩa
+    assert cache._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+
+def test_lru_eviction():
+    cache = LLMCache(maxsize=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"        # a mới dùng → b cũ nhất
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["size"] == 2
+
+
+def test_prompt_normalization_same_key(stub):
+    base = "Ngành ngân hàng\ntop 5 theo ROA"
+    variants = [
+        unicodedata.normalize("NFD", base),             # dấu tiếng Việt dạng tổ hợp
+        base.replace("\n", "\r\n"),                     # CRLF
+        "  " + base.replace("\n", "   \n") + "\n\n",    # khoảng trắng đầu / cuối dòng
+    ]
+    key = make_key("m", "sys", base, 0.2)
+    for v in variants:
+        assert make_key("m", "sys", v, 0.2) == key
+
+    # Khác nội dung thật sự → khác khóa
+    assert make_key("m", "sys", base.replace("5", "10"), 0.2) != key
+    assert make_key("m", "sys", base, 0.7) != key
+
+    testgenerator.call_llm(base)
+    for v in variants:
+        testgenerator.call_llm(v)
+    assert len(stub.prompts) == 1
+
+
+def test_invalidated_when_ranking_csv_changes(stub):
+    testgenerator.call_llm("top 5 ngân hàng theo ROA")
+    stub.csv.write_text("ticker\nAAA\nBBB\n", encoding="utf-8")
+
+    assert testgenerator.call_llm("top 5 ngân hàng theo ROA") == "trả lời #2"
+    assert len(stub.prompts) == 2
@@ -0,0 +1,86 @@
+"""
+moments_cache: rổ con chỉ được cắt từ 1 rổ đã tính có giá đủ (complete);
+rổ đã tính có NaN → tính lại (dropna theo rổ con giữ nhiều ngày hơn)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import moments_cache
+from moments_cache import MomentsCache, compute_moments
+
+START = "2022-01-03"
+FULL = ["AAA", "BBB", "CCC", "DDD"]
+
+
+@pytest.fixture(autouse=True)
+def prices(monkeypatch):
+    rng = np.random.default_rng(0)
+    T = 200
+    index = pd.DatetimeIndex(pd.bdate_range(START, periods=T), name="date")
+    market = rng.normal(0.0004, 0.011, T)
+    stocks = market[:, None] * rng.uniform(0.3, 1.8, 5) + rng.normal(0, 0.015, (T, 5))
+    panel = pd.DataFrame(20 * np.exp(np.cumsum(stocks, axis=0)), index=index, columns=FULL + ["LATE"])
+    panel.iloc[:50, -1] = np.nan        # niêm yết muộn
+    vnindex = pd.DataFrame({"VNINDEX": 1000 * np.exp(np.cumsum(market))}, index=index)
+
+    monkeypatch.setattr(moments_cache, "download_multiple_prices", lambda symbols, start, end=None: panel[list(symbols)])
+    monkeypatch.setattr(moments_cache, "download_market_index", lambda start, end=None: vnindex)
+    monkeypatch.setattr(moments_cache, "price_data_version", lambda store=None: 1)
+
+
+def assert_same_moments(result, expected):
+    assert result.symbols == expected.symbols
+    pd.testing.assert_frame_equal(result.stock_returns, expected.stock_returns)
+    pd.testing.assert_series_equal(result.betas, expected.betas, rtol=1e-12)
+    np.testing.assert_allclose(result.cov.to_dense(), expected.cov.to_dense(), rtol=1e-12)
+    assert result.expected_rm == pytest.approx(expected.expected_rm, rel=1e-12)
+
+
+def test_subset_of_complete_basket_is_sliced():
+    cache = MomentsCache()
+    full = cache.get_or_compute(FULL, START)
+    assert full.complete
+
+    subset = cache.get_or_compute(["CCC", "AAA"], START)
+    assert cache.stats()["subset_hits"] == 1 and cache.stats()["misses"] == 1
+    assert_same_moments(subset, compute_moments(["CCC", "AAA"], START))
+
+    # Cùng tập mã, khác thứ tự → hit, trả theo thứ tự mới
+    again = cache.get_or_compute(FULL[::-1], START)
+    assert cache.stats()["hits"] == 1
+    assert_same_moments(again, compute_moments(FULL[::-1], START))
+
+
+def test_subset_of_incomplete_basket_is_recomputed():
+    cache = MomentsCache()
+    full = cache.get_or_compute(FULL + ["LATE"], START)
+    assert not full.complete
+
+    subset = cache.get_or_compute(["AAA", "BBB"], START)
+    assert cache.stats()["subset_hits"] == 0 and cache.stats()["misses"] == 2
+    # Cắt từ rổ có LATE sẽ mất 50 ngày đầu
+    assert len(subset.stock_returns) > len(full.stock_returns)
+    assert_same_moments(subset, compute_moments(["AAA", "BBB"], START))
+
+
+def test_other_range_or_version_is_a_miss():
+    cache = MomentsCache()
+    moments = compute_moments(FULL, START)
+    cache.put(FULL, START, None, 1, moments)
+
+    assert cache.get(["AAA"], START, None, 2) == (None, "miss")
+    assert cache.get(["AAA"], "2022-02-01", None, 1) == (None, "miss")
+    assert cache.get(["AAA", "ZZZ"], START, None, 1) == (None, "miss")
+    assert cache.get(["AAA"], START, None, 1)[1] == "subset"
+
+
+def test_evicts_least_recently_used():
+    moments = compute_moments(FULL, START)
+    cache = MomentsCache(max_bytes=2.5 * moments.nbytes)
+    for start in ["2022-01-03", "2022-01-04", "2022-01-05"]:
+        cache.put(FULL, start, None, 1, moments)
+
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+    assert cache.get(FULL, "2022-01-03", None, 1) == (None, "miss")
+    assert cache.bytes == 2 * moments.nbytes
@@ -0,0 +1,67 @@
+"""
+monte_carlo: HistogramSketch so với giá trị chính xác, cùng seed → cùng kết quả
+với mọi số worker
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from covariance import sample_covariance_operator
+from monte_carlo import HistogramSketch, simulate_portfolio
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.default_rng(0)
+    beta = rng.uniform(0.3, 1.8, 8)
+    market = rng.normal(0.0004, 0.012, 300)
+    history = pd.DataFrame(market[:, None] * beta + rng.normal(0, 0.015, (300, 8)))
+    weights = rng.dirichlet(np.ones(8))
+    mu = 0.04 + beta * 0.06
+    return weights, mu, sample_covariance_operator(history), history
+
+
+def test_sketch_quantiles_and_tail_mean():
+    values = np.random.default_rng(1).normal(0, 1, 100_000)
+    sketch = HistogramSketch(-3, 3, bins=4096).update(values)
+    width = 6 / 4096
+
+    assert sketch.n == len(values)
+    assert sketch.mean() == pytest.approx(values.mean(), abs=1e-12)
+    assert sketch.std() == pytest.approx(values.std(ddof=1), rel=1e-9)
+    for q in (0.01, 0.05, 0.5, 0.99):
+        assert abs(sketch.quantile(q) - np.quantile(values, q)) <= width
+    tail = np.sort(values)[:1000].mean()
+    assert sketch.tail_mean(0.01) == pytest.approx(tail, abs=width)
+
+
+def test_sketch_merge_equals_single_update():
+    values = np.random.default_rng(2).normal(0, 1, 10_000)
+    whole = HistogramSketch(-2, 2, bins=64).update(values)
+    merged = HistogramSketch(-2, 2, bins=64).update(values[:3000]).merge(
+        HistogramSketch(-2, 2, bins=64).update(values[3000:])
+    )
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    np.testing.assert_allclose(merged.sums, whole.sums)
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+
+
+@pytest.mark.parametrize("method", ["parametric", "bootstrap"])
+def test_same_result_for_any_worker_count(inputs, method):
+    weights, mu, cov, history = inputs
+    kwargs = dict(expected_returns=mu, cov=cov, history=history, method=method,
+                  n_paths=25_000, horizon=5, seed=7, batch_paths=5_000, bins=512)
+
+    one = simulate_portfolio(weights, workers=1, **kwargs)
+    three = simulate_portfolio(weights, workers=3, **kwargs)
+
+    assert one.n_paths == three.n_paths == 25_000
+    np.testing.assert_array_equal(one.sketch.counts, three.sketch.counts)
+    np.testing.assert_array_equal(one.sketch.sums, three.sketch.sums)
+    assert (one.mean, one.std, one.var, one.cvar) == (three.mean, three.std, three.var, three.cvar)
+
+
+def test_invalid_path_count(inputs):
+    weights, mu, cov, _ = inputs
+    with pytest.raises(ValueError, match="n_paths"):
+        simulate_portfolio(weights, mu, cov, n_paths=0)
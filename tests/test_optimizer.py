@@ -0,0 +1,47 @@
+"""
+optimizer.efficient_frontier: đường biên suy biến khi mọi μ bằng nhau, SLSQP không hội tụ → lỗi rõ ràng
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import optimizer
+from optimizer import efficient_frontier
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD"]
+
+
+@pytest.fixture
+def cov():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0, 0.02, size=(250, len(SYMBOLS)))
+    return pd.DataFrame(np.cov(returns.T), index=SYMBOLS, columns=SYMBOLS)
+
+
+@pytest.mark.parametrize("allow_short", [True, False])
+def test_equal_mu_collapses_to_min_variance(cov, allow_short):
+    mu = pd.Series(0.1, index=SYMBOLS)
+    frontier = efficient_frontier(mu, cov, n_points=5, allow_short=allow_short)
+
+    inv_one = np.linalg.solve(cov.values, np.ones(len(SYMBOLS)))
+    assert np.all(np.isfinite(frontier["weights"]))
+    np.testing.assert_allclose(frontier["ret"], 0.1)
+    np.testing.assert_allclose(frontier["weights"], np.tile(inv_one / inv_one.sum(), (5, 1)), atol=1e-4)
+
+
+def test_closed_form_spans_targets(cov):
+    mu = pd.Series([0.05, 0.10, 0.12, 0.08], index=SYMBOLS)
+    frontier = efficient_frontier(mu, cov, n_points=5, allow_short=True)
+
+    assert frontier["ret"][-1] == pytest.approx(0.12)
+    np.testing.assert_allclose(frontier["weights"].sum(axis=1), 1.0)
+    assert np.all(np.diff(frontier["vol"]) > 0)
+
+
+def test_min_variance_slsqp_failure_raises(cov, monkeypatch):
+    monkeypatch.setattr(optimizer, "cp", None)
+    monkeypatch.setattr(optimizer, "minimize", lambda *a, **k: SimpleNamespace(success=False, message="boom", x=None))
+    with pytest.raises(RuntimeError, match="boom"):
+        efficient_frontier(pd.Series([0.05, 0.10, 0.12, 0.08], index=SYMBOLS), cov, n_points=5)
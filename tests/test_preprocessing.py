@@ -0,0 +1,59 @@
+"""
+preprocessing.estimate_capm_regression so với 1 LinearRegression cho mỗi mã
+(bỏ NaN theo từng cột)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing import estimate_betas, estimate_capm_regression
+
+LinearRegression = pytest.importorskip("sklearn.linear_model").LinearRegression
+
+
+def synthetic_returns(n_symbols=6, n_days=400, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2020-01-01", periods=n_days)
+    market = pd.Series(rng.normal(0.0004, 0.012, n_days), index=index, name="VNINDEX")
+    returns = market.to_numpy()[:, None] * rng.uniform(0.3, 1.8, n_symbols) + rng.normal(0, 0.015, (n_days, n_symbols))
+    return pd.DataFrame(returns, index=index, columns=[f"S{i}" for i in range(n_symbols)]), market
+
+
+def sklearn_reference(stock_returns, market_returns):
+    rows = {}
+    for symbol in stock_returns:
+        pair = pd.concat([market_returns, stock_returns[symbol]], axis=1).dropna()
+        X, y = pair.iloc[:, :1].to_numpy(), pair.iloc[:, 1].to_numpy()
+        model = LinearRegression().fit(X, y)
+        resid = y - model.predict(X)
+        rows[symbol] = {
+            "beta": model.coef_[0],
+            "alpha": model.intercept_,
+            "r2": model.score(X, y),
+            "resid_var": resid @ resid / (len(y) - 2),
+            "n_obs": len(y),
+        }
+    return pd.DataFrame(rows).T
+
+
+def assert_matches(stock_returns, market_returns):
+    result = estimate_capm_regression(stock_returns, market_returns)
+    expected = sklearn_reference(stock_returns, market_returns)
+
+    np.testing.assert_array_equal(result["n_obs"], expected["n_obs"])
+    for col in ["beta", "alpha", "r2", "resid_var"]:
+        np.testing.assert_allclose(result[col], expected[col].astype(float), rtol=1e-10, atol=1e-12, err_msg=col)
+    pd.testing.assert_series_equal(estimate_betas(stock_returns, market_returns), result["beta"].rename(None))
+
+
+def test_matches_sklearn_without_nan():
+    assert_matches(*synthetic_returns())
+
+
+def test_matches_sklearn_with_nan_gaps():
+    stocks, market = synthetic_returns()
+    stocks.iloc[:120, 1] = np.nan           # niêm yết muộn
+    stocks.iloc[200:260, 2] = np.nan        # tạm ngừng giao dịch
+    stocks.iloc[::9, 3] = np.nan            # thiếu phiên rải rác
+    market.iloc[[10, 300]] = np.nan
+    assert_matches(stocks, market)
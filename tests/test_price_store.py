@@ -0,0 +1,137 @@
+"""
+price_store.get_price_store: kiểm tra độ mới của CSV nguồn được cache (mtime thư mục + TTL),
+data_loader qua store khớp bản đọc CSV cũ, rebuild bỏ memmap của store cũ
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_store
+from price_store import CLOSE_SUFFIX, get_price_store
+
+
+def write_close(price_dir, symbol, n=5, start=10.0):
+    days = pd.bdate_range("2024-01-01", periods=n)
+    pd.DataFrame({"date": days.strftime("%Y-%m-%d"), "close_price": start + np.arange(n)}).to_csv(
+        os.path.join(price_dir, f"{symbol}{CLOSE_SUFFIX}"), index=False
+    )
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    price_dir = str(tmp_path / "prices")
+    os.makedirs(price_dir)
+    write_close(price_dir, "AAA")
+    monkeypatch.setattr(price_store, "_STORES", {})
+    monkeypatch.setattr(price_store, "_freshness", price_store.FreshnessCheck())
+
+    scans = []
+    scan = price_store._scan_close_files
+    monkeypatch.setattr(price_store, "_scan_close_files", lambda d: scans.append(d) or scan(d))
+    return price_dir, str(tmp_path / "store"), scans
+
+
+def test_repeated_calls_skip_scan(dirs):
+    price_dir, store_dir, scans = dirs
+    first = get_price_store(price_dir, store_dir)
+    n = len(scans)
+    for _ in range(10):
+        assert get_price_store(price_dir, store_dir) is first
+    assert len(scans) == n
+
+
+def test_new_file_changes_dir_mtime(dirs):
+    price_dir, store_dir, scans = dirs
+    assert get_price_store(price_dir, store_dir).symbols == ["AAA"]
+    n = len(scans)
+
+    write_close(price_dir, "BBB")
+    # Đồng hồ mtime có thể thô hơn khoảng thời gian giữa 2 lần ghi → ép mtime thư mục đổi
+    st = os.stat(price_dir)
+    os.utime(price_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    assert sorted(get_price_store(price_dir, store_dir).symbols) == ["AAA", "BBB"]
+    assert len(scans) > n
+
+
+def test_in_place_edit_seen_after_ttl(dirs, monkeypatch):
+    price_dir, store_dir, scans = dirs
+    get_price_store(price_dir, store_dir)
+    n = len(scans)
+
+    path = os.path.join(price_dir, f"AAA{CLOSE_SUFFIX}")
+    dir_mtime = os.stat(price_dir).st_mtime_ns
+    write_close(price_dir, "AAA", start=100.0)
+    later = os.stat(path).st_mtime + 10
+    os.utime(path, (later, later))
+    assert os.stat(price_dir).st_mtime_ns == dir_mtime
+
+    # Trong TTL: vẫn là store cũ
+    assert get_price_store(price_dir, store_dir).frame(["AAA"])["AAA"].iloc[0] == 10.0
+    assert len(scans) == n
+
+    monkeypatch.setattr(price_store, "FRESHNESS_TTL", 0.0)
+    assert get_price_store(price_dir, store_dir).frame(["AAA"])["AAA"].iloc[0] == 100.0
+
+
+def legacy_download_multiple_prices(price_dir, symbols, start, end):
+    """
+    data_loader.download_multiple_prices trước khi có price store: đọc CSV từng mã, outer join
+    """
+    dfs = []
+    for sym in symbols:
+        path = os.path.join(price_dir, f"{sym}{CLOSE_SUFFIX}")
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path)
+        df["date"] = pd.to_datetime(df["date"])
+        df = df.set_index("date").sort_index()
+        if start:
+            df = df[df.index >= pd.to_datetime(start)]
+        if end:
+            df = df[df.index <= pd.to_datetime(end)]
+        df = df.rename(columns={"close_price": sym})
+        if not df.empty:
+            dfs.append(df[[sym]])
+    return pd.concat(dfs, axis=1, join="outer").sort_index() if dfs else None
+
+
+@pytest.mark.parametrize("start, end", [(None, None), ("2024-02-01", "2024-05-31"), ("2024-06-10", None)])
+def test_download_matches_csv_loader(dirs, monkeypatch, start, end):
+    price_dir, store_dir, _ = dirs
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range("2024-01-01", periods=120)
+    # Mỗi mã 1 khoảng thời gian riêng + phiên thiếu rải rác → outer join có NaN
+    for symbol, (a, b) in {"AAA": (0, 120), "BBB": (20, 90), "CCC": (50, 120), "DDD": (0, 30)}.items():
+        rows = np.arange(a, b)
+        rows = rows[rng.random(len(rows)) > 0.1]
+        pd.DataFrame({
+            "date": days[rows].strftime("%Y-%m-%d"),
+            "close_price": 10 + rng.random(len(rows)) * 90,
+        }).to_csv(os.path.join(price_dir, f"{symbol}{CLOSE_SUFFIX}"), index=False)
+
+    import data_loader
+    monkeypatch.setattr(data_loader, "PRICE_DIR", price_dir)
+    monkeypatch.setattr(data_loader, "STORE_DIR", store_dir)
+
+    symbols = ["CCC", "AAA", "XXX", "DDD", "BBB"]
+    got = data_loader.download_multiple_prices(symbols, start=start, end=end)
+    expected = legacy_download_multiple_prices(price_dir, symbols, start, end)
+
+    # pandas mới đọc ngày từ CSV với độ phân giải µs, store luôn dùng ns
+    pd.testing.assert_index_equal(got.index, expected.index.as_unit("ns"))
+    assert list(got.columns) == list(expected.columns)
+    np.testing.assert_array_equal(got.isna().to_numpy(), expected.isna().to_numpy())
+    np.testing.assert_allclose(got.to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+
+def test_rebuild_releases_cached_memmaps(dirs):
+    price_dir, store_dir, _ = dirs
+    old = get_price_store(price_dir, store_dir)
+    assert isinstance(old.close, np.memmap)
+
+    new = price_store.build_price_store(price_dir, store_dir)
+    assert old.close is None and old.dates is None
+    assert new.frame(["AAA"])["AAA"].iloc[0] == 10.0
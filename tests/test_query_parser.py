@@ -0,0 +1,66 @@
+"""
+query_parser: bảng hồi quy câu hỏi → intent (cùng thứ tự ưu tiên với detect_intent cũ)
+"""
+import pytest
+
+from query_parser import parse_query
+
+INTENT_CASES = [
+    # comparison
+    ("So sánh VCB với TCB", "comparison"),
+    ("so sánh lợi nhuận VNM và MSN", "comparison"),
+    ("THT vs LPB thì nên chọn mã nào", "comparison"),
+    ("VNM với MSN", "comparison"),
+    ("Báo cáo tài chính VCB so với năm trước", "comparison"),
+    # ranking
+    ("Top 5 cổ phiếu ROA cao nhất ngành ngân hàng", "ranking"),
+    ("top10 ngành thép theo P/B", "ranking"),
+    ("Xếp hạng ngành bán lẻ", "ranking"),
+    ("Bảng xếp hạng lợi nhuận", "ranking"),
+    # ratio_analysis
+    ("ROA của ngành ngân hàng thế nào", "ratio_analysis"),
+    ("Cổ phiếu có D/E cao", "ratio_analysis"),
+    ("PB ngành chứng khoán hiện nay", "ratio_analysis"),
+    # financial_statement
+    ("Báo cáo tài chính của FPT", "financial_statement"),
+    ("Cổ phiếu HPG bctc", "financial_statement"),
+    # report_qa
+    ("Doanh thu của HPG năm 2023", "report_qa"),
+    ("Rủi ro của ngành bất động sản", "report_qa"),
+    ("Chiến lược của ngân hàng ACB", "report_qa"),
+    # sector_analysis
+    ("Chu kỳ ngành thép", "sector_analysis"),
+    ("Ngành ngân hàng có triển vọng không", "sector_analysis"),
+    # recommendation
+    ("Nên mua cổ phiếu nào", "recommendation"),
+    ("Cổ phiếu ngành bia nào đáng đầu tư", "recommendation"),
+    # out_of_domain
+    ("Hôm nay thời tiết thế nào", "out_of_domain"),
+    ("tôi đi chơi với bạn", "out_of_domain"),
+    ("VCB hay TCB", "out_of_domain"),
+    # Khớp trọn từ: bản cũ coi "de" trong "decor" là D/E
+    ("Cho tôi ý tưởng decor phòng khách", "out_of_domain"),
+]
+
+
+@pytest.mark.parametrize("query, intent", INTENT_CASES)
+def test_intent(query, intent):
+    assert parse_query(query).intent == intent
+
+
+def test_fields():
+    q = parse_query("Top 5 cổ phiếu ROA cao nhất ngành ngân hàng")
+    assert (q.industry, q.factor, q.top_n) == ("ngân hàng", "ROA", 5)
+
+    q = parse_query("top10 ngành thép theo P/B")
+    assert (q.industry, q.factor, q.top_n) == ("kim loại", "PB", 10)
+
+
+def test_tickers_in_order():
+    assert parse_query("THT vs LPB thì nên chọn mã nào").tickers == ["THT", "VS", "LPB"]
+    assert parse_query("VNM với MSN, chọn mã nào?").tickers == ["VNM", "MSN"]
+
+
+def test_known_industries_take_precedence():
+    q = parse_query("Top 3 ngân hàng thương mại", industries=["ngân hàng thương mại"])
+    assert q.industry == "ngân hàng thương mại"
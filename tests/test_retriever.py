@@ -0,0 +1,77 @@
+"""
+retriever (RankingIndex) so với bản pandas: lọc ngành + sort_values với ticker tăng dần
+làm khóa phụ khi hòa, NaN cuối
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import retriever
+from retriever import RankingData, get_comparison, get_ranking, retrieve_stock_groups
+
+INDUSTRIES = ["Ngân hàng", "Thép", "Bán lẻ"]
+COMPARISON = ["ticker", "Score", "Market_Cap", "ROA", "DE", "BV", "EPS", "PB"]
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    n = 60
+    df = pd.DataFrame({
+        "ticker": rng.permutation([f"T{i:02d}" for i in range(n)]),
+        "industry": rng.choice(INDUSTRIES, n),
+        # Giá trị làm tròn → nhiều dòng hòa trong cùng ngành
+        "Score_industry": rng.integers(0, 5, n) * 10.0,
+        "Market_Cap": rng.integers(1, 4, n) * 1e12,
+        "ROA": np.round(rng.normal(0.05, 0.03, n), 2),
+        "DE": rng.uniform(0.1, 3.0, n),
+        "BV": rng.uniform(1e11, 1e13, n),
+        "EPS": rng.integers(1, 4, n) * 1000.0,
+        "PB": rng.uniform(0.5, 4.0, n),
+        "grade": rng.choice(["A", "B", "C"], n),
+    })
+    df.loc[::7, "ROA"] = np.nan
+    df.loc[3, "industry"] = np.nan
+    path = tmp_path / "ranking.csv"
+    df.to_csv(path, index=False)
+
+    loaded = RankingData(str(path))
+    monkeypatch.setattr(retriever, "get_ranking_data", lambda path=None: loaded)
+    return loaded.df
+
+
+def pandas_top(df, industry, factor, n, ascending=False):
+    rows = df[df["industry_norm"] == industry]
+    rows = rows.sort_values([factor, "ticker"], ascending=[ascending, True], kind="stable")
+    return rows.head(n)
+
+
+@pytest.mark.parametrize("factor", ["Score", "Market_Cap", "ROA", "EPS", "grade"])
+@pytest.mark.parametrize("ascending", [False, True])
+def test_ranking_matches_pandas(data, factor, ascending):
+    for industry in data["industry_norm"].dropna().unique():
+        expected = pandas_top(data, industry, factor, 10, ascending)[["ticker", factor]]
+        pd.testing.assert_frame_equal(get_ranking(industry, factor, 10, ascending), expected)
+    assert get_ranking("không có ngành này", factor) is None
+
+
+def test_stock_groups_match_pandas(data):
+    for industry in data["industry_norm"].dropna().unique():
+        groups = retrieve_stock_groups(industry)
+        top_score = pandas_top(data, industry, "Score", retriever.TOP_SCORE_N)
+        top_cap = pandas_top(data, industry, "Market_Cap", retriever.TOP_MARKETCAP_N)
+        in_cap = top_score["ticker"].isin(top_cap["ticker"])
+
+        pd.testing.assert_frame_equal(groups["top_score"], top_score)
+        pd.testing.assert_frame_equal(groups["top_cap"], top_cap)
+        pd.testing.assert_frame_equal(groups["best_growth"], top_score[~in_cap].head(1))
+        pd.testing.assert_frame_equal(groups["best_safe"], top_cap.sort_values("Score", ascending=False, kind="stable").head(1))
+        pd.testing.assert_frame_equal(groups["best_balance"], top_score[in_cap].head(1))
+
+
+def test_comparison_matches_pandas(data):
+    tickers = ["T05", "T41", "T00", "KHONG_CO", "T05"]
+    expected = data[data["ticker"].isin(tickers)][COMPARISON].copy()
+    expected["Market_Cap"] = expected["Market_Cap"] / 1e9
+    expected["BV"] = expected["BV"] / 1e9
+    pd.testing.assert_frame_equal(get_comparison(tickers), expected)
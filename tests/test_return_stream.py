@@ -0,0 +1,94 @@
+"""
+return_stream: log return đọc từng chunk trùng với bản tính trên cả frame
+(NaN theo từng cột), mômen cộng dồn trùng với pandas / estimate_capm_regression
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing import calculate_log_returns, estimate_capm_regression
+from price_store import load_price_store, write_price_store
+from return_stream import StreamingMoments, iter_log_returns, stream_capm_moments, stream_columns
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD", "VNINDEX"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    T = 250
+    market = rng.normal(0.0004, 0.011, T)
+    stocks = market[:, None] * rng.uniform(0.3, 1.8, 4) + rng.normal(0, 0.015, (T, 4))
+    close = 20 * np.exp(np.cumsum(np.column_stack([stocks, market]), axis=0))
+    close[:40, 1] = np.nan           # niêm yết muộn
+    close[100:130, 2] = np.nan       # tạm ngừng giao dịch
+    close[::11, 3] = np.nan          # thiếu phiên rải rác
+    close[[60, 61, 199], :] = np.nan     # ngày không mã nào có giá (bị bỏ như store.frame)
+
+    dates = pd.bdate_range("2022-01-03", periods=T).values.astype("datetime64[ns]").view(np.int64)
+    write_price_store(dates, SYMBOLS, close, str(tmp_path))
+    return load_price_store(str(tmp_path))
+
+
+def streamed(symbols, chunk_rows, store, start=None, end=None, dtype=np.float64):
+    chunks = [(c.dates.copy(), c.values.copy(), c.mask.copy())
+              for c in iter_log_returns(symbols, start, end, chunk_rows, dtype, store)]
+    dates, values, mask = (np.concatenate(parts) for parts in zip(*chunks))
+    return dates, values, mask
+
+
+def whole(symbols, store, start=None, end=None):
+    return calculate_log_returns(store.frame(symbols, start, end), dropna=False).iloc[1:]
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 60, 4096])
+def test_chunked_matches_whole_frame(store, chunk_rows):
+    expected = whole(SYMBOLS, store)
+    dates, values, mask = streamed(SYMBOLS, chunk_rows, store)
+
+    np.testing.assert_array_equal(dates, expected.index.values.astype("datetime64[ns]").view(np.int64))
+    np.testing.assert_array_equal(values, expected.to_numpy())
+    np.testing.assert_array_equal(mask, expected.notna().to_numpy())
+
+
+def test_date_range_and_unknown_symbols(store):
+    symbols = ["CCC", "KHONG_CO", "AAA"]
+    start, end = "2022-03-01", "2022-09-30"
+    assert stream_columns(symbols, store) == ["CCC", "AAA"]
+
+    expected = whole(["CCC", "AAA"], store, start, end)
+    dates, values, _ = streamed(symbols, 16, store, start, end)
+    np.testing.assert_array_equal(dates, expected.index.values.astype("datetime64[ns]").view(np.int64))
+    np.testing.assert_array_equal(values, expected.to_numpy())
+
+
+def test_float32_buffer(store):
+    expected = whole(SYMBOLS, store).to_numpy()
+    _, values, mask = streamed(SYMBOLS, 32, store, dtype=np.float32)
+    assert values.dtype == np.float32
+    np.testing.assert_array_equal(mask, ~np.isnan(expected))
+    np.testing.assert_allclose(values, expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 4096])
+def test_streaming_moments_match_pandas(store, chunk_rows):
+    returns = whole(SYMBOLS, store)
+    moments = stream_capm_moments(SYMBOLS[:-1], pairwise=True, chunk_rows=chunk_rows, store=store)
+
+    np.testing.assert_allclose(moments.mean(), returns.mean(), rtol=1e-10)
+    np.testing.assert_allclose(moments.var(), returns.var(), rtol=1e-10)
+    np.testing.assert_allclose(moments.cov(annualize=252), returns.cov() * 252, rtol=1e-9, atol=1e-15)
+
+    expected = estimate_capm_regression(returns[SYMBOLS[:-1]], returns["VNINDEX"])
+    result = moments.capm_regression()
+    np.testing.assert_array_equal(result["n_obs"], expected["n_obs"])
+    for col in ["beta", "alpha", "r2", "resid_var"]:
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-9, atol=1e-15, err_msg=col)
+
+
+def test_moments_need_options():
+    moments = StreamingMoments(["AAA"]).update(np.array([[0.01], [0.02]]))
+    with pytest.raises(ValueError):
+        moments.cov()
+    with pytest.raises(ValueError):
+        moments.capm_regression()
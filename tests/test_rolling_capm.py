@@ -0,0 +1,91 @@
+"""
+rolling_capm so với pandas rolling().cov() / var() và ewm() (cùng quy tắc NaN, min_periods)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_capm import BETA, EXPECTED_RETURN, EXPECTED_RM, MARKET_VARIANCE, covariance_at, rolling_capm
+
+RF = 0.04
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(0)
+    T = 300
+    market = pd.Series(rng.normal(0.0004, 0.011, T), name="VNINDEX")
+    stocks = pd.DataFrame(
+        market.to_numpy()[:, None] * rng.uniform(0.3, 1.8, 4) + rng.normal(0, 0.015, (T, 4)),
+        columns=["AAA", "BBB", "CCC", "DDD"]
+    )
+    stocks.iloc[:40, 1] = np.nan            # niêm yết muộn
+    stocks.iloc[100:130, 2] = np.nan        # tạm ngừng giao dịch
+    stocks.iloc[::17, 3] = np.nan           # thiếu phiên rải rác
+    market.iloc[[5, 150, 151]] = np.nan
+    return stocks, market
+
+
+def pandas_reference(stocks, market, windowed):
+    """
+    windowed(series) → Rolling / ExponentialMovingWindow của pandas
+    """
+    beta = pd.DataFrame({
+        c: windowed(stocks[c]).cov(market) / windowed(market.where(stocks[c].notna())).var()
+        for c in stocks
+    })
+    erm = windowed(market).mean() * 365
+    return beta, erm, windowed(market).var()
+
+
+def assert_matches(stats, market_stats, reference, rtol):
+    beta, erm, var = reference
+    np.testing.assert_allclose(stats[..., BETA], beta.to_numpy(), rtol=rtol, atol=1e-14)
+    np.testing.assert_allclose(market_stats[:, EXPECTED_RM], erm.to_numpy(), rtol=rtol, atol=1e-14)
+    np.testing.assert_allclose(market_stats[:, MARKET_VARIANCE], var.to_numpy(), rtol=rtol, atol=1e-16)
+    expected = RF + beta.to_numpy() * (erm.to_numpy()[:, None] - RF)
+    np.testing.assert_allclose(stats[..., EXPECTED_RETURN], expected, rtol=rtol, atol=1e-14)
+
+
+def test_rolling_matches_pandas(returns):
+    stocks, market = returns
+    stats, market_stats = rolling_capm(stocks, market, RF, window=60, min_periods=30)
+    reference = pandas_reference(stocks, market, lambda s: s.rolling(60, min_periods=30))
+    assert_matches(stats, market_stats, reference, rtol=1e-9)
+
+
+def test_expanding_matches_pandas(returns):
+    stocks, market = returns
+    stats, market_stats = rolling_capm(stocks, market, RF, min_periods=20)
+    reference = pandas_reference(stocks, market, lambda s: s.expanding(min_periods=20))
+    assert_matches(stats, market_stats, reference, rtol=1e-9)
+
+
+def test_ewm_matches_pandas(returns):
+    stocks, market = returns
+    stats, market_stats = rolling_capm(stocks, market, RF, halflife=30, min_periods=20)
+    reference = pandas_reference(stocks, market, lambda s: s.ewm(halflife=30, min_periods=20))
+    assert_matches(stats, market_stats, reference, rtol=1e-9)
+
+
+def test_covariance_at(returns):
+    stocks, market = returns
+    stats, market_stats = rolling_capm(stocks, market, RF, window=60)
+    cov = covariance_at(stats, market_stats, 200)
+    beta = stats[200, :, BETA]
+    np.testing.assert_allclose(cov, np.outer(beta, beta) * market_stats[200, MARKET_VARIANCE])
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"window": 0},
+    {"window": -5},
+    {"window": 2.5},
+    {"halflife": 0},
+    {"min_periods": 0},
+    {"window": 10, "min_periods": 20},
+    {"window": 10, "halflife": 5},
+])
+def test_invalid_windows(returns, kwargs):
+    stocks, market = returns
+    with pytest.raises(ValueError):
+        rolling_capm(stocks, market, RF, **kwargs)
@@ -0,0 +1,217 @@
+"""
+statement_store (1 DataFrame / loại báo cáo, chỉ mục (ticker, yearReport)) và
+retriever1.get_latest_financials (write-through + tải lại khi quá hạn) với nguồn giả
+"""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import price_store
+import statement_store
+from statement_store import STATEMENT_SUFFIXES, get_statement_store, load_statement_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OLD = time.time() - 400 * 86400
+
+
+def statement(ticker, years, value=1.0):
+    return pd.DataFrame({
+        "ticker": ticker,
+        "yearReport": years,
+        "Revenue (Bn. VND)": [value * y for y in years],
+        "Note": [f"{ticker}-{y}" for y in years],
+    })
+
+
+def write_csvs(price_dir, ticker, years, mtime=None):
+    for suffix in STATEMENT_SUFFIXES.values():
+        path = os.path.join(price_dir, f"{ticker}{suffix}")
+        statement(ticker, years).to_csv(path, index=False)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    price_dir, store_dir = str(tmp_path / "prices"), str(tmp_path / "store")
+    os.makedirs(price_dir)
+    monkeypatch.setattr(statement_store, "_STORES", {})
+    monkeypatch.setattr(statement_store, "_freshness", price_store.FreshnessCheck())
+    # Các test ghi CSV liên tiếp nhanh hơn độ phân giải mtime thư mục → luôn quét lại
+    monkeypatch.setattr(price_store, "FRESHNESS_TTL", 0.0)
+    return price_dir, store_dir
+
+
+def test_frame_per_kind_round_trip(dirs):
+    price_dir, store_dir = dirs
+    write_csvs(price_dir, "AAA", [2021, 2022, 2023])
+    write_csvs(price_dir, "BBB", [2022, 2023])
+
+    store = get_statement_store(price_dir, store_dir)
+    assert store.tickers == {"AAA", "BBB"}
+    for kind in STATEMENT_SUFFIXES:
+        frame = store.frames[kind]
+        assert list(frame.index.names) == ["ticker", "yearReport"]
+        assert len(frame) == 5
+
+    pd.testing.assert_frame_equal(store.get("income_statement", "AAA"), statement("AAA", [2021, 2022, 2023]))
+    pd.testing.assert_frame_equal(store.get("cash_flow", "BBB", 2023), statement("BBB", [2023]))
+    assert store.years("AAA") == [2021, 2022, 2023]
+
+    loaded = load_statement_store(store_dir)
+    pd.testing.assert_frame_equal(loaded.frames["balance_sheet"], store.frames["balance_sheet"])
+    pd.testing.assert_frame_equal(loaded.get("balance_sheet", "AAA", [2022, 2023]), statement("AAA", [2022, 2023]))
+
+
+def test_freshness_check_cached(dirs, monkeypatch):
+    price_dir, store_dir = dirs
+    write_csvs(price_dir, "AAA", [2023])
+    monkeypatch.setattr(price_store, "FRESHNESS_TTL", 60.0)
+
+    scans = []
+    scan = statement_store._scan_statement_files
+    monkeypatch.setattr(statement_store, "_scan_statement_files", lambda d: scans.append(d) or scan(d))
+
+    first = get_statement_store(price_dir, store_dir)
+    n = len(scans)
+    for _ in range(10):
+        assert get_statement_store(price_dir, store_dir) is first
+    assert len(scans) == n
+
+    # Thêm file → mtime thư mục đổi → quét lại ngay
+    write_csvs(price_dir, "BBB", [2023])
+    st = os.stat(price_dir)
+    os.utime(price_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert get_statement_store(price_dir, store_dir).tickers == {"AAA", "BBB"}
+
+
+def test_write_through_survives_rebuild(dirs):
+    price_dir, store_dir = dirs
+    write_csvs(price_dir, "AAA", [2022, 2023])
+    get_statement_store(price_dir, store_dir)
+
+    frames = {kind: statement("ZZZ", [2023, 2024], 2.0) for kind in STATEMENT_SUFFIXES}
+    store = statement_store.update_statement_store("ZZZ", frames, price_dir, store_dir)
+    assert "ZZZ" in store and store.age("ZZZ") < 60
+
+    # Process mới: đọc lại từ đĩa
+    statement_store._STORES.clear()
+    pd.testing.assert_frame_equal(get_statement_store(price_dir, store_dir).get("balance_sheet", "ZZZ"), frames["balance_sheet"])
+
+    # CSV thay đổi → chuyển đổi lại nhưng vẫn giữ mã tải online
+    write_csvs(price_dir, "BBB", [2023])
+    store = get_statement_store(price_dir, store_dir)
+    assert store.tickers == {"AAA", "BBB", "ZZZ"}
+    pd.testing.assert_frame_equal(store.get("cash_flow", "ZZZ"), frames["cash_flow"])
+
+
+class FakeFinance:
+    def __init__(self, ticker, years, fail):
+        self.ticker, self.years, self.fail = ticker, years, fail
+        self.calls = 0
+
+    def _statement(self, period):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("offline")
+        return statement(self.ticker, self.years, 3.0)
+
+    balance_sheet = income_statement = cash_flow = _statement
+
+
+@pytest.fixture
+def retriever(dirs, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    retriever1 = pytest.importorskip("retriever1")
+    price_dir, store_dir = dirs
+    monkeypatch.setattr(retriever1, "get_statement_store", lambda: get_statement_store(price_dir, store_dir))
+    monkeypatch.setattr(
+        retriever1, "update_statement_store",
+        lambda ticker, frames: statement_store.update_statement_store(ticker, frames, price_dir, store_dir)
+    )
+    monkeypatch.setattr(retriever1, "_refresh_tried", {})
+    sources = {}
+
+    def fake_stock(ticker, years=(2023, 2024), fail=False):
+        sources[ticker] = FakeFinance(ticker, list(years), fail)
+
+    monkeypatch.setattr(retriever1, "get_stock", lambda t: type("Stock", (), {"finance": sources[t]})())
+    monkeypatch.setattr(retriever1, "fake_stock", fake_stock, raising=False)
+    return retriever1, price_dir, sources
+
+
+def test_online_fetch_written_through(retriever):
+    retriever1, price_dir, sources = retriever
+    retriever1.fake_stock("NEW")
+
+    first = retriever1.get_latest_financials("NEW")
+    second = retriever1.get_latest_financials("NEW")
+
+    assert sources["NEW"].calls == 3          # 3 loại báo cáo, chỉ tải 1 lần
+    assert first["year"] == second["year"] == 2024
+    pd.testing.assert_frame_equal(first["income_statement"], second["income_statement"])
+
+
+def test_fresh_offline_ticker_not_refreshed(retriever):
+    retriever1, price_dir, sources = retriever
+    write_csvs(price_dir, "OFF", [2022, 2023])
+    retriever1.fake_stock("OFF")
+
+    assert retriever1.get_latest_financials("OFF")["year"] == 2023
+    assert sources["OFF"].calls == 0
+
+
+def test_stale_offline_ticker_refreshed(retriever):
+    retriever1, price_dir, sources = retriever
+    write_csvs(price_dir, "OFF", [2022, 2023], mtime=OLD)
+    retriever1.fake_stock("OFF", years=[2023, 2024])
+
+    assert retriever1.get_latest_financials("OFF")["year"] == 2024
+    assert retriever1.get_latest_financials("OFF")["year"] == 2024
+    assert sources["OFF"].calls == 3
+
+
+def test_stale_refresh_failure_uses_offline_copy(retriever):
+    retriever1, price_dir, sources = retriever
+    write_csvs(price_dir, "OFF", [2022, 2023], mtime=OLD)
+    retriever1.fake_stock("OFF", fail=True)
+
+    assert retriever1.get_latest_financials("OFF")["year"] == 2023
+    assert retriever1.get_latest_financials("OFF")["year"] == 2023
+    assert sources["OFF"].calls == 1          # không thử lại trong cùng cửa sổ
+
+
+def test_disjoint_columns_keep_dtypes(dirs):
+    price_dir, store_dir = dirs
+    # AAA: cột int + bool, BBB: cột chuỗi; "Mixed" là int ở AAA nhưng chuỗi ở BBB
+    aaa = pd.DataFrame({
+        "ticker": "AAA", "yearReport": [2022, 2023],
+        "Employees": [120, 135], "Audited": [True, False], "Mixed": [1, 2],
+    })
+    bbb = pd.DataFrame({
+        "ticker": "BBB", "yearReport": [2023],
+        "Auditor": ["KPMG"], "Revenue (Bn. VND)": [10.5], "Mixed": ["chưa có"],
+    })
+    for suffix in STATEMENT_SUFFIXES.values():
+        aaa.to_csv(os.path.join(price_dir, f"AAA{suffix}"), index=False)
+        bbb.to_csv(os.path.join(price_dir, f"BBB{suffix}"), index=False)
+
+    for store in (get_statement_store(price_dir, store_dir), load_statement_store(store_dir)):
+        frame = store.frames["balance_sheet"]
+        # Không còn cột object lẫn kiểu (parquet ghi được), int thiếu ở mã khác vẫn là số nguyên
+        assert str(frame["Employees"].dtype) == "Int64"
+        assert str(frame["Audited"].dtype) == "boolean"
+        assert str(frame["Mixed"].dtype) == "string"
+        assert str(frame["Revenue (Bn. VND)"].dtype) == "float64"
+
+        pd.testing.assert_frame_equal(store.get("balance_sheet", "AAA"), pd.read_csv(os.path.join(price_dir, "AAA_balance_sheet.csv")))
+        pd.testing.assert_frame_equal(store.get("income_statement", "BBB"), pd.read_csv(os.path.join(price_dir, "BBB_income_statement.csv")))
+
+    # Write-through mã thứ 3 với bộ cột khác: các mã cũ giữ nguyên kiểu
+    ccc = statement("CCC", [2024])
+    store = statement_store.update_statement_store("CCC", {kind: ccc for kind in STATEMENT_SUFFIXES}, price_dir, store_dir)
+    assert str(store.frames["cash_flow"]["Employees"].dtype) == "Int64"
+    assert store.get("cash_flow", "AAA")["Employees"].dtype == "int64"
+    pd.testing.assert_frame_equal(store.get("cash_flow", "CCC"), ccc)
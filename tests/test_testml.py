@@ -0,0 +1,79 @@
+"""
+testml.run_pipeline: chấm lại tăng dần trùng với chấm lại toàn bộ bằng cùng model,
+ranking_is_stale sau khi file đầu vào được ghi lại với cùng nội dung
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import testml
+from testml import features, global_scaling, load_state, rank_in_industry, ranking_is_stale, run_pipeline
+
+INDUSTRIES = ["ngân hàng", "thép", "bán lẻ", "bất động sản"]
+
+
+def synthetic_features(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "ticker": [f"T{i:03d}" for i in range(n)],
+        "industry": rng.choice(INDUSTRIES, n),
+        "ROA": rng.normal(0.05, 0.03, n),
+        "DE": rng.uniform(0.1, 3.0, n),
+        "BV": rng.uniform(5e3, 5e4, n),
+        "PB": rng.uniform(0.5, 4.0, n),
+        "Market_Cap": rng.uniform(1e11, 1e14, n),
+    })
+    df["EPS"] = 2e4 * df["ROA"] + 500 * df["PB"] + rng.normal(0, 300, n)
+    return df
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "input_csv": str(tmp_path / "features.csv"),
+        "output_csv": str(tmp_path / "ranking.csv"),
+        "artifact_path": str(tmp_path / "artifacts" / "ranking_model.joblib"),
+    }
+
+
+def full_rescore(df, model):
+    df = df.copy()
+    df["Score_raw"] = model.predict(df[features])
+    return rank_in_industry(global_scaling(df))
+
+
+def test_incremental_equals_full_rescore(paths):
+    df = synthetic_features()
+    df.to_csv(paths["input_csv"], index=False)
+    run_pipeline(**paths, verbose=False)
+
+    # Đổi đặc trưng của vài mã, đổi ngành 1 mã, bỏ 1 mã
+    df.loc[[3, 40, 77], "ROA"] += 0.04
+    df.loc[10, "industry"] = "thép" if df.loc[10, "industry"] != "thép" else "bán lẻ"
+    df = df.drop(index=55).reset_index(drop=True)
+    df.to_csv(paths["input_csv"], index=False)
+
+    incremental = run_pipeline(**paths, verbose=False)
+    expected = full_rescore(testml.load_data(paths["input_csv"]), load_state(paths["artifact_path"])["model"])
+
+    incremental = incremental.sort_values("ticker").reset_index(drop=True)
+    expected = expected[testml.cols].sort_values("ticker").reset_index(drop=True)
+    pd.testing.assert_frame_equal(incremental, expected, check_exact=False, rtol=1e-12, atol=1e-12)
+
+
+def test_rewritten_identical_input_not_stale(paths):
+    df = synthetic_features()
+    df.to_csv(paths["input_csv"], index=False)
+    run_pipeline(**paths, verbose=False)
+    assert not ranking_is_stale(paths["input_csv"], paths["output_csv"])
+
+    # Ghi lại cùng nội dung sau khi bảng xếp hạng được tạo
+    earlier = os.path.getmtime(paths["output_csv"]) - 10
+    os.utime(paths["output_csv"], (earlier, earlier))
+    df.to_csv(paths["input_csv"], index=False)
+    assert ranking_is_stale(paths["input_csv"], paths["output_csv"])
+
+    run_pipeline(**paths, verbose=False)
+    assert not ranking_is_stale(paths["input_csv"], paths["output_csv"])
@@ -0,0 +1,109 @@
+"""
+universe_sigma: Σ pairwise-complete toàn thị trường ghi ra memmap và đọc lại,
+cắt theo rổ, chiếu về ma trận nửa xác định dương
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import universe_sigma
+from preprocessing import calculate_log_returns, estimate_capm_regression
+from price_store import load_price_store, write_price_store
+from universe_sigma import MARKET, build_universe_sigma, get_universe_sigma, load_universe_sigma, nearest_psd
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+MIN_OVERLAP = 60
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    T = 300
+    market = rng.normal(0.0004, 0.011, T)
+    returns = market[:, None] * rng.uniform(0.3, 1.8, len(SYMBOLS)) + rng.normal(0, 0.015, (T, len(SYMBOLS)))
+    close = 20 * np.exp(np.cumsum(np.column_stack([returns, market]), axis=0))
+    close[:250, 1] = np.nan          # BBB niêm yết muộn: < MIN_OVERLAP phiên chung
+    close[100:160, 2] = np.nan       # CCC tạm ngừng giao dịch
+    close[::13, 3] = np.nan          # DDD thiếu phiên rải rác
+
+    dates = pd.bdate_range("2022-01-03", periods=T).values.astype("datetime64[ns]").view(np.int64)
+    store_dir = str(tmp_path / "store")
+    write_price_store(dates, SYMBOLS + [MARKET], close, store_dir)
+    return load_price_store(store_dir)
+
+
+def reference(store):
+    returns = calculate_log_returns(store.frame(SYMBOLS + [MARKET]), dropna=False).iloc[1:]
+    cov = returns[SYMBOLS].cov() * 252
+    overlap = returns[SYMBOLS].notna().astype(int)
+    overlap = overlap.T @ overlap
+    cov = cov.where((overlap >= MIN_OVERLAP) | np.eye(len(SYMBOLS), dtype=bool), 0.0)
+    return cov, estimate_capm_regression(returns[SYMBOLS], returns[MARKET])["beta"]
+
+
+def test_memmap_round_trip_matches_pairwise_cov(store, tmp_path):
+    out_dir = str(tmp_path / "universe")
+    built = build_universe_sigma(SYMBOLS, out_dir=out_dir, min_overlap=MIN_OVERLAP, psd=False, store=store)
+    expected_cov, expected_beta = reference(store)
+
+    loaded = load_universe_sigma(out_dir)
+    assert isinstance(loaded.sigma, np.memmap) and loaded.sigma.dtype == np.float32
+    assert loaded.tickers == SYMBOLS
+    np.testing.assert_array_equal(np.asarray(loaded.sigma), np.asarray(built.sigma))
+    np.testing.assert_allclose(np.asarray(loaded.sigma), expected_cov.to_numpy(), rtol=1e-5, atol=1e-9)
+    np.testing.assert_allclose(loaded.betas, expected_beta.to_numpy(), rtol=1e-9)
+
+    # Cắt rổ theo thứ tự bất kỳ
+    basket = ["DDD", "AAA", "CCC"]
+    mu, cov, betas = loaded.slice(basket, 0.04)
+    np.testing.assert_allclose(cov.to_dense(), expected_cov.loc[basket, basket].to_numpy(), rtol=1e-5, atol=1e-9)
+    np.testing.assert_allclose(betas, expected_beta[basket].to_numpy(), rtol=1e-9)
+    np.testing.assert_allclose(mu, 0.04 + betas * (loaded.expected_rm - 0.04))
+    assert loaded.missing(["AAA", "ZZZ"]) == ["ZZZ"]
+
+
+def test_get_universe_sigma_reloads_new_build(store, tmp_path, monkeypatch):
+    out_dir = str(tmp_path / "universe")
+    monkeypatch.setattr(universe_sigma, "_UNIVERSES", {})
+    assert get_universe_sigma(out_dir) is None
+
+    build_universe_sigma(SYMBOLS, out_dir=out_dir, store=store)
+    first = get_universe_sigma(out_dir)
+    assert get_universe_sigma(out_dir) is first
+
+    build_universe_sigma(SYMBOLS[:3], out_dir=out_dir, store=store)
+    manifest = os.path.join(out_dir, universe_sigma.MANIFEST_FILE)
+    later = os.stat(manifest).st_mtime + 10
+    os.utime(manifest, (later, later))
+    assert get_universe_sigma(out_dir).tickers == SYMBOLS[:3]
+
+
+def test_nearest_psd():
+    rng = np.random.default_rng(1)
+    A = rng.normal(size=(6, 6))
+    psd = A @ A.T
+    assert nearest_psd(psd) is psd
+
+    # Đổi dấu 1 hiệp phương sai → không còn nửa xác định dương
+    bad = psd.copy()
+    bad[0, 1] = bad[1, 0] = -2 * np.sqrt(bad[0, 0] * bad[1, 1])
+    assert np.linalg.eigvalsh(bad).min() < 0
+
+    fixed = nearest_psd(bad)
+    np.testing.assert_allclose(fixed, fixed.T)
+    np.testing.assert_allclose(np.diag(fixed), np.diag(bad))
+    assert np.linalg.eigvalsh(fixed).min() >= -1e-10 * np.abs(bad).max()
+
+
+def test_build_applies_psd(store, tmp_path):
+    raw = build_universe_sigma(SYMBOLS, out_dir=str(tmp_path / "raw"), min_overlap=MIN_OVERLAP, psd=False, store=store)
+    fixed = build_universe_sigma(SYMBOLS, out_dir=str(tmp_path / "psd"), min_overlap=MIN_OVERLAP, psd=True, store=store)
+
+    sigma = np.asarray(fixed.sigma, dtype=np.float64)
+    assert fixed.meta["psd"] and not raw.meta["psd"]
+    np.testing.assert_allclose(np.diag(sigma), np.diag(np.asarray(raw.sigma)), rtol=1e-6)
+    assert np.linalg.eigvalsh(sigma).min() >= -1e-6 * np.abs(sigma).max()
+    expected = nearest_psd(np.asarray(raw.sigma, dtype=np.float64))
+    np.testing.assert_allclose(sigma, expected, rtol=1e-5, atol=1e-9)
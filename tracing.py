@@ -0,0 +1,253 @@
+# tracing.py
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import argparse
+import threading
+import contextvars
+
+import numpy as np
+import pandas as pd
+
+# Bật bằng TRACE=1 (hoặc enable()), ghi span ra file JSONL
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+FLUSH_EVERY = 64            # số span gom lại trước khi ghi file
+PERCENTILES = (50, 95, 99)
+
+_enabled = os.environ.get("TRACE", "") not in ("", "0")
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+# ===================== SPAN =====================
+
+class _NoopSpan:
+    """
+    Span rỗng dùng chung khi tắt tracing: không đo giờ, không cấp phát
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    1 công đoạn được đo bằng perf_counter (đồng hồ monotonic).
+    Span mở bên trong span khác thành span con, cùng trace id.
+    """
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "_t0", "_token")
+
+    def __init__(self, name, attrs, parent=None):
+        if parent is None:
+            parent = _current.get()
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(None if exc_type is None else exc_type.__name__)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, error=None):
+        record = {
+            "trace": self.trace_id,
+            "span": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "ms": (time.perf_counter() - self._t0) * 1e3,
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if error is not None:
+            record["error"] = error
+        _exporter.emit(record, flush=self.parent_id is None)
+
+
+def span(name, **attrs):
+    """
+    with span("retrieve", industry=...): ...
+    Tắt tracing → trả về span rỗng dùng chung (chỉ tốn 1 lần kiểm tra cờ)
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced_iter(name, iterable, **attrs):
+    """
+    Đo 1 generator (vd: stream token LLM) từ lúc tạo đến khi chạy hết / bị đóng:
+    ghi thêm thời gian tới phần tử đầu (first_ms) và số phần tử
+    """
+    if not _enabled:
+        return iterable
+    return _traced_iter(Span(name, attrs), iterable)
+
+
+def _traced_iter(s, iterable):
+    # Không đặt span này làm span hiện tại: generator có thể được đọc ở context khác
+    n = 0
+    error = None
+    try:
+        for item in iterable:
+            if n == 0:
+                s.attrs["first_ms"] = (time.perf_counter() - s._t0) * 1e3
+            n += 1
+            yield item
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        s.attrs["items"] = n
+        s.end(error)
+
+
+# ===================== EXPORT =====================
+
+class JsonlExporter:
+    """
+    Gom span trong bộ nhớ, ghi nối vào file JSONL khi xong 1 trace gốc
+    hoặc đủ FLUSH_EVERY span (và khi thoát process)
+    """
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def emit(self, record, flush=False):
+        with self._lock:
+            self._buffer.append(record)
+            if flush or len(self._buffer) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in self._buffer)
+        self._buffer.clear()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+_exporter = JsonlExporter()
+atexit.register(lambda: _exporter.flush())
+
+
+def enable(path=None):
+    """
+    Bật tracing (path: file JSONL, mặc định TRACE_FILE)
+    """
+    global _enabled, _exporter
+    if path is not None and path != _exporter.path:
+        _exporter.flush()
+        _exporter = JsonlExporter(path)
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _exporter.flush()
+
+
+def is_enabled():
+    return _enabled
+
+
+def flush():
+    _exporter.flush()
+
+
+# ===================== REPORT =====================
+
+def load_spans(path=TRACE_FILE):
+    """
+    Đọc file JSONL thành DataFrame (mỗi dòng 1 span), bỏ qua dòng hỏng
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return pd.DataFrame(records, columns=["trace", "span", "parent", "name", "start", "ms", "attrs", "error"])
+
+
+def summarize(spans):
+    """
+    Thống kê theo công đoạn: số lần, p50 / p95 / p99 / max (ms), tổng thời gian, số lỗi
+    """
+    rows = {}
+    for name, group in spans.groupby("name", sort=False):
+        ms = group["ms"].to_numpy(dtype=float)
+        row = {"count": len(ms)}
+        for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+            row[f"p{p}_ms"] = value
+        row["max_ms"] = ms.max()
+        row["total_s"] = ms.sum() / 1e3
+        row["errors"] = int(group["error"].notna().sum())
+        rows[name] = row
+    table = pd.DataFrame.from_dict(rows, orient="index")
+    if table.empty:
+        return table
+    return table.sort_values("total_s", ascending=False)
+
+
+def report(path=TRACE_FILE, prefix=None):
+    spans = load_spans(path)
+    if prefix:
+        spans = spans[spans["name"].str.startswith(prefix)]
+    return summarize(spans)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Báo cáo độ trễ theo công đoạn từ file trace JSONL")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--prefix", default=None, help="chỉ lấy span có tên bắt đầu bằng ... (vd: capm.)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        sys.exit(f"Không có file trace: {args.path} (chạy app với TRACE=1)")
+
+    table = report(args.path, args.prefix)
+    if table.empty:
+        print("Không có span nào")
+    else:
+        with pd.option_context("display.float_format", "{:,.2f}".format, "display.width", 120):
+            print(table)
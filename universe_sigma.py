@@ -0,0 +1,204 @@
+# universe_sigma.py
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from covariance import DenseCovariance
+from price_store import BASE_DIR, PRICE_DIR, STORE_DIR, get_price_store
+from return_stream import StreamingMoments, iter_log_returns, stream_columns
+
+UNIVERSE_CSV = os.path.join(BASE_DIR, "filegopchoml_final_clean.csv")
+UNIVERSE_DIR = os.path.join(STORE_DIR, "universe")
+MARKET = "VNINDEX"
+ANNUALIZE = 252
+MIN_OVERLAP = 60            # cặp mã có ít phiên chung hơn → hiệp phương sai = 0
+
+SIGMA_FILE = "sigma.npy"
+BETAS_FILE = "betas.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+# ===================== NIGHTLY JOB =====================
+
+def universe_tickers(path=UNIVERSE_CSV):
+    return pd.read_csv(path, usecols=["ticker"])["ticker"].dropna().astype(str).tolist()
+
+
+def nearest_psd(matrix):
+    """
+    Cắt trị riêng âm về 0 (ma trận pairwise-complete có thể không nửa xác định dương),
+    giữ nguyên đường chéo
+    """
+    vals, vecs = np.linalg.eigh(matrix)
+    if vals.min() >= 0:
+        return matrix
+    fixed = (vecs * np.clip(vals, 0, None)) @ vecs.T
+    d = np.sqrt(np.diag(matrix) / np.maximum(np.diag(fixed), 1e-300))
+    return fixed * d[:, None] * d[None, :]
+
+
+def build_universe_sigma(tickers=None, start=None, end=None, out_dir=UNIVERSE_DIR,
+                         min_overlap=MIN_OVERLAP, psd=True, store=None):
+    """
+    Tính Σ toàn thị trường 1 lần (chạy hằng đêm sau khi ingest giá):
+        - log return trên trục thời gian chung của price store, 1 lượt đọc từng chunk
+        - hiệp phương sai pairwise-complete (mỗi cặp dùng các phiên cả 2 mã có giá), · ANNUALIZE
+        - beta của từng mã theo VNINDEX + E(Rm), σ²(M) để dựng μ theo CAPM khi cắt
+    Ghi ra out_dir: sigma.npy (float32, N x N), betas.npy, manifest.json (thứ tự mã)
+    """
+    if store is None:
+        store = get_price_store(PRICE_DIR, STORE_DIR)
+    if tickers is None:
+        tickers = universe_tickers()
+
+    columns = stream_columns([t for t in dict.fromkeys(tickers) if t != MARKET] + [MARKET], store)
+    if MARKET not in columns:
+        raise KeyError(f"Không có giá của {MARKET}")
+    names = columns[:-1]
+
+    moments = StreamingMoments(columns, market=MARKET, pairwise=True)
+    moments.consume(iter_log_returns(columns, start, end, store=store))
+
+    cov = moments.cov(ANNUALIZE).to_numpy()[:-1, :-1].copy()
+    overlap = moments.pair_n[:-1, :-1]
+    off = (overlap < min_overlap) | np.isnan(cov)
+    np.fill_diagonal(off, False)
+    cov[off] = 0.0
+    cov[np.isnan(cov)] = 0.0
+    if psd and len(names):
+        cov = nearest_psd(cov)
+
+    regression = moments.capm_regression()
+    market_returns = moments.mean()[MARKET], moments.var()[MARKET]
+
+    write_universe_sigma(
+        out_dir,
+        names,
+        cov,
+        regression["beta"].to_numpy(),
+        {
+            "start": None if start is None else str(start),
+            "end": None if end is None else str(end),
+            "source_mtime": store.source_mtime,
+            "n_dates": int(moments.rows),
+            "annualize": ANNUALIZE,
+            "min_overlap": min_overlap,
+            "psd": bool(psd),
+            # Giống estimate_market_parameters: E(Rm) = mean * 365, σ²(M) = var
+            "expected_rm": float(market_returns[0] * 365),
+            "market_variance": float(market_returns[1]),
+            "n_obs": regression["n_obs"].astype(int).tolist(),
+            "built_at": time.time(),
+        }
+    )
+    return load_universe_sigma(out_dir)
+
+
+def write_universe_sigma(out_dir, tickers, sigma, betas, meta):
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Ghi ra file tạm rồi os.replace để app không đọc phải file dở dang
+    for name, arr in [(SIGMA_FILE, np.ascontiguousarray(sigma, dtype=np.float32)),
+                      (BETAS_FILE, np.asarray(betas, dtype=np.float64))]:
+        tmp = os.path.join(out_dir, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(out_dir, name))
+
+    manifest = dict(meta, tickers=list(tickers))
+    tmp = os.path.join(out_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_FILE))
+
+
+# ===================== SLICE =====================
+
+class UniverseSigma:
+    """
+    Σ toàn thị trường memory-mapped: rổ bất kỳ = 1 lần fancy-index (N_rổ x N_rổ),
+    không đọc lại giá / không tính lại hiệp phương sai
+    """
+
+    def __init__(self, sigma, betas, meta):
+        self.sigma = sigma
+        self.betas = betas
+        self.meta = meta
+        self.tickers = list(meta["tickers"])
+        self.columns = {t: i for i, t in enumerate(self.tickers)}
+        self.expected_rm = meta["expected_rm"]
+        self.market_variance = meta["market_variance"]
+        self.n_obs = np.asarray(meta.get("n_obs", [0] * len(self.tickers)))
+
+    def __contains__(self, ticker):
+        return ticker in self.columns
+
+    def missing(self, symbols):
+        return [s for s in symbols if s not in self.columns]
+
+    def positions(self, symbols):
+        return np.fromiter((self.columns[s] for s in symbols), dtype=np.intp, count=len(symbols))
+
+    def slice(self, symbols, rf):
+        """
+        (μ, Σ, β) của rổ trong 1 lần tra vị trí
+        """
+        symbols = list(symbols)
+        index = pd.Index(symbols)
+        p = self.positions(symbols)
+        betas = self.betas[p]
+        mu = rf + betas * (self.expected_rm - rf)
+        cov = DenseCovariance(self.sigma[np.ix_(p, p)].astype(np.float64), index)
+        return pd.Series(mu, index=index), cov, pd.Series(betas, index=index)
+
+
+def load_universe_sigma(out_dir=UNIVERSE_DIR):
+    with open(os.path.join(out_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    sigma = np.load(os.path.join(out_dir, SIGMA_FILE), mmap_mode="r")
+    betas = np.load(os.path.join(out_dir, BETAS_FILE))
+    return UniverseSigma(sigma, betas, meta)
+
+
+_UNIVERSES = {}
+
+
+def get_universe_sigma(out_dir=UNIVERSE_DIR):
+    """
+    Σ toàn thị trường dùng chung cho process, đọc lại khi job đêm ghi bản mới.
+    Chưa chạy job → None
+    """
+    try:
+        mtime = os.stat(os.path.join(out_dir, MANIFEST_FILE)).st_mtime
+    except OSError:
+        return None
+
+    cached = _UNIVERSES.get(out_dir)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, load_universe_sigma(out_dir))
+        _UNIVERSES[out_dir] = cached
+    return cached[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job đêm: Σ toàn thị trường (pairwise-complete) → memmap")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--min-overlap", type=int, default=MIN_OVERLAP)
+    parser.add_argument("--no-psd", action="store_true", help="không chiếu về ma trận nửa xác định dương")
+    parser.add_argument("--out", default=UNIVERSE_DIR)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    universe = build_universe_sigma(
+        start=args.start, end=args.end, out_dir=args.out,
+        min_overlap=args.min_overlap, psd=not args.no_psd
+    )
+    n = len(universe.tickers)
+    total = len(universe_tickers())
+    print(f"✅ Σ toàn thị trường: {n}/{total} mã có giá, {universe.meta['n_dates']} phiên "
+          f"→ {args.out} ({time.perf_counter() - t0:.1f} s)")